@@ -0,0 +1,43 @@
+import json
+from urllib.parse import parse_qs
+
+from channels.generic.websocket import AsyncWebsocketConsumer
+
+from .utils.live_broadcast import frame_group, ticker
+
+
+class VehicleConsumer(AsyncWebsocketConsumer):
+    """
+    ``/ws/vehicles/`` — live train positions as delta frames
+    (``vehicles.frame``), optionally limited with ``?route=BLUE,YELLOW``.
+    A joining socket first gets a keyframe with the full current state.
+    """
+
+    async def connect(self):
+        query = parse_qs(self.scope.get("query_string", b"").decode())
+        routes = [r.strip() for value in query.get("route", []) for r in value.split(",") if r.strip()]
+
+        self.vehicle_groups = ticker.subscribe(routes)
+        for group in self.vehicle_groups:
+            await self.channel_layer.group_add(group, self.channel_name)
+            await self.channel_layer.group_add(frame_group(group), self.channel_name)
+        await self.accept()
+
+        keyframe = ticker.keyframe(self.vehicle_groups)
+        if keyframe is not None:
+            await self.send(text_data=keyframe)
+
+    async def disconnect(self, code):
+        groups = getattr(self, "vehicle_groups", [])
+        ticker.unsubscribe(groups)
+        for group in groups:
+            await self.channel_layer.group_discard(group, self.channel_name)
+            await self.channel_layer.group_discard(frame_group(group), self.channel_name)
+
+    async def vehicles_frame(self, event):
+        # serialized once by the ticker for every socket in the group
+        await self.send(text_data=event["text"])
+
+    async def vehicle_update(self, event):
+        # single-vehicle messages published to the shared groups by other processes
+        await self.send(text_data=json.dumps(event))
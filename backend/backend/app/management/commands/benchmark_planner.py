@@ -0,0 +1,221 @@
+# python manage.py benchmark_planner --scales 1,10 --queries 500 --output bench.json
+
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    CaptureQueriesContext, override_settings, setup_test_environment, teardown_test_environment,
+)
+from rest_framework.test import APIRequestFactory
+
+from app.models import Stops
+from app.utils import synthetic_gtfs
+from app.utils.journey_cache import _local as journey_lru
+from app.utils.stats import percentile
+from app.utils.stop_index import get_stop_index
+from app.utils.timetable import Timetable, get_timetable, invalidate_timetable
+from app.views.trip_planner_views import PlanTripView
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Request body fields selecting each planner mode.
+MODES = {
+    "raptor": {},
+    "range": {"window_minutes": 60},
+    "multi": {"multi_criteria": True},
+    "patterns": {"transfer_patterns": True},
+}
+
+BENCH_DATE = "2026-10-19"
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the trip planner on synthetic GTFS feeds (1x = DMRC sized). "
+        "Runs in a throwaway test database; the configured database is not touched."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scales", default="1", help="Comma separated feed sizes, e.g. 1,10,100")
+        parser.add_argument("--queries", type=int, default=200, help="Plan queries per mode")
+        parser.add_argument("--modes", default="raptor", help=f"Comma separated: {','.join(MODES)}")
+        parser.add_argument("--headway", type=int, default=synthetic_gtfs.HEADWAY_SECONDS)
+        parser.add_argument("--stations-per-line", type=int, default=synthetic_gtfs.STATIONS_PER_LINE)
+        parser.add_argument("--start-hour", type=int, default=synthetic_gtfs.SERVICE_START_HOUR)
+        parser.add_argument("--end-hour", type=int, default=synthetic_gtfs.SERVICE_END_HOUR)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+
+    def handle(self, *args, **opts):
+        try:
+            scales = [int(s) for s in opts["scales"].split(",") if s.strip()]
+        except ValueError:
+            raise CommandError("--scales must be comma separated integers")
+        modes = [m.strip() for m in opts["modes"].split(",") if m.strip()]
+        unknown = set(modes) - set(MODES)
+        if unknown:
+            raise CommandError(f"Unknown modes: {', '.join(sorted(unknown))}")
+
+        report = {
+            "commit": git_commit(),
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "database": connection.vendor,
+            "params": {k: opts[k] for k in (
+                "queries", "headway", "stations_per_line", "start_hour", "end_hour", "seed"
+            )},
+            "scales": [],
+        }
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        # synthetic timetables must not replace the live snapshot, nor their
+        # versions and plans leak into the shared cache other workers read
+        try:
+            with override_settings(
+                TIMETABLE_SNAPSHOT_DIR="",
+                CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+            ):
+                try:
+                    for scale in scales:
+                        self.stderr.write(f"Scale {scale}x...")
+                        report["scales"].append(self.run_scale(scale, modes, opts))
+                finally:
+                    invalidate_timetable()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        out = json.dumps(report, indent=2)
+        if opts["output"]:
+            with open(opts["output"], "w", encoding="utf-8") as f:
+                f.write(out + "\n")
+            self.stderr.write(self.style.SUCCESS(f"✔ Report written to {opts['output']}"))
+        else:
+            self.stdout.write(out)
+
+    def run_scale(self, scale, modes, opts):
+        lines = synthetic_gtfs.synthetic_lines(scale, opts["stations_per_line"])
+
+        started = time.perf_counter()
+        n_stops = synthetic_gtfs.create_stops(lines)
+        with tempfile.TemporaryDirectory() as gtfs_dir:
+            n_stop_times = synthetic_gtfs.write_gtfs(
+                gtfs_dir, lines, opts["headway"], opts["start_hour"], opts["end_hour"]
+            )
+            with open(os.devnull, "w") as quiet:
+                call_command("import_gtfs", dir=gtfs_dir, stdout=quiet)
+        import_seconds = time.perf_counter() - started
+
+        # index build: timed untraced, then rebuilt under tracemalloc for its peak
+        started = time.perf_counter()
+        tt = get_timetable()
+        get_stop_index()
+        build_seconds = time.perf_counter() - started
+
+        tracemalloc.start()
+        Timetable.build()
+        build_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        # what a worker pays to pick up a published snapshot instead
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            tt.save(os.path.join(snapshot_dir, "bench"))
+            started = time.perf_counter()
+            Timetable.load(os.path.join(snapshot_dir, "bench"))
+            snapshot_load_seconds = time.perf_counter() - started
+
+        if "patterns" in modes:
+            with open(os.devnull, "w") as quiet:
+                call_command("compute_transfer_patterns", stdout=quiet)
+
+        result = {
+            "scale": scale,
+            "lines": len(lines),
+            "stops": n_stops,
+            "stop_times": n_stop_times,
+            "trips": len(tt.trip_ids),
+            "import_seconds": round(import_seconds, 2),
+            "timetable_build_seconds": round(build_seconds, 3),
+            "timetable_build_peak_mb": round(build_peak / 2 ** 20, 1),
+            "snapshot_load_seconds": round(snapshot_load_seconds, 4),
+            "timetable_mb": round(tt.nbytes() / 2 ** 20, 2),
+            "modes": {},
+        }
+
+        queries = self.query_set(opts)
+        for mode in modes:
+            result["modes"][mode] = self.run_queries(queries, MODES[mode])
+
+        if resource is not None:
+            # ru_maxrss is KiB on Linux
+            result["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        return result
+
+    def query_set(self, opts):
+        # fixed station pairs and departures for a given seed and feed
+        rng = random.Random(opts["seed"])
+        names = sorted(set(Stops.objects.values_list("stop_name", flat=True)))
+        start, end = opts["start_hour"] * 3600, opts["end_hour"] * 3600 - 1
+        queries = []
+        while len(queries) < opts["queries"]:
+            a, b = rng.choice(names), rng.choice(names)
+            if a == b:
+                continue
+            t = rng.randrange(start, end)
+            queries.append({
+                "from_location": a,
+                "to_location": b,
+                "when": "depart_at",
+                "depart_at": f"{BENCH_DATE}T{t // 3600:02}:{t % 3600 // 60:02}:{t % 60:02}",
+            })
+        return queries
+
+    def run_queries(self, queries, extra):
+        factory = APIRequestFactory()
+        view = PlanTripView.as_view()
+        journey_lru.clear()
+
+        latencies = []
+        found = 0
+        with CaptureQueriesContext(connection) as ctx:
+            for body in queries:
+                request = factory.post("/api/plan_trip/", {**body, **extra}, format="json")
+                started = time.perf_counter()
+                response = view(request)
+                latencies.append((time.perf_counter() - started) * 1000)
+                if response.status_code == 200 and response.data.get("trips"):
+                    found += 1
+
+        return {
+            "queries": len(latencies),
+            "with_journey": found,
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p95_ms": round(percentile(latencies, 95), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+            "mean_ms": round(sum(latencies) / len(latencies), 3),
+            "max_ms": round(max(latencies), 3),
+            "db_queries": len(ctx.captured_queries),
+        }
@@ -0,0 +1,90 @@
+# python manage.py compute_transfer_patterns --workers 8
+
+import multiprocessing
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from app.models import TransferPattern
+from app.utils.timetable import get_timetable
+from app.utils.transfer_patterns import invalidate_transfer_patterns, station_transfer_patterns
+
+# Timetable handed to forked workers (inherited copy-on-write).
+_timetable = None
+_max_trips = 0
+
+
+def _compute(station):
+    tt = _timetable
+    found = station_transfer_patterns(tt, station, _max_trips)
+
+    def station_id(st):
+        return tt.stop_ids[tt.station_stops[tt.station_start[st]]]
+
+    patterns = {
+        str(station_id(dest)): sorted(
+            [[tt.stop_ids[b], tt.stop_ids[a]] for b, a in rides] for rides in rides_set
+        )
+        for dest, rides_set in found.items()
+    }
+    return station_id(station), patterns
+
+
+class Command(BaseCommand):
+    help = "Precompute transfer patterns between every pair of stations from the GTFS timetable."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Worker processes (default: one per CPU)"
+        )
+        parser.add_argument(
+            "--max-transfers",
+            type=int,
+            default=3,
+            help="Most transfers in a stored pattern"
+        )
+
+    def handle(self, *args, **opts):
+        global _timetable, _max_trips
+
+        _timetable = get_timetable()
+        _max_trips = opts["max_transfers"] + 1
+        # metro stations only; bus stops come after every metro Stops row
+        metro_stations = _timetable.stop_station[:_timetable.n_metro_stops]
+        stations = range(int(metro_stations.max()) + 1 if len(metro_stations) else 0)
+
+        self.stdout.write(f"Computing transfer patterns for {len(stations)} stations...")
+        started = time.perf_counter()
+
+        workers = min(max(opts["workers"], 1), len(stations))
+        if workers >= 2 and "fork" in multiprocessing.get_all_start_methods():
+            with multiprocessing.get_context("fork").Pool(workers) as pool:
+                rows = self.collect(pool.imap_unordered(_compute, stations, chunksize=4))
+        else:
+            rows = self.collect(map(_compute, stations))
+
+        with transaction.atomic():
+            TransferPattern.objects.all().delete()
+            TransferPattern.objects.bulk_create(rows, batch_size=500)
+
+        invalidate_transfer_patterns()
+
+        total = sum(len(p) for r in rows for p in r.patterns.values())
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✔ Stored {total} transfer patterns in {time.perf_counter() - started:.1f}s"
+            )
+        )
+
+    def collect(self, results):
+        rows = []
+        for n, (origin_id, patterns) in enumerate(results, 1):
+            rows.append(TransferPattern(origin_id=origin_id, patterns=patterns))
+            if n % 50 == 0:
+                self.stdout.write(f"  {n} stations done")
+        return rows
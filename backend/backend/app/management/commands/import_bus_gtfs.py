@@ -0,0 +1,163 @@
+# python manage.py import_bus_gtfs --dir "C:\Users\Transportation Guest\Downloads\delhi_buses_static_gtfs_v1"
+# (run import_bus_stops first: stop_times are matched to BusStop ids)
+
+import csv
+import os
+
+from django.core.management.base import BaseCommand
+from app.models import (
+    BUS_ID_PREFIX, BusStop, BusStopTime, Calendar, CalendarDate, Route, Shape, Trip,
+)
+from app.utils.gtfs_calendar import import_calendar
+from app.utils.shapes import project_stop_times
+from app.utils.timetable import invalidate_timetable, parse_gtfs_time
+
+CHUNK = 2000
+
+
+def bus_id(value):
+    return f"{BUS_ID_PREFIX}{value}"
+
+
+class Command(BaseCommand):
+    help = "Import a bus GTFS feed alongside the metro one (ids are prefixed with BUS_)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dir",
+            required=True,
+            help="Path to bus GTFS folder"
+        )
+
+    def handle(self, *args, **opts):
+        gtfs_dir = opts["dir"]
+
+        if not os.path.isdir(gtfs_dir):
+            self.stderr.write(
+                self.style.ERROR(f"Directory not found: {gtfs_dir}")
+            )
+            return
+
+        # 1. DELETE OLD BUS DATA (trips and stop times cascade from routes)
+        self.stdout.write(self.style.WARNING("Deleting old bus GTFS data..."))
+        Route.objects.filter(route_type=Route.BUS).delete()
+        Shape.objects.filter(shape_id__startswith=BUS_ID_PREFIX).delete()
+        Calendar.objects.filter(service_id__startswith=BUS_ID_PREFIX).delete()
+        CalendarDate.objects.filter(service_id__startswith=BUS_ID_PREFIX).delete()
+
+        # 2. IMPORT ROUTES
+        self.stdout.write("Importing bus routes...")
+        routes = []
+        with open(os.path.join(gtfs_dir, "routes.txt"), encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                routes.append(
+                    Route(
+                        route_id=bus_id(row["route_id"]),
+                        route_short_name=row.get("route_short_name", ""),
+                        route_long_name=row.get("route_long_name", ""),
+                        route_type=Route.BUS,
+                    )
+                )
+        Route.objects.bulk_create(routes, batch_size=CHUNK)
+
+        # 3. IMPORT SHAPES (optional for bus feeds)
+        shapes_file = os.path.join(gtfs_dir, "shapes.txt")
+        if os.path.exists(shapes_file):
+            self.stdout.write("Importing bus shapes...")
+            batch = []
+            with open(shapes_file, encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    batch.append(
+                        Shape(
+                            shape_id=bus_id(row["shape_id"]),
+                            shape_pt_lat=float(row["shape_pt_lat"]),
+                            shape_pt_lon=float(row["shape_pt_lon"]),
+                            shape_pt_sequence=int(row["shape_pt_sequence"]),
+                        )
+                    )
+                    if len(batch) >= CHUNK:
+                        Shape.objects.bulk_create(batch)
+                        batch = []
+            if batch:
+                Shape.objects.bulk_create(batch)
+
+        # 4. IMPORT TRIPS
+        self.stdout.write("Importing bus trips...")
+        route_ids = {r.route_id for r in routes}
+        shape_map = {}
+        for s in Shape.objects.filter(shape_id__startswith=BUS_ID_PREFIX).order_by("shape_pt_sequence"):
+            shape_map.setdefault(s.shape_id, s)
+
+        trips = []
+        with open(os.path.join(gtfs_dir, "trips.txt"), encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                route_id = bus_id(row["route_id"])
+                if route_id not in route_ids:
+                    continue
+                shape_id = row.get("shape_id")
+                trips.append(
+                    Trip(
+                        trip_id=bus_id(row["trip_id"]),
+                        route_id=route_id,
+                        service_id=bus_id(row.get("service_id", "")),
+                        shape_id=shape_map.get(bus_id(shape_id)) if shape_id else None,
+                    )
+                )
+        Trip.objects.bulk_create(trips, batch_size=CHUNK)
+
+        # 5. IMPORT STOP TIMES
+        self.stdout.write("Importing bus stop_times...")
+        trip_ids = {t.trip_id for t in trips}
+        bus_stop_ids = set(BusStop.objects.values_list("bus_stop_id", flat=True))
+
+        batch = []
+        skipped = 0
+        with open(os.path.join(gtfs_dir, "stop_times.txt"), encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                trip_id = bus_id(row["trip_id"])
+                if trip_id not in trip_ids or row["stop_id"] not in bus_stop_ids:
+                    skipped += 1
+                    continue
+
+                arrival = row.get("arrival_time", "")
+                departure = row.get("departure_time", "")
+                arr_secs = parse_gtfs_time(arrival)
+                dep_secs = parse_gtfs_time(departure)
+
+                batch.append(
+                    BusStopTime(
+                        trip_id=trip_id,
+                        bus_stop_id=row["stop_id"],
+                        stop_sequence=int(row["stop_sequence"]),
+                        arrival_time=arrival,
+                        departure_time=departure,
+                        arrival_seconds=arr_secs if arr_secs >= 0 else None,
+                        departure_seconds=dep_secs if dep_secs >= 0 else None,
+                    )
+                )
+                if len(batch) >= CHUNK:
+                    BusStopTime.objects.bulk_create(batch)
+                    batch = []
+        if batch:
+            BusStopTime.objects.bulk_create(batch)
+
+        self.stdout.write(
+            self.style.WARNING(
+                f"Skipped {skipped} stop_time rows (missing bus stop/trip)"
+            )
+        )
+
+        # 6. PROJECT STOPS ONTO SHAPES (legs and live buses follow the road)
+        self.stdout.write("Projecting bus stops onto shapes...")
+        projected = project_stop_times(bus=True)
+        self.stdout.write(f"Projected {projected} bus stop_time rows")
+
+        # 7. IMPORT SERVICE CALENDAR
+        import_calendar(gtfs_dir, BUS_ID_PREFIX, log=self.stdout.write)
+
+        # 8. PUBLISH NEW TIMETABLE VERSION
+        invalidate_timetable()
+
+        self.stdout.write(
+            self.style.SUCCESS("✔ Bus GTFS Import Completed Successfully!")
+        )
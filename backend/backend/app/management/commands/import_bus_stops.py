@@ -3,6 +3,8 @@
 import csv
 from django.core.management.base import BaseCommand
 from app.models import BusStop
+from app.utils.stop_index import invalidate_stop_index
+from app.utils.timetable import invalidate_timetable
 
 class Command(BaseCommand):
     help = "Import BUS stops from stops_bus_bus.txt"
@@ -31,4 +33,7 @@ class Command(BaseCommand):
                     }
                 )
 
+        invalidate_stop_index()
+        invalidate_timetable()
+
         self.stdout.write(self.style.SUCCESS("Bus stops imported successfully!"))
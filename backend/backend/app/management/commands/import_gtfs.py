@@ -4,7 +4,12 @@ import csv
 import os
 
 from django.core.management.base import BaseCommand
-from app.models import Route, Trip, Stops, StopTime, Shape
+from app.models import (
+    BUS_ID_PREFIX, Route, Trip, Stops, StopTime, Shape, Calendar, CalendarDate, TransferPattern,
+)
+from app.utils.gtfs_calendar import import_calendar
+from app.utils.shapes import project_stop_times
+from app.utils.timetable import invalidate_timetable, parse_gtfs_time
 
 CHUNK = 2000
 class Command(BaseCommand):
@@ -25,12 +30,15 @@ class Command(BaseCommand):
             )
             return
 
-        # 1. DELETE OLD GTFS DATA
+        # 1. DELETE OLD GTFS DATA (the bus feed from import_bus_gtfs stays)
         self.stdout.write(self.style.WARNING("Deleting old GTFS data..."))
         StopTime.objects.all().delete()
-        Trip.objects.all().delete()
-        Shape.objects.all().delete()
-        Route.objects.all().delete()
+        Trip.objects.filter(route__route_type=Route.METRO).delete()
+        Shape.objects.exclude(shape_id__startswith=BUS_ID_PREFIX).delete()
+        Route.objects.filter(route_type=Route.METRO).delete()
+        Calendar.objects.exclude(service_id__startswith=BUS_ID_PREFIX).delete()
+        CalendarDate.objects.exclude(service_id__startswith=BUS_ID_PREFIX).delete()
+        TransferPattern.objects.all().delete()  # stale; rerun compute_transfer_patterns
 
         # 2. IMPORT ROUTES
         self.stdout.write("Importing routes...")
@@ -80,7 +88,7 @@ class Command(BaseCommand):
 
         route_map = {r.route_id: r for r in Route.objects.all()}
         shape_map = {}
-        for s in Shape.objects.all():
+        for s in Shape.objects.exclude(shape_id__startswith=BUS_ID_PREFIX):
             shape_map.setdefault(s.shape_id, s)
 
         trips = []
@@ -128,13 +136,20 @@ class Command(BaseCommand):
                     skipped += 1
                     continue
 
+                arrival = row.get("arrival_time", "")
+                departure = row.get("departure_time", "")
+                arr_secs = parse_gtfs_time(arrival)
+                dep_secs = parse_gtfs_time(departure)
+
                 batch.append(
                     StopTime(
                         trip=trip_obj,
                         stops=stop_obj,
                         stop_sequence=int(row["stop_sequence"]),
-                        arrival_time=row.get("arrival_time", ""),
-                        departure_time=row.get("departure_time", ""),
+                        arrival_time=arrival,
+                        departure_time=departure,
+                        arrival_seconds=arr_secs if arr_secs >= 0 else None,
+                        departure_seconds=dep_secs if dep_secs >= 0 else None,
                     )
                 )
 
@@ -151,6 +166,17 @@ class Command(BaseCommand):
             )
         )
 
+        # 6. PROJECT STOPS ONTO SHAPES (planner slices leg geometry from these)
+        self.stdout.write("Projecting stops onto shapes...")
+        projected = project_stop_times()
+        self.stdout.write(f"Projected {projected} stop_time rows")
+
+        # 7. IMPORT SERVICE CALENDAR (both files are optional in GTFS)
+        import_calendar(gtfs_dir, log=self.stdout.write)
+
+        # 8. PUBLISH NEW TIMETABLE VERSION (writes the mmap snapshot when enabled)
+        invalidate_timetable()
+
         self.stdout.write(
             self.style.SUCCESS("✔ GTFS Import Completed Successfully!")
         )
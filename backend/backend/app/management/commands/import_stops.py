@@ -3,6 +3,8 @@ from django.db import transaction
 import pandas as pd
 
 from app.models import Stops
+from app.utils.stop_index import invalidate_stop_index
+from app.utils.timetable import invalidate_timetable
 
 
 class Command(BaseCommand):
@@ -80,6 +82,10 @@ class Command(BaseCommand):
                     )
                     created_count += 1
 
+            # Stops ids changed: rebuild the in-memory name index and timetable
+            invalidate_stop_index()
+            invalidate_timetable()
+
             self.stdout.write(
                 self.style.SUCCESS(
                     f"✅ Import completed successfully | Inserted: {created_count}"
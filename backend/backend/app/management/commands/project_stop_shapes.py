@@ -0,0 +1,16 @@
+# python manage.py project_stop_shapes
+
+from django.core.management.base import BaseCommand
+
+from app.utils.shapes import project_stop_times
+from app.utils.timetable import invalidate_timetable
+
+
+class Command(BaseCommand):
+    help = "Recompute the shape segment of every stop time (run after editing stops or shapes)."
+
+    def handle(self, *args, **opts):
+        self.stdout.write("Projecting stops onto shapes...")
+        projected = project_stop_times() + project_stop_times(bus=True)
+        invalidate_timetable()
+        self.stdout.write(self.style.SUCCESS(f"✔ Projected {projected} stop_time rows"))
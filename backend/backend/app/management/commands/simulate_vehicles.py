@@ -1,76 +1,258 @@
-# app/management/commands/simulate_vehicles.py
+# python manage.py simulate_vehicles --vehicles 5000 --subscribers 20 --duration 30
+# python manage.py simulate_vehicles --mode frame --vehicles 20000 --route-subscribers 50
 
 import asyncio
+import json
 import random
-from django.core.management.base import BaseCommand
-from channels.layers import get_channel_layer
-from asgiref.sync import sync_to_async
-from app.models import Shape, Stop
+
+import numpy as np
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from django.core.management.base import BaseCommand, CommandError
 from django.utils import timezone
 
+from app.utils.live_broadcast import VEHICLES_ALL_GROUP, FrameEncoder, route_group
+from app.utils.live_positions import along_shapes
+from app.utils.stats import percentile
+from app.utils.timetable import get_timetable
+
+# Fan-out latencies kept for the percentiles (reservoir sample).
+LATENCY_SAMPLE = 100000
+
+
+class Fleet:
+    """
+    Simulated vehicles running up and down real shapes of the timetable:
+    each has a shape, an offset in metres along it, a speed and a direction,
+    all advanced and interpolated as NumPy arrays.
+    """
+
+    def __init__(self, tt, n, min_kmph, max_kmph, rng):
+        # route of each shape, from any trip using it
+        shape_route = np.full(len(tt.shape_ids), -1, dtype=np.int64)
+        used = tt.trip_shape >= 0
+        shape_route[tt.trip_shape[used]] = tt.trip_route[used]
+        shapes = np.flatnonzero((shape_route >= 0) & (np.diff(tt.shape_start) >= 2))
+        if not len(shapes):
+            raise CommandError("No trip shapes in the timetable; import a GTFS feed first")
+
+        self.tt = tt
+        self.shape = shapes[rng.integers(len(shapes), size=n)]
+        self.base = tt.shape_dist[tt.shape_start[self.shape]]
+        self.length = tt.shape_dist[tt.shape_start[self.shape + 1] - 1] - self.base
+        self.offset = rng.random(n) * self.length
+        self.speed = rng.uniform(min_kmph, max_kmph, n) / 3.6
+        self.direction = rng.choice([-1.0, 1.0], n)
+
+        self.ids = [f"sim_{i}" for i in range(n)]
+        self.routes = [tt.route_ids[r] for r in shape_route[self.shape].tolist()]
+        self.route_set = sorted(set(self.routes))
+
+    def advance(self, seconds):
+        self.offset += self.direction * self.speed * seconds
+        # turn back at either end of the line
+        over = self.offset > self.length
+        self.offset[over] = 2 * self.length[over] - self.offset[over]
+        under = self.offset < 0
+        self.offset[under] = -self.offset[under]
+        self.direction[over] = -1.0
+        self.direction[under] = 1.0
+        np.clip(self.offset, 0, self.length, out=self.offset)
+
+    def positions(self):
+        lat, lon, bearing = along_shapes(self.tt, self.shape, self.base + self.offset)
+        bearing = np.where(self.direction < 0, bearing + 180.0, bearing) % 360
+        return lat, lon, bearing
+
 
 class Command(BaseCommand):
-    help = "Simulate vehicle telemetry and broadcast to channels"
-
-    def handle(self, *args, **options):
-        asyncio.run(self.run_sim())
-
-    async def load_initial_data(self):
-        shapes = await sync_to_async(
-            lambda: list(Shape.objects.values_list("shape_id", flat=True)[:10])
-        )()
-
-        stops = await sync_to_async(
-            lambda: list(Stop.objects.values_list("stop_id", "stop_lat", "stop_lon")[:100])
-        )()
-
-        return shapes, stops
-
-    async def run_sim(self):
-        channel_layer = get_channel_layer()
-
-        shapes, stops = await self.load_initial_data()
-
-        vehicles = []
-        for i in range(8):
-            sid, lat, lon = random.choice(stops)
-            vehicles.append({
-                "vehicle_id": f"sim_{i}",
-                "route": random.choice(["RED", "GREEN", "BLUE", "MAGENTA", "615"]),
-                "lat": float(lat),
-                "lon": float(lon),
-                "bearing": random.randint(0, 359),
-                "speed_kmph": random.uniform(15, 40),
-            })
-
-        while True:
-            now = timezone.now().isoformat()
-
-            for v in vehicles:
-                v["lat"] += (random.random() - 0.5) * 0.0005
-                v["lon"] += (random.random() - 0.5) * 0.0005
-                v["bearing"] = (v["bearing"] + random.randint(-15, 15)) % 360
-
-                payload = {
-                    "vehicle_id": v["vehicle_id"],
-                    "route": v["route"],
-                    "lat": v["lat"],
-                    "lon": v["lon"],
-                    "bearing": v["bearing"],
-                    "speed_kmph": round(v["speed_kmph"], 1),
+    help = (
+        "Load generator for the live pipeline: drives N vehicles along real shapes, "
+        "publishes them through a channel layer (in-memory by default) to simulated subscribers "
+        "and reports publish throughput, fan-out latency and dropped messages."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--vehicles", type=int, default=1000)
+        parser.add_argument("--subscribers", type=int, default=10, help=f"Sockets on {VEHICLES_ALL_GROUP}")
+        parser.add_argument("--route-subscribers", type=int, default=0, help="Sockets on one random route group each")
+        parser.add_argument("--mode", choices=("vehicle", "frame"), default="vehicle",
+                            help="vehicle: one vehicle.update per vehicle (as before); frame: one delta frame per tick")
+        parser.add_argument("--interval", type=float, default=1.0, help="Seconds between ticks")
+        parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run")
+        parser.add_argument("--capacity", type=int, default=100, help="Channel layer queue size per socket")
+        parser.add_argument("--settings-layer", action="store_true",
+                            help="Publish through CHANNEL_LAYERS (e.g. Redis, reaching connected clients too) "
+                                 "instead of a private in-memory layer; --capacity is then ignored")
+        parser.add_argument("--consumer-ms", type=float, default=0.0,
+                            help="Time each socket spends per message, to simulate slow clients")
+        parser.add_argument("--min-kmph", type=float, default=20.0)
+        parser.add_argument("--max-kmph", type=float, default=60.0)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+
+    def handle(self, *args, **opts):
+        if opts["vehicles"] < 1 or opts["interval"] <= 0:
+            raise CommandError("--vehicles must be positive and --interval > 0")
+
+        rng = np.random.default_rng(opts["seed"])
+        fleet = Fleet(get_timetable(), opts["vehicles"], opts["min_kmph"], opts["max_kmph"], rng)
+        report = asyncio.run(self.run(fleet, opts))
+
+        out = json.dumps(report, indent=2)
+        if opts["output"]:
+            with open(opts["output"], "w", encoding="utf-8") as f:
+                f.write(out + "\n")
+            self.stderr.write(self.style.SUCCESS(f"✔ Report written to {opts['output']}"))
+        else:
+            self.stdout.write(out)
+
+    async def run(self, fleet, opts):
+        if opts["settings_layer"]:
+            layer = get_channel_layer()
+        else:
+            layer = InMemoryChannelLayer(capacity=opts["capacity"])
+        loop = asyncio.get_running_loop()
+        sample_rng = random.Random(opts["seed"])
+
+        latencies = []
+        stats = {"received": 0}
+        consumer_seconds = opts["consumer_ms"] / 1000
+
+        async def receive(channel):
+            while True:
+                message = await layer.receive(channel)
+                latency = loop.time() - message["sent_at"]
+                stats["received"] += 1
+                if len(latencies) < LATENCY_SAMPLE:
+                    latencies.append(latency)
+                else:
+                    k = sample_rng.randrange(stats["received"])
+                    if k < LATENCY_SAMPLE:
+                        latencies[k] = latency
+                if consumer_seconds:
+                    await asyncio.sleep(consumer_seconds)
+
+        group_sizes = {}
+        receivers = []
+        groups = [VEHICLES_ALL_GROUP] * opts["subscribers"] + [
+            route_group(sample_rng.choice(fleet.route_set)) for _ in range(opts["route_subscribers"])
+        ]
+        for group in groups:
+            channel = await layer.new_channel()
+            await layer.group_add(group, channel)
+            group_sizes[group] = group_sizes.get(group, 0) + 1
+            receivers.append(loop.create_task(receive(channel)))
+
+        publish = self.publish_vehicles if opts["mode"] == "vehicle" else self.publish_frames
+        encoder = FrameEncoder()
+        ticks = max(int(opts["duration"] / opts["interval"]), 1)
+        published = expected = overruns = 0
+        tick_seconds = []
+
+        for _ in range(ticks):
+            started = loop.time()
+            fleet.advance(opts["interval"])
+            sent, delivered = await publish(layer, fleet, group_sizes, encoder, loop)
+            published += sent
+            expected += delivered
+            elapsed = loop.time() - started
+            tick_seconds.append(elapsed)
+            if elapsed > opts["interval"]:
+                overruns += 1
+            await asyncio.sleep(max(opts["interval"] - elapsed, 0))
+
+        # let the subscribers drain what is still queued
+        for _ in range(100):
+            if stats["received"] >= expected:
+                break
+            await asyncio.sleep(0.05)
+        for task in receivers:
+            task.cancel()
+        await asyncio.gather(*receivers, return_exceptions=True)
+
+        publish_total = sum(tick_seconds)
+        return {
+            "created": timezone.now().isoformat(timespec="seconds"),
+            "params": {k: opts[k] for k in (
+                "vehicles", "subscribers", "route_subscribers", "mode", "interval", "duration",
+                "capacity", "settings_layer", "consumer_ms", "min_kmph", "max_kmph", "seed",
+            )},
+            "shapes": len(set(fleet.shape.tolist())),
+            "routes": len(fleet.route_set),
+            "ticks": ticks,
+            "published": published,
+            "publish_per_second": round(published / publish_total, 1) if publish_total else None,
+            "tick_p50_ms": round(percentile(tick_seconds, 50) * 1000, 3),
+            "tick_p95_ms": round(percentile(tick_seconds, 95) * 1000, 3),
+            "tick_max_ms": round(max(tick_seconds) * 1000, 3),
+            "tick_overruns": overruns,
+            "deliveries_expected": expected,
+            "delivered": stats["received"],
+            "dropped": max(expected - stats["received"], 0),
+            "latency_p50_ms": self.ms(percentile(latencies, 50)),
+            "latency_p95_ms": self.ms(percentile(latencies, 95)),
+            "latency_p99_ms": self.ms(percentile(latencies, 99)),
+            "latency_max_ms": self.ms(max(latencies) if latencies else None),
+        }
+
+    @staticmethod
+    def ms(seconds):
+        return None if seconds is None else round(seconds * 1000, 3)
+
+    async def publish_vehicles(self, layer, fleet, group_sizes, encoder, loop):
+        # the original per-vehicle messages, to the global and the route group
+        lat, lon, bearing = fleet.positions()
+        now = timezone.now().isoformat()
+        sent = delivered = 0
+        for vehicle_id, route, vlat, vlon, vbearing, speed in zip(
+            fleet.ids, fleet.routes, lat.tolist(), lon.tolist(), bearing.tolist(), fleet.speed.tolist(),
+        ):
+            message = {
+                "type": "vehicle.update",
+                "payload": {
+                    "vehicle_id": vehicle_id,
+                    "route": route,
+                    "lat": vlat,
+                    "lon": vlon,
+                    "bearing": round(vbearing),
+                    "speed_kmph": round(speed * 3.6, 1),
                     "timestamp": now,
-                }
+                },
+            }
+            for group in (VEHICLES_ALL_GROUP, route_group(route)):
+                message["sent_at"] = loop.time()
+                await layer.group_send(group, message)
+                sent += 1
+                delivered += group_sizes.get(group, 0)
+        return sent, delivered
 
-                # Broadcast to global group
-                await channel_layer.group_send(
-                    "vehicles_all",
-                    {"type": "vehicle.update", "payload": payload},
-                )
+    async def publish_frames(self, layer, fleet, group_sizes, encoder, loop):
+        # what LiveTicker sends: one pre-serialized delta frame per group
+        lat, lon, bearing = fleet.positions()
+        vehicles = {
+            vehicle_id: {
+                "vehicle_id": vehicle_id,
+                "route": route,
+                "lat": round(vlat, 5),
+                "lon": round(vlon, 5),
+                "bearing": int(round(vbearing)) % 360,
+            }
+            for vehicle_id, route, vlat, vlon, vbearing in zip(
+                fleet.ids, fleet.routes, lat.tolist(), lon.tolist(), bearing.tolist(),
+            )
+        }
+        updated, removed = encoder.update(vehicles)
 
-                # Broadcast to route-specific group
-                await channel_layer.group_send(
-                    f"vehicles_route_{v['route']}",
-                    {"type": "vehicle.update", "payload": payload},
-                )
+        by_group = {VEHICLES_ALL_GROUP: updated}
+        for v in updated:
+            group = route_group(v["route"])
+            if group in group_sizes:
+                by_group.setdefault(group, []).append(v)
 
-            await asyncio.sleep(1.5)
+        sent = delivered = 0
+        for group, changed in by_group.items():
+            text = encoder.frame(changed, removed if group == VEHICLES_ALL_GROUP else [])
+            await layer.group_send(group, {"type": "vehicles.frame", "text": text, "sent_at": loop.time()})
+            sent += 1
+            delivered += group_sizes.get(group, 0)
+        return sent, delivered
@@ -0,0 +1,24 @@
+# python manage.py write_timetable_snapshot
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from app.utils.timetable import get_timetable, invalidate_timetable
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the timetable from the database and publish it as the live "
+        "snapshot in TIMETABLE_SNAPSHOT_DIR (import_gtfs does this itself)."
+    )
+
+    def handle(self, *args, **opts):
+        if not settings.TIMETABLE_SNAPSHOT_DIR:
+            raise CommandError("TIMETABLE_SNAPSHOT_DIR is not set")
+
+        invalidate_timetable()
+        tt = get_timetable()
+        self.stdout.write(self.style.SUCCESS(
+            f"✔ Snapshot {tt.version}: {len(tt.trip_ids)} trips, "
+            f"{tt.nbytes() / 2 ** 20:.1f} MB in {settings.TIMETABLE_SNAPSHOT_DIR}"
+        ))
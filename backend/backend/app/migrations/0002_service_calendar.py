@@ -0,0 +1,40 @@
+# Generated by Django 6.0.2 on 2026-10-18 08:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Calendar',
+            fields=[
+                ('service_id', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('monday', models.BooleanField(default=False)),
+                ('tuesday', models.BooleanField(default=False)),
+                ('wednesday', models.BooleanField(default=False)),
+                ('thursday', models.BooleanField(default=False)),
+                ('friday', models.BooleanField(default=False)),
+                ('saturday', models.BooleanField(default=False)),
+                ('sunday', models.BooleanField(default=False)),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CalendarDate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('service_id', models.CharField(db_index=True, max_length=50)),
+                ('date', models.DateField(db_index=True)),
+                ('exception_type', models.IntegerField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['service_id', 'date'], name='app_calenda_service_613eb4_idx')],
+            },
+        ),
+    ]
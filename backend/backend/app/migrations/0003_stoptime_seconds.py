@@ -0,0 +1,57 @@
+# Generated by Django 6.0.2 on 2026-10-18 08:36
+
+from django.db import migrations, models
+
+
+def _parse(value):
+    # GTFS times may run past 24:00 for trips after midnight
+    try:
+        h, m, s = (int(p) for p in str(value).strip().split(":"))
+    except (TypeError, ValueError):
+        return None
+    return h * 3600 + m * 60 + s
+
+
+def backfill_seconds(apps, schema_editor):
+    StopTime = apps.get_model('app', 'StopTime')
+
+    batch = []
+    rows = StopTime.objects.only('id', 'arrival_time', 'departure_time')
+    for st in rows.iterator(chunk_size=5000):
+        st.arrival_seconds = _parse(st.arrival_time)
+        st.departure_seconds = _parse(st.departure_time)
+        batch.append(st)
+        if len(batch) >= 5000:
+            StopTime.objects.bulk_update(batch, ['arrival_seconds', 'departure_seconds'])
+            batch = []
+    if batch:
+        StopTime.objects.bulk_update(batch, ['arrival_seconds', 'departure_seconds'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0002_service_calendar'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='stoptime',
+            name='app_stoptim_departu_d021cb_idx',
+        ),
+        migrations.AddField(
+            model_name='stoptime',
+            name='arrival_seconds',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='stoptime',
+            name='departure_seconds',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.RunPython(backfill_seconds, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='stoptime',
+            index=models.Index(fields=['departure_seconds'], name='app_stoptim_departu_57d4cd_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_stoptime_seconds'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stoptime',
+            name='shape_pt_index',
+            field=models.IntegerField(null=True),
+        ),
+    ]
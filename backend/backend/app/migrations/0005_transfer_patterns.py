@@ -0,0 +1,22 @@
+# Generated by Django 6.0.2 on 2026-10-18 10:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_stoptime_shape_pt_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransferPattern',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('patterns', models.JSONField(default=dict)),
+                ('origin', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='app.stops')),
+            ],
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 6.0.2 on 2026-10-18 11:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_transfer_patterns'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='route',
+            name='route_type',
+            field=models.IntegerField(db_index=True, default=1),
+        ),
+        migrations.AlterField(
+            model_name='trip',
+            name='shape_id',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='app.shape'),
+        ),
+        migrations.CreateModel(
+            name='BusStopTime',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stop_sequence', models.IntegerField()),
+                ('arrival_time', models.CharField(max_length=20)),
+                ('departure_time', models.CharField(max_length=20)),
+                ('arrival_seconds', models.IntegerField(null=True)),
+                ('departure_seconds', models.IntegerField(null=True)),
+                ('bus_stop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.busstop')),
+                ('trip', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.trip')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['trip', 'stop_sequence'], name='app_busstop_trip_id_4aeaa7_idx'), models.Index(fields=['departure_seconds'], name='app_busstop_departu_ab8e7a_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-18 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_bus_timetable'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='busstoptime',
+            name='shape_pt_index',
+            field=models.IntegerField(null=True),
+        ),
+    ]
@@ -29,10 +29,20 @@ class Stops(models.Model):
     def __str__(self):
         return f"{self.stop_name} ({self.line})"
 
+# Bus feed ids (routes, trips, shapes, services) are prefixed so they can
+# never collide with the metro feed's.
+BUS_ID_PREFIX = "BUS_"
+
+
 class Route(models.Model):
+    # GTFS route_type
+    METRO = 1
+    BUS = 3
+
     route_id = models.CharField(max_length=50, primary_key=True)
     route_short_name = models.CharField(max_length=50)
     route_long_name = models.CharField(max_length=255, blank=True)
+    route_type = models.IntegerField(default=METRO, db_index=True)
 class Shape(models.Model):
     shape_id = models.CharField(max_length=50, db_index=True)
     shape_pt_lat = models.FloatField()
@@ -49,12 +59,36 @@ class Trip(models.Model):
     trip_id = models.CharField(max_length=50, primary_key=True)
     route = models.ForeignKey(Route, on_delete=models.CASCADE)
     service_id = models.CharField(max_length=50)
-    shape_id = models.ForeignKey(Shape, on_delete=models.CASCADE, db_index=True)
+    shape_id = models.ForeignKey(Shape, on_delete=models.CASCADE, db_index=True, null=True)
     
     class Meta:
         indexes = [
             models.Index(fields=['route']),
         ]
+
+
+class Calendar(models.Model):
+    service_id = models.CharField(max_length=50, primary_key=True)
+    monday = models.BooleanField(default=False)
+    tuesday = models.BooleanField(default=False)
+    wednesday = models.BooleanField(default=False)
+    thursday = models.BooleanField(default=False)
+    friday = models.BooleanField(default=False)
+    saturday = models.BooleanField(default=False)
+    sunday = models.BooleanField(default=False)
+    start_date = models.DateField()
+    end_date = models.DateField()
+
+
+class CalendarDate(models.Model):
+    service_id = models.CharField(max_length=50, db_index=True)
+    date = models.DateField(db_index=True)
+    exception_type = models.IntegerField()  # 1 = service added, 2 = removed
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['service_id', 'date']),
+        ]
     
     
 class StopTime(models.Model):
@@ -63,13 +97,25 @@ class StopTime(models.Model):
     stop_sequence = models.IntegerField(db_index=True)
     arrival_time = models.CharField(max_length=20)
     departure_time = models.CharField(max_length=20)
+    # seconds after midnight of the service day; may exceed 86400 (GTFS "25:10:00")
+    arrival_seconds = models.IntegerField(null=True)
+    departure_seconds = models.IntegerField(null=True)
+    # segment of the trip's shape the stop projects onto (see utils/shapes.py)
+    shape_pt_index = models.IntegerField(null=True)
     class Meta:
         indexes = [
             models.Index(fields=['trip', 'stop_sequence']),
-            models.Index(fields=['departure_time']),
+            models.Index(fields=['departure_seconds']),
         ]
 
 
+class TransferPattern(models.Model):
+    # one row per origin station, keyed by its first Stops row; patterns maps
+    # the destination station's first Stops id -> [[[board_id, alight_id], ...], ...]
+    origin = models.OneToOneField(Stops, on_delete=models.CASCADE, related_name="+")
+    patterns = models.JSONField(default=dict)
+
+
 class PassengerFlow(models.Model):
     month = models.CharField(max_length=20, db_index=True)   
     businessday = models.DateField(db_index=True)
@@ -120,3 +166,21 @@ class BusStop(models.Model):
 
     def __str__(self):
         return self.stop_name
+
+
+class BusStopTime(models.Model):
+    trip = models.ForeignKey(Trip, on_delete=models.CASCADE, db_index=True)
+    bus_stop = models.ForeignKey(BusStop, on_delete=models.CASCADE, db_index=True)
+    stop_sequence = models.IntegerField()
+    arrival_time = models.CharField(max_length=20)
+    departure_time = models.CharField(max_length=20)
+    arrival_seconds = models.IntegerField(null=True)
+    departure_seconds = models.IntegerField(null=True)
+    # segment of the trip's shape the stop projects onto (see utils/shapes.py)
+    shape_pt_index = models.IntegerField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['trip', 'stop_sequence']),
+            models.Index(fields=['departure_seconds']),
+        ]
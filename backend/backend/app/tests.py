@@ -1,3 +1,1109 @@
-from django.test import TestCase
+import asyncio
+import base64
+import heapq
+import io
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import date, datetime
+from unittest import mock
+from zoneinfo import ZoneInfo
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from channels.layers import InMemoryChannelLayer
+from django.core.handlers.asgi import ASGIRequest
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from . import consumers
+from .consumers import VehicleConsumer
+from .models import BusStop, BusStopTime, Calendar, CalendarDate, Route, Shape, Stops, StopTime, TransferPattern, Trip
+from .utils import live_broadcast, live_cache, synthetic_gtfs, timetable, transfer_patterns
+from .utils.journey_cache import LRUCache
+from .utils.live_broadcast import VEHICLES_ALL_GROUP, FrameEncoder, LiveTicker, frame_group, route_group
+from .utils.live_positions import live_positions, replay_positions
+from .utils.raptor import INF, mc_raptor, origin_departures, range_search, raptor, reverse_raptor
+from .utils.shapes import project_stop_times
+from .utils.stats import percentile
+from .utils.stop_index import StopNameIndex, get_stop_index
+from .utils.timetable import Timetable, format_gtfs_time, get_timetable, invalidate_timetable, parse_gtfs_time
+from .views import live_metro_flow_views, trip_planner_views
+from .views.trip_planner_views import PlanTripView, parse_ref_time
+
+
+IST = ZoneInfo("Asia/Kolkata")
+
+# Tests never touch the live snapshot directory or the shared cache.
+test_settings = override_settings(
+    TIMETABLE_SNAPSHOT_DIR="",
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+)
+
+
+def create_feed(stations, trips, services=None, shapes=None):
+    """
+    Hand-made metro feed: ``stations`` are ``{name: (lat, lon)}``, ``trips``
+    are ``{trip_id: [(station, "HH:MM:SS"), ...]}``, one route per trip,
+    running on ``services[trip_id]`` (default "DAILY", with no calendar)
+    along ``shapes[trip_id]`` (``[(lat, lon), ...]``, default none).
+    Returns ``{name: Stops pk}``.
+    """
+    stops = {
+        name: Stops.objects.create(
+            stop_id=name, station_code=name, stop_name=name, line="L",
+            stop_lat=lat, stop_lon=lon,
+        ).pk
+        for name, (lat, lon) in stations.items()
+    }
+    for trip_id, calls in trips.items():
+        route = Route.objects.create(route_id=f"R_{trip_id}", route_short_name=trip_id)
+        shape = None
+        if shapes and trip_id in shapes:
+            shape = Shape.objects.bulk_create(
+                Shape(shape_id=f"SH_{trip_id}", shape_pt_lat=lat, shape_pt_lon=lon, shape_pt_sequence=seq)
+                for seq, (lat, lon) in enumerate(shapes[trip_id])
+            )[0]
+        trip = Trip.objects.create(
+            trip_id=trip_id, route=route, service_id=(services or {}).get(trip_id, "DAILY"), shape_id=shape,
+        )
+        StopTime.objects.bulk_create(
+            StopTime(
+                trip=trip, stops_id=stops[name], stop_sequence=seq,
+                arrival_time=t, departure_time=t,
+                arrival_seconds=parse_gtfs_time(t), departure_seconds=parse_gtfs_time(t),
+            )
+            for seq, (name, t) in enumerate(calls, 1)
+        )
+    return stops
+
+
+# A fast trip with a change against a slower direct one (A -> D); stations
+# are ~5 km apart, out of walking range of each other.
+CHANGE_OR_DIRECT = (
+    {"A": (28.60, 77.20), "B": (28.65, 77.20), "D": (28.70, 77.20)},
+    {
+        "T1": [("A", "08:00:10"), ("D", "09:00:00")],
+        "T2": [("A", "08:00:50"), ("D", "09:10:00")],
+        "T3": [("A", "08:00:55"), ("B", "08:20:00")],
+        "T4": [("B", "08:30:00"), ("D", "08:55:00")],
+    },
+)
+
+
+# -----------------------------
+# Brute-force references
+# -----------------------------
+
+def _trip_calls(tt, active):
+    # stop -> [(stops, arrivals, departures, position)] for every running trip
+    calls = {}
+    for trip in range(len(tt.trip_ids)):
+        if active is not None and not active[trip]:
+            continue
+        stops = tt.pattern_stop_list(tt.trip_pattern[trip]).tolist()
+        arrs, deps = (times.tolist() for times in tt.trip_times(trip))
+        for pos, s in enumerate(stops):
+            calls.setdefault(s, []).append((stops, arrs, deps, pos))
+    return calls
+
+
+def brute_earliest_arrival(tt, sources, depart, calls):
+    """
+    Earliest arrival at every stop by a label-setting search over
+    (stop, arrived on foot) states, trying every trip at every stop; like
+    RAPTOR, a footpath never follows another footpath.
+    """
+    best = {}
+    done = set()
+    heap = [(depart, s, False) for s in sources]
+    while heap:
+        t, s, walked = heapq.heappop(heap)
+        if (s, walked) in done:
+            continue
+        done.add((s, walked))
+        best[s] = min(best.get(s, INF), t)
+        if not walked:
+            for to, secs, _ in tt.transfers_from(s):
+                heapq.heappush(heap, (t + secs, to, True))
+        for stops, arrs, deps, pos in calls.get(s, ()):
+            if deps[pos] >= t:
+                for j in range(pos + 1, len(stops)):
+                    heapq.heappush(heap, (arrs[j], stops[j], False))
+    return best
+
+
+def brute_latest_departure(tt, sources, deadline, calls):
+    """The mirror image: latest departure from every stop reaching ``sources`` by ``deadline``."""
+    best = {}
+    done = set()
+    heap = [(-deadline, s, False) for s in sources]
+    while heap:
+        t, s, walked = heapq.heappop(heap)
+        t = -t
+        if (s, walked) in done:
+            continue
+        done.add((s, walked))
+        best[s] = max(best.get(s, -INF), t)
+        if not walked:
+            for to, secs, _ in tt.transfers_from(s):
+                heapq.heappush(heap, (-(t - secs), to, True))
+        for stops, arrs, deps, pos in calls.get(s, ()):
+            if arrs[pos] <= t:
+                for j in range(pos):
+                    heapq.heappush(heap, (-deps[j], stops[j], False))
+    return best
+
+
+# -----------------------------
+# Planner
+# -----------------------------
+
+@test_settings
+class SyntheticFeedTests(TestCase):
+    SERVICE_DAY = date(2026, 10, 19)
+    MAX_TRIPS = 8
+
+    @classmethod
+    def setUpTestData(cls):
+        lines = synthetic_gtfs.synthetic_lines(1, stations_per_line=6)
+        synthetic_gtfs.create_stops(lines)
+        with tempfile.TemporaryDirectory() as gtfs_dir:
+            synthetic_gtfs.write_gtfs(gtfs_dir, lines, headway=600, start_hour=7, end_hour=9)
+            with open(os.devnull, "w") as quiet:
+                call_command("import_gtfs", dir=gtfs_dir, stdout=quiet)
+
+        cls.tt = tt = Timetable.build("synthetic")
+        cls.active, cls.active_patterns = tt.service_day(cls.SERVICE_DAY)
+        cls.calls = _trip_calls(tt, cls.active)
+
+        # one stop per station
+        stations = {}
+        for s in range(tt.n_metro_stops):
+            stations.setdefault(int(tt.stop_station[s]), s)
+        rng = random.Random(7)
+        cls.queries = [
+            (*rng.sample(sorted(stations.values()), 2), rng.randrange(7 * 3600, 9 * 3600))
+            for _ in range(40)
+        ]
+
+    def test_raptor_matches_brute_force(self):
+        tt = self.tt
+        for origin, target, depart in self.queries:
+            sources = tt.station_members(origin)
+            targets = tt.station_members(target)
+            search = raptor(
+                tt, {s: depart for s in sources}, self.MAX_TRIPS, targets=targets,
+                active=self.active, active_patterns=self.active_patterns,
+            )
+            found = search.arrival()
+            best = brute_earliest_arrival(tt, sources, depart, self.calls)
+            expected = min(best.get(s, INF) for s in targets)
+            with self.subTest(origin=origin, target=target, depart=depart):
+                self.assertEqual(found[0] if found else INF, expected)
+
+    def test_reverse_raptor_matches_brute_force(self):
+        tt = self.tt
+        for origin, target, deadline in self.queries:
+            sources = tt.station_members(target)
+            targets = tt.station_members(origin)
+            search = reverse_raptor(
+                tt, {s: deadline for s in sources}, self.MAX_TRIPS, targets=targets,
+                active=self.active, active_patterns=self.active_patterns,
+            )
+            found = search.departure()
+            best = brute_latest_departure(tt, sources, deadline, self.calls)
+            expected = max(best.get(s, -INF) for s in targets)
+            with self.subTest(origin=origin, target=target, deadline=deadline):
+                self.assertEqual(found[0] if found else -INF, expected)
+
+    def test_range_search_is_the_departure_profile(self):
+        tt = self.tt
+        max_trips = 4
+        for origin, target, start in self.queries[:10]:
+            origins = tt.station_members(origin)
+            targets = tt.station_members(target)
+            end = start + 1800
+            journeys = range_search(
+                tt, origins, targets, start, end, max_trips,
+                active=self.active, active_patterns=self.active_patterns,
+            )
+
+            def earliest(depart, k):
+                found = raptor(
+                    tt, {s: depart for s in origins}, k, targets=targets,
+                    active=self.active, active_patterns=self.active_patterns,
+                ).arrival()
+                return found[0] if found else INF
+
+            with self.subTest(origin=origin, target=target, start=start):
+                # every journey is the best one for its departure and trips ...
+                for depart, arrival, k, legs in journeys:
+                    self.assertEqual(arrival, earliest(depart, k))
+                    self.assertTrue(legs)
+                # ... and every departure in the window is answered by one of them
+                for depart in origin_departures(tt, origins, start, end, self.active):
+                    for k in range(1, max_trips + 1):
+                        best = min((j[1] for j in journeys if j[0] >= depart and j[2] <= k), default=INF)
+                        self.assertEqual(best, earliest(depart, k))
+
+    def test_mc_raptor_returns_the_pareto_set(self):
+        tt = self.tt
+        for origin, target, depart in self.queries:
+            sources = {s: depart for s in tt.station_members(origin)}
+            targets = tt.station_members(target)
+            journeys = mc_raptor(
+                tt, sources, self.MAX_TRIPS, targets,
+                active=self.active, active_patterns=self.active_patterns,
+            )
+            with self.subTest(origin=origin, target=target, depart=depart):
+                # no journey beats another on arrival, trips and walking
+                for i, a in enumerate(journeys):
+                    for b in journeys[i + 1:]:
+                        self.assertFalse(a[0] <= b[0] and a[1] <= b[1] and a[2] <= b[2], (a[:3], b[:3]))
+                        self.assertFalse(b[0] <= a[0] and b[1] <= a[1] and b[2] <= a[2], (a[:3], b[:3]))
+
+                # and the earliest arrival with at most k trips is always there
+                per_round = raptor(
+                    tt, sources, self.MAX_TRIPS, targets=targets,
+                    active=self.active, active_patterns=self.active_patterns,
+                ).target_labels()
+                for k in range(1, self.MAX_TRIPS + 1):
+                    best = min((j[0] for j in journeys if j[1] <= k), default=INF)
+                    self.assertEqual(best, min(per_round[:k + 1]))
+
+
+    def test_transfer_patterns_match_raptor(self):
+        with open(os.devnull, "w") as quiet:
+            call_command("compute_transfer_patterns", workers=1, max_transfers=3, stdout=quiet)
+        tt = get_timetable()
+        index = transfer_patterns.get_transfer_patterns(tt)
+        active, active_patterns = tt.service_day(self.SERVICE_DAY)
+        for origin, target, depart in self.queries:
+            legs = index.query(tt, origin, target, depart, active)
+            targets = tt.station_members(target)
+            found = raptor(
+                tt, {s: depart for s in tt.station_members(origin)}, 4, targets=targets,
+                active=active, active_patterns=active_patterns,
+            ).arrival()
+            with self.subTest(origin=origin, target=target, depart=depart):
+                self.assertIsNotNone(legs)
+                arrival = PlanTripView().legs_to_segments(tt, legs)[-1]["end_seconds"] if legs else INF
+                self.assertEqual(arrival, found[0] if found else INF)
+
+
+@test_settings
+class McRaptorTests(TestCase):
+    def setUp(self):
+        stops = create_feed(*CHANGE_OR_DIRECT)
+        self.tt = Timetable.build("test")
+        self.a = self.tt.stop_index[stops["A"]]
+        self.d = self.tt.stop_index[stops["D"]]
+
+    def test_faster_journey_with_more_trips_keeps_direct_one(self):
+        journeys = mc_raptor(self.tt, {self.a: parse_gtfs_time("08:00:30")}, 3, [self.d])
+        found = [(format_gtfs_time(arrival), trips) for arrival, trips, _, _ in journeys]
+        self.assertEqual(found, [("08:55:00", 2), ("09:10:00", 1)])
+
+
+@test_settings
+class PlanTripViewTests(TestCase):
+    OPTIONS = {"multi": 1, "window": 0, "patterns": 0, "arrive_by": 0, "alternatives": 1}
+
+    def setUp(self):
+        self.stops = create_feed(*CHANGE_OR_DIRECT)
+        invalidate_timetable()
+
+    def plan(self, ref, **options):
+        view = PlanTripView()
+        return view.cached_plan(
+            Stops.objects.get(pk=self.stops["A"]), Stops.objects.get(pk=self.stops["D"]),
+            None, parse_gtfs_time(ref), {**self.OPTIONS, **options},
+        )
+
+    def test_cached_multi_criteria_plan_is_the_pareto_set_from_the_request_time(self):
+        # T1 (leaving before the request) would dominate T2 from the bucket start
+        self.plan("08:00:05")
+        journeys = self.plan("08:00:30")
+        self.assertEqual(
+            sorted((j[0]["start_time"], j[-1]["end_time"]) for j in journeys),
+            [("08:00:50", "09:10:00"), ("08:00:55", "08:55:00")],
+        )
+
+    def test_bucket_fallback_is_shared_by_later_requests(self):
+        create_feed(
+            {"E": (28.80, 77.20), "F": (28.85, 77.20)},
+            {
+                "X1": [("E", "08:00:10"), ("F", "08:30:00")],
+                "X2": [("E", "08:00:40"), ("F", "08:40:00")],
+                "X3": [("E", "08:01:30"), ("F", "08:50:00")],
+            },
+        )
+        invalidate_timetable()
+        e, f = Stops.objects.get(stop_id="E"), Stops.objects.get(stop_id="F")
+        options = {**self.OPTIONS, "multi": 0}
+
+        with mock.patch.object(PlanTripView, "plan", autospec=True, side_effect=PlanTripView.plan) as plan:
+            for ref in ("08:00:20", "08:00:30", "08:00:35"):
+                journeys = PlanTripView().cached_plan(e, f, None, parse_gtfs_time(ref), options)
+                self.assertEqual([j[0]["start_time"] for j in journeys], ["08:00:40"], ref)
+        # the bucket search (X1 leaves too early) and one search after X1
+        self.assertEqual(plan.call_count, 2)
+
+    def test_window_returns_every_pareto_departure(self):
+        # T2 is the best ride without a change once T1 has gone
+        journeys = self.plan("08:00:00", multi=0, window=60)
+        self.assertEqual(
+            [(j[0]["start_time"], j[-1]["end_time"], len(j)) for j in journeys],
+            [("08:00:10", "09:00:00", 1), ("08:00:50", "09:10:00", 1), ("08:00:55", "08:55:00", 2)],
+        )
+
+    def test_walk_only_journey_has_no_transfers(self):
+        walk = {
+            "mode": "walk", "start_time": "08:00:00", "end_time": "08:05:00",
+            "start_seconds": 28800, "end_seconds": 29100, "distance_meters": 350,
+        }
+        self.assertEqual(PlanTripView()._build_trip([walk])["transfers"], 0)
+
+    def test_walk_only_plan_reports_no_transfers(self):
+        BusStop.objects.create(bus_stop_id="BUS1", stop_name="Market", stop_lat=28.6015, stop_lon=77.20)
+        invalidate_timetable()
+        response = self.client.post(
+            "/api/plan_trip/",
+            {"from_location": "A", "to_location": "Market", "when": "depart_at", "depart_at": "08:00"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        [trip] = response.json()["trips"]
+        self.assertEqual([seg["mode"] for seg in trip["segments"]], ["walk"])
+        self.assertEqual(trip["transfers"], 0)
+
+    def test_isochrone_rejects_bands_out_of_range(self):
+        for bands in ("0", "-10", "10,181"):
+            response = self.client.get("/api/isochrone/", {"from": "A", "bands": bands})
+            self.assertEqual(response.status_code, 400, bands)
+
+    def test_isochrone_arrivals(self):
+        response = self.client.get("/api/isochrone/", {"from": "A", "time": "08:00", "polygons": "0"})
+        data = response.json()
+        arrivals = dict(zip(data["stop_ids"], data["arrival_seconds"]))
+        self.assertEqual(
+            [format_gtfs_time(arrivals[self.stops[name]]) for name in "BD"],
+            ["08:20:00", "08:55:00"],
+        )
+
+
+@test_settings
+@mock.patch.object(trip_planner_views, "BATCH_WORKERS", 1)
+class BatchPlanTripViewTests(TestCase):
+    def setUp(self):
+        create_feed(*CHANGE_OR_DIRECT)
+        invalidate_timetable()
+
+    def batch(self, queries):
+        response = self.client.post("/api/plan_trip/batch/", {"queries": queries}, content_type="application/json")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        return {row.pop("index"): row for row in rows}
+
+    def test_rows_match_single_plans(self):
+        rows = self.batch([
+            {"from_location": "A", "to_location": "D", "depart_at": "08:00:30"},
+            {"from_location": "A", "to_location": "B", "depart_at": "08:00:30"},
+            {"from_location": "A", "to_location": "D", "depart_at": "08:00:00"},
+            {"from_location": "D", "to_location": "A", "depart_at": "08:00:00"},
+            {"from_location": "A", "to_location": "Nowhere"},
+            {"from_location": "A", "to_location": "D", "depart_at": "soon"},
+            "A to D",
+        ])
+        trips = {
+            i: [(t["start_time"], t["end_time"], t["transfers"]) for t in rows[i]["trips"]] for i in range(4)
+        }
+        self.assertEqual(trips, {
+            0: [("08:00:55", "08:55:00", 1)],
+            1: [("08:00:55", "08:20:00", 0)],
+            2: [("08:00:55", "08:55:00", 1)],
+            3: [],
+        })
+        self.assertEqual(
+            [rows[i]["error"] for i in (4, 5, 6)],
+            ["Stop not found", "invalid depart_at", "query must be an object"],
+        )
+
+    def test_rows_stream_one_by_one_under_asgi(self):
+        produced = []
+
+        def rows():
+            for row in ("a\n", "b\n"):
+                produced.append(row)
+                yield row
+
+        @async_to_sync
+        async def first_row():
+            stream = trip_planner_views.BatchPlanTripView._astream(rows())
+            row = await stream.__anext__()
+            await stream.aclose()
+            return row
+
+        # the second row isn't computed before the first one is sent
+        self.assertEqual(first_row(), "a\n")
+        self.assertEqual(produced, ["a\n"])
+
+    def test_rejects_empty_batches(self):
+        response = self.client.post("/api/plan_trip/batch/", {"queries": []}, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+
+WEEKDAYS = dict.fromkeys(("monday", "tuesday", "wednesday", "thursday", "friday"), True)
+WEEKEND = dict.fromkeys(("saturday", "sunday"), True)
+
+
+@test_settings
+class ServiceCalendarTests(TestCase):
+    def setUp(self):
+        self.stops = create_feed(
+            CHANGE_OR_DIRECT[0],
+            {
+                trip_id: [("A", f"{hour:02}:00:00"), ("D", f"{hour:02}:30:00")]
+                for hour, trip_id in enumerate(("WKDAY", "WKEND", "OCT", "EXTRA", "ALWAYS"), 8)
+            },
+            services={"WKDAY": "WEEKDAY", "WKEND": "WEEKEND", "OCT": "FIRST_HALF_OCT", "EXTRA": "SPECIAL"},
+        )
+        year = {"start_date": date(2026, 1, 1), "end_date": date(2026, 12, 31)}
+        Calendar.objects.create(service_id="WEEKDAY", **WEEKDAYS, **year)
+        Calendar.objects.create(service_id="WEEKEND", **WEEKEND, **year)
+        Calendar.objects.create(
+            service_id="FIRST_HALF_OCT", **WEEKDAYS, **WEEKEND,
+            start_date=date(2026, 10, 1), end_date=date(2026, 10, 15),
+        )
+        CalendarDate.objects.bulk_create([
+            CalendarDate(service_id="WEEKDAY", date=date(2026, 10, 20), exception_type=2),
+            CalendarDate(service_id="WEEKEND", date=date(2026, 10, 21), exception_type=1),
+            # only on the dates it is added
+            CalendarDate(service_id="SPECIAL", date=date(2026, 10, 24), exception_type=1),
+        ])
+        # ALWAYS has neither calendar nor calendar_dates rows
+
+    def running(self, day, tt=None):
+        tt = tt or Timetable.build("calendar")
+        trips, patterns = tt.service_day(day)
+        self.assertEqual(
+            patterns.tolist(), [bool(trips[tt.pattern_trip_list(p)].any()) for p in range(tt.n_patterns)]
+        )
+        return sorted(tt.trip_ids[t] for t in np.flatnonzero(trips))
+
+    def test_weekday_masks_and_date_bounds(self):
+        self.assertEqual(self.running(date(2026, 10, 14)), ["ALWAYS", "OCT", "WKDAY"])
+        self.assertEqual(self.running(date(2026, 10, 19)), ["ALWAYS", "WKDAY"])
+        self.assertEqual(self.running(date(2026, 10, 18)), ["ALWAYS", "WKEND"])
+        self.assertEqual(self.running(date(2027, 1, 4)), ["ALWAYS"])
+
+    def test_calendar_dates_add_and_remove_service(self):
+        self.assertEqual(self.running(date(2026, 10, 20)), ["ALWAYS"])
+        self.assertEqual(self.running(date(2026, 10, 21)), ["ALWAYS", "WKDAY", "WKEND"])
+        self.assertEqual(self.running(date(2026, 10, 24)), ["ALWAYS", "EXTRA", "WKEND"])
+
+    def test_snapshot_keeps_the_calendar(self):
+        with tempfile.TemporaryDirectory() as root:
+            Timetable.build("calendar").save(os.path.join(root, "calendar"))
+            tt = Timetable.load(os.path.join(root, "calendar"))
+        self.assertEqual(self.running(date(2026, 10, 24), tt), ["ALWAYS", "EXTRA", "WKEND"])
+        self.assertEqual(self.running(date(2026, 10, 14), tt), ["ALWAYS", "OCT", "WKDAY"])
+
+    def test_trips_without_calendar_run_next_to_calendar_feeds(self):
+        # as with a metro feed without calendar.txt plus a bus feed with one
+        Calendar.objects.all().delete()
+        CalendarDate.objects.all().delete()
+        Calendar.objects.create(
+            service_id="BUS_WEEKDAY", **WEEKDAYS, start_date=date(2026, 1, 1), end_date=date(2026, 12, 31),
+        )
+        Trip.objects.filter(trip_id="WKDAY").update(service_id="BUS_WEEKDAY")
+        Trip.objects.exclude(trip_id="WKDAY").update(service_id="DAILY")
+        invalidate_timetable()
+
+        self.assertEqual(self.running(date(2026, 10, 18)), ["ALWAYS", "EXTRA", "OCT", "WKEND"])
+        response = self.client.post(
+            "/api/plan_trip/",
+            {"from_location": "A", "to_location": "D", "when": "depart_at", "depart_at": "2026-10-18T08:00:00"},
+            content_type="application/json",
+        )
+        self.assertEqual([t["start_time"] for t in response.json()["trips"]], ["09:00:00"])
+
+
+@test_settings
+class GtfsTimeTests(TestCase):
+    def test_gtfs_times_past_midnight(self):
+        self.assertEqual(parse_gtfs_time("25:10:00"), 90600)
+        self.assertEqual(format_gtfs_time(90600), "25:10:00")
+        self.assertEqual(parse_gtfs_time(""), -1)
+
+    def test_import_stores_integer_seconds(self):
+        lines = synthetic_gtfs.synthetic_lines(1, stations_per_line=6)
+        synthetic_gtfs.create_stops(lines)
+        with tempfile.TemporaryDirectory() as gtfs_dir:
+            # the 23:50 trains arrive after midnight
+            synthetic_gtfs.write_gtfs(gtfs_dir, lines, headway=1500, start_hour=23, end_hour=24)
+            with open(os.devnull, "w") as quiet:
+                call_command("import_gtfs", dir=gtfs_dir, stdout=quiet)
+
+        rows = StopTime.objects.values_list("arrival_time", "arrival_seconds", "departure_time", "departure_seconds")
+        self.assertTrue(rows)
+        for arr, arr_sec, dep, dep_sec in rows:
+            self.assertEqual((arr_sec, dep_sec), (parse_gtfs_time(arr), parse_gtfs_time(dep)))
+        self.assertGreater(max(r[3] for r in rows), 24 * 3600)
+
+    def test_reference_times(self):
+        today = timezone.localdate()
+        self.assertEqual(parse_ref_time("08:15"), (today, 29700))
+        self.assertEqual(parse_ref_time("08:15:30"), (today, 29730))
+        self.assertEqual(parse_ref_time("2026-10-19T08:15:30"), (date(2026, 10, 19), 29730))
+        # aware times are taken in local time (Asia/Kolkata)
+        self.assertEqual(parse_ref_time("2026-10-18T21:15:30Z"), (date(2026, 10, 19), 9930))
+        with self.assertRaises(ValueError):
+            parse_ref_time("8")
+
+
+# One trip along an L-shaped track: north first, then east.
+BENT_LINE = (
+    {"P": (28.60, 77.20), "Q": (28.62, 77.22)},
+    {"BEND": [("P", "08:00:00"), ("Q", "08:10:00")]},
+)
+BENT_SHAPE = [(28.60, 77.20), (28.61, 77.20), (28.62, 77.20), (28.62, 77.22)]
+
+
+@test_settings
+class LegGeometryTests(TestCase):
+    def setUp(self):
+        self.stops = create_feed(*BENT_LINE, shapes={"BEND": BENT_SHAPE})
+
+    def leg_shape(self):
+        invalidate_timetable()
+        [segment] = PlanTripView().raptor_search(
+            Stops.objects.get(pk=self.stops["P"]), Stops.objects.get(pk=self.stops["Q"]), parse_gtfs_time("07:55:00"),
+        )
+        return [tuple(point) for point in segment["shape"]]
+
+    def test_leg_follows_the_track(self):
+        project_stop_times()
+        self.assertEqual(self.leg_shape(), BENT_SHAPE)
+
+    def test_unprojected_leg_is_a_straight_line(self):
+        self.assertEqual(self.leg_shape(), [BENT_LINE[0]["P"], BENT_LINE[0]["Q"]])
+
+
+# Bus 7 leaves from outside metro station B; BS9 is not in the stops file.
+BUS_FEED = {
+    "stops_bus_bus.txt": [
+        "stop_id,stop_name,stop_lat,stop_lon",
+        "BS1,Depot Gate,28.6505,77.2000",
+        "BS2,Lake,28.6700,77.2200",
+    ],
+    "routes.txt": ["route_id,route_short_name,route_long_name", "7,7,Depot - Lake"],
+    "trips.txt": ["route_id,service_id,trip_id,shape_id", "7,WK,7A,S7"],
+    "stop_times.txt": [
+        "trip_id,arrival_time,departure_time,stop_id,stop_sequence",
+        "7A,08:15:00,08:15:00,BS1,1",
+        "7A,08:30:00,08:30:00,BS2,2",
+        "7A,08:40:00,08:40:00,BS9,3",
+    ],
+    "shapes.txt": [
+        "shape_id,shape_pt_lat,shape_pt_lon,shape_pt_sequence",
+        "S7,28.6505,77.2000,1",
+        "S7,28.6700,77.2000,2",
+        "S7,28.6700,77.2200,3",
+    ],
+    "calendar.txt": [
+        "service_id,monday,tuesday,wednesday,thursday,friday,saturday,sunday,start_date,end_date",
+        "WK,1,1,1,1,1,0,0,20260101,20261231",
+    ],
+}
+BUS_SHAPE = [(28.6505, 77.20), (28.67, 77.20), (28.67, 77.22)]
+
+
+@test_settings
+class BusFeedTests(TestCase):
+    def setUp(self):
+        create_feed({"A": (28.60, 77.20), "B": (28.65, 77.20)}, {"M1": [("A", "08:00:00"), ("B", "08:10:00")]})
+        with tempfile.TemporaryDirectory() as gtfs_dir:
+            for name, lines in BUS_FEED.items():
+                with open(os.path.join(gtfs_dir, name), "w", encoding="utf-8") as f:
+                    f.write("\n".join(lines) + "\n")
+            with open(os.devnull, "w") as quiet:
+                call_command("import_bus_stops", file=os.path.join(gtfs_dir, "stops_bus_bus.txt"), stdout=quiet)
+                call_command("import_bus_gtfs", dir=gtfs_dir, stdout=quiet)
+
+    def plan(self, depart_at):
+        response = self.client.post(
+            "/api/plan_trip/",
+            {"from_location": "A", "to_location": "Lake", "when": "depart_at", "depart_at": depart_at},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()["trips"]
+
+    def test_import_prefixes_ids_and_projects_shapes(self):
+        trip = Trip.objects.get(trip_id="BUS_7A")
+        self.assertEqual((trip.route.route_type, trip.service_id), (Route.BUS, "BUS_WK"))
+        self.assertTrue(Calendar.objects.filter(service_id="BUS_WK", monday=True, sunday=False).exists())
+        self.assertEqual(
+            list(BusStopTime.objects.order_by("stop_sequence").values_list("bus_stop_id", "shape_pt_index")),
+            [("BS1", 0), ("BS2", 1)],
+        )
+
+    def test_metro_import_keeps_the_bus_feed(self):
+        with tempfile.TemporaryDirectory() as gtfs_dir:
+            lines = synthetic_gtfs.synthetic_lines(1, stations_per_line=3)
+            synthetic_gtfs.write_gtfs(gtfs_dir, lines, headway=1800, start_hour=7, end_hour=8)
+            with open(os.devnull, "w") as quiet:
+                call_command("import_gtfs", dir=gtfs_dir, stdout=quiet)
+        self.assertEqual(BusStopTime.objects.count(), 2)
+        self.assertTrue(Calendar.objects.filter(service_id="BUS_WK").exists())
+
+    def test_metro_then_walk_then_bus(self):
+        [trip] = self.plan("2026-10-19T08:00")
+        metro, walk, bus = trip["segments"]
+        self.assertEqual([seg["mode"] for seg in (metro, walk, bus)], ["metro", "walk", "bus"])
+        self.assertEqual((metro["end_time"], bus["start_time"], bus["end_time"]), ("08:10:00", "08:15:00", "08:30:00"))
+        self.assertEqual([tuple(point) for point in bus["shape"]], BUS_SHAPE)
+
+    def test_bus_keeps_its_calendar(self):
+        # Sunday: the metro (no calendar) still runs, bus 7 does not
+        self.assertEqual(self.plan("2026-10-18T08:00"), [])
+
+
+# -----------------------------
+# Caches and process-wide indexes
+# -----------------------------
+
+@test_settings
+class CacheTests(TestCase):
+    def setUp(self):
+        self.stops = create_feed(*CHANGE_OR_DIRECT)
+        invalidate_timetable()
+
+    def test_lru_cache_evicts_least_recently_used(self):
+        lru = LRUCache(2)
+        lru.set("a", 1)
+        lru.set("b", 2)
+        lru.get("a")
+        lru.set("c", 3)
+        self.assertEqual((lru.get("a"), lru.get("b"), lru.get("c")), (1, None, 3))
+
+    def test_per_second_cache_computes_once_per_second(self):
+        moment = datetime(2026, 10, 19, 8, 0, 0, tzinfo=IST)
+        computed = []
+
+        def compute(at):
+            computed.append(at)
+            time.sleep(0.05)
+            return at
+
+        before = live_cache.live_cache_stats()
+        with mock.patch("django.utils.timezone.now", return_value=moment):
+            statuses = []
+            threads = [
+                threading.Thread(target=lambda: statuses.append(
+                    live_cache.cached_per_second("test_live", "v1", compute)[1]
+                ))
+                for _ in range(8)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(sorted(statuses), ["miss"] + ["wait"] * 7)
+            self.assertEqual(live_cache.cached_per_second("test_live", "v1", compute), (moment, "hit"))
+
+        with mock.patch("django.utils.timezone.now", return_value=moment.replace(second=1)):
+            self.assertEqual(live_cache.cached_per_second("test_live", "v1", compute)[1], "miss")
+
+        self.assertEqual(len(computed), 2)
+        after = live_cache.live_cache_stats()
+        self.assertEqual(
+            {name: after[name] - before[name] for name in after},
+            {"hits": 1, "waits": 7, "misses": 2},
+        )
+
+    def test_timetable_is_shared_until_invalidated(self):
+        tt = get_timetable()
+        self.assertIs(get_timetable(), tt)
+
+        Stops.objects.filter(pk=self.stops["B"]).update(stop_name="Bravo")
+        invalidate_timetable()
+        new_tt = get_timetable()
+        self.assertNotEqual(new_tt.version, tt.version)
+        self.assertEqual(new_tt.stop_name[new_tt.stop_index[self.stops["B"]]], "Bravo")
+
+    def test_stop_index_follows_the_timetable_version(self):
+        self.assertEqual(get_stop_index().version, get_timetable().version)
+
+        Stops.objects.filter(pk=self.stops["B"]).update(stop_name="Bravo")
+        invalidate_timetable()
+        index = get_stop_index()
+        self.assertEqual(index.version, get_timetable().version)
+        self.assertEqual(index.resolve("bravo metro station").id, self.stops["B"])
+
+    def test_snapshot_is_built_once_and_mapped_by_other_processes(self):
+        with tempfile.TemporaryDirectory() as root, override_settings(TIMETABLE_SNAPSHOT_DIR=root):
+            # nothing published yet: the first process builds and writes it
+            with mock.patch.object(timetable, "_timetable", None):
+                tt = get_timetable()
+            self.assertEqual(sorted(os.listdir(root)), sorted([timetable.SNAPSHOT_POINTER, tt.version]))
+
+            # a fresh worker maps it instead of building
+            with mock.patch.object(timetable, "_timetable", None), \
+                    mock.patch.object(Timetable, "build", side_effect=AssertionError("rebuilt")):
+                mapped = get_timetable()
+            self.assertEqual(mapped.version, tt.version)
+            self.assertIsInstance(mapped.dep, np.memmap)
+            self.assertEqual(mapped.trip_ids, tt.trip_ids)
+            self.assertEqual(mapped.dep.tolist(), tt.dep.tolist())
+
+    def test_unwritable_snapshot_dir_falls_back_to_memory(self):
+        with tempfile.NamedTemporaryFile() as not_a_dir, \
+                override_settings(TIMETABLE_SNAPSHOT_DIR=os.path.join(not_a_dir.name, "snapshots")):
+            with self.assertLogs("app.utils.timetable", "WARNING"):
+                tt = get_timetable()
+            self.assertEqual(len(tt.trip_ids), 4)
+            # not rebuilt on every call
+            self.assertIs(get_timetable(), tt)
+
+    def test_transfer_patterns_reload_when_rows_change(self):
+        tt = get_timetable()
+        with mock.patch.object(transfer_patterns, "PATTERNS_CHECK_SECONDS", 0):
+            self.assertEqual(len(transfer_patterns.get_transfer_patterns(tt)), 0)
+            # as written by compute_transfer_patterns in another process
+            TransferPattern.objects.create(
+                origin_id=self.stops["A"],
+                patterns={str(self.stops["D"]): [[[self.stops["A"], self.stops["D"]]]]},
+            )
+            self.assertEqual(len(transfer_patterns.get_transfer_patterns(tt)), 1)
+
+
+class StopNameIndexTests(TestCase):
+    def setUp(self):
+        for code, name in (("RC", "Rajiv Chowk"), ("KG", "Kashmere Gate"), ("HK", "Hauz Khas")):
+            Stops.objects.create(
+                stop_id=code, station_code=code, stop_name=name, line="L", stop_lat=28.6, stop_lon=77.2,
+            )
+        self.index = StopNameIndex.build()
+
+    def resolve(self, query):
+        match = self.index.resolve(query)
+        return match and match.stop_name
+
+    def test_exact_alias_prefix_and_typo(self):
+        self.assertEqual(self.resolve("Rajiv Chowk Metro Station"), "Rajiv Chowk")
+        self.assertEqual(self.resolve("CP"), "Rajiv Chowk")
+        self.assertEqual(self.resolve("kash"), "Kashmere Gate")
+        self.assertEqual(self.resolve("hauz khs"), "Hauz Khas")
+        self.assertIsNone(self.resolve("zzz"))
+
+
+@test_settings
+class StopSearchViewTests(TestCase):
+    def setUp(self):
+        for n in range(1, 61):
+            Stops.objects.create(
+                stop_id=f"S{n}", station_code=f"S{n}", stop_name=f"Sector {n}", line="L",
+                stop_lat=28.6, stop_lon=77.2,
+            )
+        invalidate_timetable()
+
+    def test_paginated_search_returns_every_match(self):
+        for url in ("/api/metro-stops/", "/api/metro-stops-list/"):
+            data = self.client.get(url, {"search": "sector"}).json()
+            self.assertEqual(data["count"], 60, url)
+
+    def test_autocomplete_limit_is_clamped(self):
+        for limit, expected in (("-3", 1), ("0", 1), ("5", 5), ("500", 50)):
+            response = self.client.get("/api/metro-stops/autocomplete/", {"q": "sector", "limit": limit})
+            self.assertEqual(len(response.json()), expected, limit)
+
+
+# -----------------------------
+# Live positions
+# -----------------------------
+
+@test_settings
+class LivePositionTests(TestCase):
+    def setUp(self):
+        stops = create_feed(
+            {"A": (28.60, 77.20), "B": (28.70, 77.20)},
+            {"NIGHT": [("A", "23:50:00"), ("B", "24:20:00")]},
+        )
+        self.tt = Timetable.build("night")
+        self.a = self.tt.stop_index[stops["A"]]
+        self.b = self.tt.stop_index[stops["B"]]
+
+    def at(self, day, hour, minute):
+        return live_positions(self.tt, datetime(2026, 10, day, hour, minute, tzinfo=IST))
+
+    def test_train_before_midnight(self):
+        trains = self.at(19, 23, 55)
+        self.assertEqual(trains["trip"].tolist(), [0])
+        self.assertAlmostEqual(float(trains["progress"][0]), 5 / 30)
+
+    def test_train_past_midnight_runs_on_the_previous_service_day(self):
+        trains = self.at(20, 0, 5)
+        self.assertEqual(trains["trip"].tolist(), [0])
+        self.assertEqual((int(trains["from_stop"][0]), int(trains["to_stop"][0])), (self.a, self.b))
+        self.assertAlmostEqual(float(trains["progress"][0]), 0.5)
+        self.assertAlmostEqual(float(trains["lat"][0]), 28.65)
+
+    def test_train_leaves_the_map_after_the_delay_buffer(self):
+        self.assertEqual(self.at(20, 0, 22)["progress"].tolist(), [1.0])
+        self.assertEqual(len(self.at(20, 0, 26)["trip"]), 0)
+
+    def test_replay_after_midnight_includes_the_previous_day(self):
+        frame_start, trains = replay_positions(self.tt, date(2026, 10, 20), 0, 1800, 600)
+        # 00:00, 00:10 and 00:20 (arrival); gone by 00:30
+        self.assertEqual(frame_start.tolist(), [0, 1, 2, 3, 3])
+        self.assertEqual(trains["trip"].tolist(), [0, 0, 0])
+        np.testing.assert_allclose(trains["progress"], [1 / 3, 2 / 3, 1.0])
+
+    def test_replay_frame_layout(self):
+        invalidate_timetable()
+        data = self.client.get(
+            "/api/live-metro/replay/", {"date": "2026-10-19", "start": "23:50", "end": "24:10", "step_seconds": 600},
+        ).json()
+
+        def column(name, dtype):
+            return np.frombuffer(base64.b64decode(data[name]), dtype=dtype).tolist()
+
+        self.assertEqual((data["frames"], data["trip_ids"]), (3, ["NIGHT"]))
+        self.assertEqual(column("frame_start", "<i4"), [0, 1, 2, 3])
+        self.assertEqual(column("trip", "<i4"), [0, 0, 0])
+        np.testing.assert_allclose(column("lat", "<f4"), [28.60, 28.60 + 0.1 / 3, 28.60 + 0.2 / 3], rtol=1e-6)
+        self.assertEqual(column("bearing", "<u2"), [0, 0, 0])
+
+
+@test_settings
+class TrainOnShapeTests(TestCase):
+    def setUp(self):
+        create_feed(*BENT_LINE, shapes={"BEND": BENT_SHAPE})
+        project_stop_times()
+        self.tt = Timetable.build("bent")
+
+    def at(self, minute):
+        trains = live_positions(self.tt, datetime(2026, 10, 19, 8, minute, tzinfo=IST))
+        return float(trains["lat"][0]), float(trains["lon"][0]), float(trains["bearing"][0])
+
+    def test_train_runs_north_before_the_corner(self):
+        # half the time is half the track: ~2.09 km of the 2.22 km north leg
+        lat, lon, bearing = self.at(5)
+        self.assertAlmostEqual(lon, 77.20)
+        self.assertTrue(28.615 < lat < 28.62, lat)
+        self.assertAlmostEqual(bearing, 0.0, delta=0.1)
+
+    def test_train_turns_east_after_the_corner(self):
+        lat, lon, bearing = self.at(9)
+        self.assertAlmostEqual(lat, 28.62)
+        self.assertTrue(77.21 < lon < 77.22, lon)
+        self.assertAlmostEqual(bearing, 90.0, delta=0.1)
+
+
+# -----------------------------
+# Live broadcast
+# -----------------------------
+
+def vehicle(vehicle_id, route, lat, lon):
+    return {"vehicle_id": vehicle_id, "route": route, "lat": lat, "lon": lon, "bearing": 0}
+
+
+# V2 leaves the box of BBOX between the two ticks, V1 moves within it and
+# V3 stays outside.
+BBOX = (28.5, 77.1, 28.7, 77.3)
+FLEET_STATES = [
+    {
+        "V1": vehicle("V1", "R1", 28.60, 77.20),
+        "V2": vehicle("V2", "R2", 28.61, 77.21),
+        "V3": vehicle("V3", "R2", 28.90, 77.50),
+    },
+    {
+        "V1": vehicle("V1", "R1", 28.601, 77.20),
+        "V2": vehicle("V2", "R2", 28.95, 77.50),
+        "V3": vehicle("V3", "R2", 28.90, 77.50),
+    },
+]
+
+
+class LiveBroadcastTests(SimpleTestCase):
+    def test_frame_encoder_sends_changes_only(self):
+        encoder = FrameEncoder()
+        self.assertEqual(len(encoder.update(FLEET_STATES[0])[0]), 3)
+        updated, removed = encoder.update({"V1": FLEET_STATES[1]["V1"], "V3": FLEET_STATES[1]["V3"]})
+        self.assertEqual((updated, removed), ([FLEET_STATES[1]["V1"]], [FLEET_STATES[0]["V2"]]))
+
+        frame = json.loads(encoder.frame(updated, removed))
+        self.assertEqual(
+            (frame["type"], frame["tick"], frame["keyframe"], frame["removed"]),
+            ("vehicles.frame", 2, False, ["V2"]),
+        )
+        self.assertEqual(
+            [v["vehicle_id"] for v in json.loads(encoder.keyframe({"R2"}))["updated"]], ["V3"]
+        )
+
+    @async_to_sync
+    async def test_ticker_sends_each_group_its_frames(self):
+        layer = InMemoryChannelLayer()
+        ticker = LiveTicker()
+        channels = {}
+        for group in (VEHICLES_ALL_GROUP, route_group("R1")):
+            ticker.subscribers[group] += 1
+            channels[group] = await layer.new_channel()
+            await layer.group_add(frame_group(group), channels[group])
+
+        async def received(group):
+            try:
+                message = await asyncio.wait_for(layer.receive(channels[group]), 0.1)
+            except asyncio.TimeoutError:
+                return None
+            frame = json.loads(message["text"])
+            return sorted(v["vehicle_id"] for v in frame["updated"]), frame["removed"]
+
+        await ticker.tick(layer, FLEET_STATES[0])
+        self.assertEqual(await received(VEHICLES_ALL_GROUP), (["V1", "V2", "V3"], []))
+        self.assertEqual(await received(route_group("R1")), (["V1"], []))
+
+        # only V2 (route R2) leaves: nothing for the R1 group
+        await ticker.tick(layer, {"V1": FLEET_STATES[0]["V1"], "V3": FLEET_STATES[0]["V3"]})
+        self.assertEqual(await received(VEHICLES_ALL_GROUP), ([], ["V2"]))
+        self.assertIsNone(await received(route_group("R1")))
+
+    @async_to_sync
+    async def test_socket_joining_mid_stream_gets_a_keyframe(self):
+        ticker = LiveTicker()
+
+        async def connect(query):
+            socket = ApplicationCommunicator(VehicleConsumer.as_asgi(), {
+                "type": "websocket", "path": "/ws/vehicles/", "query_string": query,
+                "headers": [], "subprotocols": [],
+            })
+            await socket.send_input({"type": "websocket.connect"})
+            self.assertEqual((await socket.receive_output(1))["type"], "websocket.accept")
+            return socket
+
+        async def frame(socket):
+            frame = json.loads((await socket.receive_output(1))["text"])
+            return frame["keyframe"], sorted(v["vehicle_id"] for v in frame["updated"])
+
+        with mock.patch.object(consumers, "ticker", ticker), \
+                mock.patch.object(live_broadcast, "TICK_SECONDS", 0.01), \
+                mock.patch.object(live_broadcast, "current_vehicles", lambda: FLEET_STATES[0]):
+            first = await connect(b"")
+            self.assertEqual(await frame(first), (False, ["V1", "V2", "V3"]))
+
+            # the fleet no longer changes: the new socket gets its routes' state at once
+            second = await connect(b"route=R2")
+            self.assertEqual(await frame(second), (True, ["V2", "V3"]))
+            self.assertTrue(await second.receive_nothing(0.05))
+
+            for socket in (first, second):
+                await socket.send_input({"type": "websocket.disconnect", "code": 1000})
+                await socket.wait(1)
+            self.assertFalse(ticker.subscribers)
+            await asyncio.wait_for(ticker.task, 1)
+
+class LiveStreamTests(SimpleTestCase):
+    def setUp(self):
+        self.ticker = LiveTicker()
+        ticks = iter(FLEET_STATES)
+        for patcher in (
+            mock.patch.object(live_metro_flow_views, "ticker", self.ticker),
+            mock.patch.object(live_broadcast, "TICK_SECONDS", 0.01),
+            # the fleet moves once, then stays put
+            mock.patch.object(live_broadcast, "current_vehicles", lambda: next(ticks, FLEET_STATES[-1])),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def request(self, query=""):
+        scope = {"type": "http", "method": "GET", "path": "/api/live-metro/stream/", "query_string": query.encode()}
+        return ASGIRequest(scope, io.BytesIO())
+
+    @async_to_sync
+    async def frames(self, bbox, routes, n=2):
+        events = live_metro_flow_views._vehicle_events(bbox, routes)
+        frames = []
+        async for event in events:
+            if event.startswith("data: "):
+                frames.append(json.loads(event[len("data: "):]))
+                if len(frames) == n:
+                    break
+        await events.aclose()
+        # the ticker stops with its last stream
+        await asyncio.wait_for(self.ticker.task, 1)
+        return frames
+
+    @staticmethod
+    def summary(frame):
+        return frame["keyframe"], sorted(v["vehicle_id"] for v in frame["updated"]), frame["removed"]
+
+    def test_bbox_stream_sends_deltas(self):
+        first, second = self.frames(BBOX, set())
+        self.assertEqual(self.summary(first), (True, ["V1", "V2"], []))
+        self.assertEqual(self.summary(second), (False, ["V1"], ["V2"]))
+        self.assertEqual(second["updated"][0]["lat"], 28.601)
+
+    def test_route_stream_only_sees_its_routes(self):
+        first, second = self.frames(BBOX, {"R2"})
+        self.assertEqual(self.summary(first), (True, ["V2"], []))
+        self.assertEqual(self.summary(second), (False, [], ["V2"]))
+
+    def test_stream_checks_bbox(self):
+        response = async_to_sync(live_metro_flow_views.live_metro_stream)(self.request("bbox=28.7,77.1,28.5,77.3"))
+        self.assertEqual(response.status_code, 400)
+
+        response = async_to_sync(live_metro_flow_views.live_metro_stream)(self.request("bbox=28.5,77.1,28.7,77.3"))
+        self.assertEqual((response.status_code, response["Content-Type"]), (200, "text/event-stream"))
+
+    def test_live_stream_needs_asgi(self):
+        self.assertEqual(self.client.get("/api/live-metro/stream/").status_code, 501)
+
+
+@test_settings
+class SimulateVehiclesTests(TestCase):
+    def setUp(self):
+        lines = synthetic_gtfs.synthetic_lines(1, stations_per_line=4)
+        synthetic_gtfs.create_stops(lines)
+        with tempfile.TemporaryDirectory() as gtfs_dir:
+            synthetic_gtfs.write_gtfs(gtfs_dir, lines, headway=1800, start_hour=7, end_hour=8)
+            with open(os.devnull, "w") as quiet:
+                call_command("import_gtfs", dir=gtfs_dir, stdout=quiet)
+        invalidate_timetable()
+
+    def simulate(self, mode):
+        out = io.StringIO()
+        call_command(
+            "simulate_vehicles", mode=mode, vehicles=20, subscribers=2, route_subscribers=2,
+            interval=0.05, duration=0.2, stdout=out,
+        )
+        return json.loads(out.getvalue())
+
+    def test_vehicle_messages_all_delivered(self):
+        report = self.simulate("vehicle")
+        self.assertEqual(report["ticks"], 4)
+        # every vehicle to the global and its route group, every tick
+        self.assertEqual(report["published"], 4 * 20 * 2)
+        self.assertEqual(report["dropped"], 0)
+        self.assertEqual(report["delivered"], report["deliveries_expected"])
+        self.assertIsNotNone(report["latency_p95_ms"])
+
+    def test_frames_all_delivered(self):
+        report = self.simulate("frame")
+        # at least the global frame every tick
+        self.assertGreaterEqual(report["published"], 4)
+        self.assertEqual(report["dropped"], 0)
+        self.assertGreaterEqual(report["deliveries_expected"], 4 * 2)
+        self.assertEqual(report["delivered"], report["deliveries_expected"])
+
+    def test_percentile_interpolates(self):
+        self.assertEqual(percentile([4, 1, 3, 2], 50), 2.5)
+        self.assertEqual(percentile([1, 2, 3], 100), 3)
+        self.assertIsNone(percentile([], 95))
@@ -7,19 +7,26 @@ from django.urls import path
 
 from .views.od_flow_views import od_flow_api,od_flow_months
 from .views.nearest_stop_views import NearestStopView
-from .views.trip_planner_views import PlanTripView,MetroStops
+from .views.trip_planner_views import PlanTripView,BatchPlanTripView,MetroStops,stop_autocomplete
 from .views.dashboard_views import month_line_station_list, dashboard_summary,line_heatmap,top_busiest_stations,station_hourly_flow,station_summary
 from.views.passenger_flow_views import passenger_flow_api
-from.views.live_metro_flow_views import get_route_stops, get_route_shape, MetroStopList,BusStopList,live_metro_positions, metro_routes,RouteList
+from .views.isochrone_views import isochrone
+from.views.live_metro_flow_views import get_route_stops, get_route_shape, MetroStopList,BusStopList,live_metro_positions,live_metro_stream,live_metro_replay,live_metro_cache_stats, metro_routes,RouteList
 urlpatterns = [
     path("plan_trip/", PlanTripView.as_view()),
+    path("plan_trip/batch/", BatchPlanTripView.as_view()),
     path("nearest-stop/", NearestStopView.as_view()),
+    path("isochrone/", isochrone),
     path("metro-stops-list/", MetroStopList.as_view()),
     path("metro-stops/", MetroStops.as_view()),
+    path("metro-stops/autocomplete/", stop_autocomplete),
     path("bus-stops/", BusStopList.as_view()),
     path("routes/", RouteList.as_view()),
     path("metro-routes/", metro_routes),
     path("live-metro/", live_metro_positions),
+    path("live-metro/stream/", live_metro_stream),
+    path("live-metro/replay/", live_metro_replay),
+    path("live-metro/cache-stats/", live_metro_cache_stats),
     path("month-line-station/", month_line_station_list),
     path("dashboard-summary/", dashboard_summary),
     path("station-summary/", station_summary),
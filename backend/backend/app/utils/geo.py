@@ -0,0 +1,39 @@
+from math import radians, cos, sin, asin, sqrt
+
+import numpy as np
+
+
+EARTH_RADIUS_M = 6371000
+METERS_PER_DEGREE = 111320
+
+WALK_SPEED_MPS = 1.25
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    dlat = radians(lat2 - lat1)
+    dlon = radians(lon2 - lon1)
+
+    a = (
+        sin(dlat / 2) ** 2
+        + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_M * asin(sqrt(a))
+
+
+def haversine_np(lat1, lon1, lat2, lon2):
+    # element-wise haversine over arrays of degrees
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def bearing_np(lat1, lon1, lat2, lon2):
+    # element-wise initial bearing in degrees clockwise from north, [0, 360)
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    dlon = lon2 - lon1
+    y = np.sin(dlon) * np.cos(lat2)
+    x = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dlon)
+    return np.degrees(np.arctan2(y, x)) % 360.0
@@ -0,0 +1,50 @@
+import csv
+import os
+from datetime import datetime
+
+from ..models import Calendar, CalendarDate
+
+
+CHUNK = 2000
+DAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+
+def parse_date(value):
+    return datetime.strptime(value.strip(), "%Y%m%d").date()
+
+
+def import_calendar(gtfs_dir, prefix="", log=None):
+    """
+    Load calendar.txt and calendar_dates.txt (both optional in GTFS) from
+    ``gtfs_dir``, prefixing every service_id with ``prefix`` so feeds that
+    share the tables keep their services apart. ``log`` is called with a
+    line for each file found.
+    """
+    calendar_file = os.path.join(gtfs_dir, "calendar.txt")
+    if os.path.exists(calendar_file):
+        if log:
+            log("Importing calendar...")
+        with open(calendar_file, encoding="utf-8") as f:
+            Calendar.objects.bulk_create([
+                Calendar(
+                    service_id=f"{prefix}{row['service_id']}",
+                    start_date=parse_date(row["start_date"]),
+                    end_date=parse_date(row["end_date"]),
+                    **{d: row.get(d, "0").strip() == "1" for d in DAYS},
+                )
+                for row in csv.DictReader(f)
+            ], batch_size=CHUNK)
+
+    dates_file = os.path.join(gtfs_dir, "calendar_dates.txt")
+    if os.path.exists(dates_file):
+        if log:
+            log("Importing calendar_dates...")
+        with open(dates_file, encoding="utf-8") as f:
+            CalendarDate.objects.bulk_create([
+                CalendarDate(
+                    service_id=f"{prefix}{row['service_id']}",
+                    date=parse_date(row["date"]),
+                    exception_type=int(row["exception_type"]),
+                )
+                for row in csv.DictReader(f)
+            ], batch_size=CHUNK)
@@ -0,0 +1,65 @@
+import threading
+from collections import OrderedDict
+
+from django.core.cache import cache
+
+
+JOURNEY_CACHE_SIZE = 5000
+JOURNEY_CACHE_TIMEOUT = 900
+
+# Departure times are rounded down to this many seconds in cache keys.
+DEPARTURE_BUCKET_SECONDS = 60
+
+
+class LRUCache:
+    """Small thread-safe in-process LRU map."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_local = LRUCache(JOURNEY_CACHE_SIZE)
+
+
+def departure_bucket(ref_seconds):
+    return ref_seconds - ref_seconds % DEPARTURE_BUCKET_SECONDS
+
+
+def journey_cache_key(version, from_id, to_id, service_day, bucket, options):
+    # the timetable version makes every entry stale after import_gtfs
+    opts = "-".join(f"{k}={options[k]}" for k in sorted(options))
+    return f"journeys_{version}_{from_id}_{to_id}_{service_day}_{bucket}_{opts}"
+
+
+def get_journeys(key):
+    value = _local.get(key)
+    if value is None:
+        value = cache.get(key)
+        if value is not None:
+            _local.set(key, value)
+    return value
+
+
+def set_journeys(key, value):
+    _local.set(key, value)
+    cache.set(key, value, timeout=JOURNEY_CACHE_TIMEOUT)
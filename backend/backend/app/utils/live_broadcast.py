@@ -0,0 +1,226 @@
+import asyncio
+import json
+import logging
+import re
+import uuid
+from collections import Counter
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from django.utils import timezone
+
+from .live_positions import live_positions
+from .spatial import GridIndex
+from .timetable import get_timetable
+
+
+logger = logging.getLogger(__name__)
+
+VEHICLES_ALL_GROUP = "vehicles_all"
+TICK_SECONDS = 1.0
+
+# ~1 m / 1 degree: smaller moves are not worth a frame entry
+COORD_DECIMALS = 5
+BEARING_DECIMALS = 0
+
+# Grid cell over vehicle positions for bounding-box streams.
+FLEET_GRID_METERS = 1000
+
+# Every process runs its own ticker, so over a shared (Redis) layer its
+# frames go to groups of its own sockets only, never another process's.
+PROCESS_TAG = uuid.uuid4().hex[:12]
+
+
+@lru_cache(maxsize=None)
+def route_group(route_id):
+    # channel layer group names only allow ASCII word characters, "-" and "."
+    # and must stay under 100 characters with the frame_group suffix
+    return "vehicles_route_" + re.sub(r"[^\w.-]", "_", str(route_id), flags=re.ASCII)[:70]
+
+
+def frame_group(group):
+    """This process's ticker frames for the sockets of ``group``."""
+    return f"{group}.{PROCESS_TAG}"
+
+
+def current_vehicles():
+    """``{vehicle_id: vehicle}`` for every running train, in the wire format."""
+    tt = get_timetable()
+    trains = live_positions(tt)
+    vehicles = {}
+    for trip, lat, lon, bearing in zip(
+        trains["trip"].tolist(), trains["lat"].tolist(), trains["lon"].tolist(),
+        trains["bearing"].tolist(),
+    ):
+        vehicle_id = tt.trip_ids[trip]
+        vehicles[vehicle_id] = {
+            "vehicle_id": vehicle_id,
+            "route": tt.route_ids[tt.trip_route[trip]],
+            "lat": round(lat, COORD_DECIMALS),
+            "lon": round(lon, COORD_DECIMALS),
+            "bearing": int(round(bearing, BEARING_DECIMALS)) % 360,
+        }
+    return vehicles
+
+
+class FrameEncoder:
+    """
+    Turns successive fleet states into delta frames: the vehicles that
+    appeared or moved since the previous tick, and the ids that left.
+    """
+
+    def __init__(self):
+        self.state = {}
+        self.tick = 0
+
+    def update(self, vehicles):
+        updated = [v for vid, v in vehicles.items() if self.state.get(vid) != v]
+        removed = [self.state[vid] for vid in self.state.keys() - vehicles.keys()]
+        self.state = vehicles
+        self.tick += 1
+        return updated, removed
+
+    def frame(self, updated, removed, keyframe=False):
+        return json.dumps({
+            "type": "vehicles.frame",
+            "tick": self.tick,
+            "timestamp": timezone.now().isoformat(),
+            "keyframe": keyframe,
+            "updated": updated,
+            "removed": [v["vehicle_id"] for v in removed],
+        }, separators=(",", ":"))
+
+    def keyframe(self, routes=None):
+        vehicles = [v for v in self.state.values() if routes is None or v["route"] in routes]
+        return self.frame(vehicles, [], keyframe=True)
+
+
+class FleetSnapshot:
+    """
+    One tick's vehicles for filtered streams: each serialized once, with a
+    grid over their positions so a bounding box only visits nearby cells.
+    """
+
+    def __init__(self, tick, vehicles):
+        self.tick = tick
+        self.ids = list(vehicles)
+        self.routes = [v["route"] for v in vehicles.values()]
+        self.encoded = {
+            vid: json.dumps(v, separators=(",", ":")) for vid, v in vehicles.items()
+        }
+        self.grid = GridIndex(
+            [v["lat"] for v in vehicles.values()],
+            [v["lon"] for v in vehicles.values()],
+            FLEET_GRID_METERS,
+        )
+
+    def select(self, bbox=None, routes=None):
+        """Ids of the vehicles inside ``bbox`` (south, west, north, east) on ``routes``."""
+        found = self.grid.within(*bbox) if bbox else range(len(self.ids))
+        if routes:
+            found = [i for i in found if self.routes[i] in routes]
+        return [self.ids[i] for i in found]
+
+
+class LiveTicker:
+    """
+    Process-wide broadcaster: while anyone is subscribed, computes the fleet
+    once per tick and sends each subscribed group one pre-serialized frame,
+    so the work per tick doesn't grow with the number of clients.
+    """
+
+    def __init__(self):
+        self.subscribers = Counter()     # group -> open sockets in this process
+        self.group_route = {}            # route group -> route id
+        self.encoder = FrameEncoder()
+        self.task = None
+        self.streams = 0                 # open filtered (SSE) streams
+        self.fleet = None
+        self._ticked = None
+
+    def _ensure_running(self):
+        if self.task is None or self.task.done():
+            self.encoder = FrameEncoder()
+            self.fleet = None
+            self._ticked = asyncio.Event()
+            self.task = asyncio.get_running_loop().create_task(self.run())
+
+    def subscribe(self, routes=()):
+        """Register a socket; returns the groups it should join."""
+        groups = []
+        for route in routes:
+            group = route_group(route)
+            self.group_route[group] = route
+            groups.append(group)
+        groups = groups or [VEHICLES_ALL_GROUP]
+        self.subscribers.update(groups)
+        self._ensure_running()
+        return groups
+
+    def unsubscribe(self, groups):
+        self.subscribers.subtract(groups)
+        for group in groups:
+            if self.subscribers[group] <= 0:
+                del self.subscribers[group]
+                self.group_route.pop(group, None)
+
+    def open_stream(self):
+        self.streams += 1
+        self._ensure_running()
+
+    def close_stream(self):
+        self.streams -= 1
+
+    async def next_fleet(self, after=0):
+        """The first ``FleetSnapshot`` newer than tick ``after``."""
+        while self.fleet is None or self.fleet.tick <= after:
+            await self._ticked.wait()
+        return self.fleet
+
+    def keyframe(self, groups):
+        # full state for a socket joining mid-stream; None before the first
+        # tick, whose frame carries every vehicle anyway
+        if not self.encoder.tick:
+            return None
+        if VEHICLES_ALL_GROUP in groups:
+            return self.encoder.keyframe()
+        return self.encoder.keyframe({self.group_route[g] for g in groups})
+
+    async def run(self):
+        layer = get_channel_layer()
+        loop = asyncio.get_running_loop()
+        compute = sync_to_async(current_vehicles)
+
+        while self.subscribers or self.streams:
+            started = loop.time()
+            try:
+                await self.tick(layer, await compute())
+            except Exception:
+                # keep serving the sockets; the next tick retries
+                logger.exception("live position tick failed")
+            await asyncio.sleep(max(TICK_SECONDS - (loop.time() - started), 0))
+
+    async def tick(self, layer, vehicles):
+        updated, removed = self.encoder.update(vehicles)
+
+        if self.streams:
+            self.fleet = FleetSnapshot(self.encoder.tick, vehicles)
+            ticked, self._ticked = self._ticked, asyncio.Event()
+            ticked.set()
+
+        changes = {VEHICLES_ALL_GROUP: (updated, removed)}
+        for i, changed in enumerate((updated, removed)):
+            for v in changed:
+                group = route_group(v["route"])
+                if group in self.subscribers:
+                    changes.setdefault(group, ([], []))[i].append(v)
+
+        for group in list(self.subscribers):
+            group_updated, group_removed = changes.get(group, ((), ()))
+            if group_updated or group_removed:
+                text = self.encoder.frame(list(group_updated), list(group_removed))
+                await layer.group_send(frame_group(group), {"type": "vehicles.frame", "text": text})
+
+
+ticker = LiveTicker()
@@ -0,0 +1,106 @@
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .journey_cache import LRUCache
+
+
+# Live positions are cached per wall-clock second; entries outlive their
+# second only long enough for late readers in other workers.
+LIVE_CACHE_TIMEOUT = 5
+LIVE_CACHE_LOCAL_SIZE = 4
+
+# Cross-process single flight: the worker holding the lock computes, the
+# others poll the shared cache for at most FLIGHT_WAIT_SECONDS.
+FLIGHT_LOCK_SECONDS = 2
+FLIGHT_WAIT_SECONDS = 1.0
+FLIGHT_POLL_SECONDS = 0.005
+
+# request status -> name in live_cache_stats()
+LIVE_CACHE_COUNTERS = {"hit": "hits", "wait": "waits", "miss": "misses"}
+
+_local = LRUCache(LIVE_CACHE_LOCAL_SIZE)
+_flights = {}                # key -> Event set when the in-process leader finishes
+_flights_lock = threading.Lock()
+_counts = Counter()          # status -> requests served by this process
+_counts_lock = threading.Lock()
+
+
+def live_cache_stats():
+    """
+    Request counts of this process: served from cache (hits), by waiting
+    on another request's computation (waits), or computed (misses).
+    """
+    with _counts_lock:
+        return {name: _counts[status] for status, name in LIVE_CACHE_COUNTERS.items()}
+
+
+def _count(status):
+    with _counts_lock:
+        _counts[status] += 1
+
+
+def cached_per_second(prefix, version, compute):
+    """
+    ``compute(moment)`` for the current second, computed once across
+    requests: served from the in-process LRU, then the cache shared by the
+    workers (``CACHES``); concurrent misses in a process wait for one
+    leader, and leaders of different processes take a ``cache.add`` lock
+    (atomic on Redis; on the file cache two workers may rarely both compute).
+    Returns ``(value, status)`` with status "hit", "wait" or "miss".
+    """
+    second = int(timezone.now().timestamp())
+    key = f"{prefix}_{version}_{second}"
+
+    value = _local.get(key)
+    if value is None:
+        value = cache.get(key)
+        if value is not None:
+            _local.set(key, value)
+    if value is not None:
+        _count("hit")
+        return value, "hit"
+
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = threading.Event()
+
+    if not leader:
+        flight.wait(FLIGHT_WAIT_SECONDS)
+        value = _local.get(key)
+        if value is not None:
+            _count("wait")
+            return value, "wait"
+
+    try:
+        value, status = _compute_once(key, second, compute)
+    finally:
+        if leader:
+            with _flights_lock:
+                _flights.pop(key, None)
+            flight.set()
+    _count(status)
+    return value, status
+
+
+def _compute_once(key, second, compute):
+    if not cache.add(f"{key}_lock", 1, timeout=FLIGHT_LOCK_SECONDS):
+        deadline = time.monotonic() + FLIGHT_WAIT_SECONDS
+        while time.monotonic() < deadline:
+            value = cache.get(key)
+            if value is not None:
+                _local.set(key, value)
+                return value, "wait"
+            time.sleep(FLIGHT_POLL_SECONDS)
+        # the other worker is stuck or gone: don't leave the client hanging
+
+    value = compute(datetime.fromtimestamp(second, tz=dt_timezone.utc))
+    _local.set(key, value)
+    cache.set(key, value, timeout=LIVE_CACHE_TIMEOUT)
+    return value, "miss"
@@ -0,0 +1,201 @@
+from datetime import timedelta
+
+import numpy as np
+from django.utils import timezone
+
+from ..models import Route
+from .geo import bearing_np
+from .timetable import TIME_KEY_SPAN, format_gtfs_time
+
+
+# A train stays on the map this long after its scheduled arrival.
+DELAY_BUFFER_SECONDS = 300
+
+
+def running_trips(tt, clock, active=None, route_type=Route.METRO):
+    """
+    Indexes of the ``route_type`` trips between their first departure and
+    last arrival (plus the delay buffer) at ``clock`` seconds of the
+    service day; ``active`` is the service-day trip mask.
+
+    Only the trips of the time buckets around ``clock`` are looked at.
+    """
+    trips = tt.trips_between(clock - DELAY_BUFFER_SECONDS, clock)
+    mask = (tt.trip_first_dep[trips] <= clock) & (clock <= tt.trip_last_arr[trips] + DELAY_BUFFER_SECONDS)
+    mask &= tt.route_type[tt.trip_route[trips]] == route_type
+    if active is not None:
+        mask &= active[trips]
+    return trips[mask]
+
+
+def train_positions(tt, clock, trips):
+    """
+    Current segment of each of ``trips`` and its position along it, in one
+    vectorized pass over the timetable arrays. ``clock`` is a time or an
+    array of times parallel to ``trips``.
+
+    Every trip's segment comes from a single ``searchsorted`` over the
+    (trip, departure) keys: the last stop it left at or before ``clock``.
+    Trains then follow their shape (see ``along_shapes``), or a straight
+    line between the stops when the trip has no projected shape.
+    Returns parallel arrays: trip, from/to stop index, segment departure
+    and arrival seconds, progress in [0, 1], lat, lon and bearing.
+    """
+    trips = np.asarray(trips, dtype=np.int64)
+    start = tt.trip_time_start[trips].astype(np.int64)
+    last = start + tt.trip_stop_counts(trips) - 1
+
+    pos = np.searchsorted(tt.time_key, start * TIME_KEY_SPAN + clock, side="right") - 1
+    pos = np.clip(pos, start, last - 1)
+
+    depart = tt.dep[pos]
+    arrive = tt.arr[pos + 1]
+    span = arrive - depart
+    # dwelling at the next stop or running late clamps to the segment ends
+    progress = np.clip((clock - depart) / np.maximum(span, 1), 0.0, 1.0)
+    progress[span <= 0] = 1.0
+
+    stop_base = tt.pattern_stop_start[tt.trip_pattern[trips]] - start
+    from_stop = tt.pattern_stops[stop_base + pos]
+    to_stop = tt.pattern_stops[stop_base + pos + 1]
+
+    lat1, lon1 = tt.stop_lat[from_stop], tt.stop_lon[from_stop]
+    lat2, lon2 = tt.stop_lat[to_stop], tt.stop_lon[to_stop]
+    lat = lat1 + (lat2 - lat1) * progress
+    lon = lon1 + (lon2 - lon1) * progress
+    bearing = bearing_np(lat1, lon1, lat2, lon2)
+
+    d_from = tt.time_shape_dist[pos]
+    d_to = tt.time_shape_dist[pos + 1]
+    # NaN (unprojected) compares False
+    on_shape = np.flatnonzero(d_to >= d_from)
+    if len(on_shape):
+        lat[on_shape], lon[on_shape], bearing[on_shape] = along_shapes(
+            tt,
+            tt.trip_shape[trips[on_shape]],
+            d_from[on_shape] + (d_to[on_shape] - d_from[on_shape]) * progress[on_shape],
+        )
+
+    return {
+        "trip": trips,
+        "from_stop": from_stop,
+        "to_stop": to_stop,
+        "depart": depart,
+        "arrive": arrive,
+        "progress": progress,
+        "lat": lat,
+        "lon": lon,
+        "bearing": bearing,
+    }
+
+
+def along_shapes(tt, shapes, dist):
+    """
+    ``(lat, lon, bearing)`` of the points ``dist`` metres along the
+    cumulative ``shape_dist`` axis, each kept within its own shape; one
+    ``searchsorted`` finds every point's shape segment.
+    """
+    lo = tt.shape_start[shapes]
+    hi = tt.shape_start[shapes + 1] - 2
+    k = np.searchsorted(tt.shape_dist, dist, side="right") - 1
+    k = np.clip(k, lo, np.maximum(hi, lo))
+
+    seg_start = tt.shape_dist[k]
+    seg_len = tt.shape_dist[k + 1] - seg_start
+    f = np.clip((dist - seg_start) / np.where(seg_len > 0, seg_len, 1.0), 0.0, 1.0)
+
+    lat1, lon1 = tt.shape_lat[k], tt.shape_lon[k]
+    lat2, lon2 = tt.shape_lat[k + 1], tt.shape_lon[k + 1]
+    return (
+        lat1 + (lat2 - lat1) * f,
+        lon1 + (lon2 - lon1) * f,
+        bearing_np(lat1, lon1, lat2, lon2),
+    )
+
+
+def replay_positions(tt, service_day, start, end, step, route_type=Route.METRO):
+    """
+    Scheduled positions of every train at ``start``, ``start + step``, ...
+    up to ``end`` seconds of ``service_day``, computed as one batch: all
+    (trip, frame) pairs with the train running go through a single
+    ``train_positions`` call. As in ``live_positions``, the previous
+    service day's trips still running past midnight are included.
+    Returns ``(frame_start, positions)``; frame ``f``'s trains are
+    ``positions[key][frame_start[f]:frame_start[f + 1]]``.
+    """
+    n_frames = (end - start) // step + 1
+
+    pair_trip, pair_frame, pair_clock = [], [], []
+    for offset, day in ((0, service_day), (86400, service_day - timedelta(days=1))):
+        # yesterday's trips run on its clock, 86400 s ahead of ours
+        first_clock = start + offset
+        active, _ = tt.service_day(day)
+
+        trips = tt.trips_between(first_clock, end + offset)
+        keep = tt.route_type[tt.trip_route[trips]] == route_type
+        if active is not None:
+            keep &= active[trips]
+        trips = trips[keep]
+
+        # each trip runs during a contiguous range of frames
+        first = np.maximum(-((first_clock - tt.trip_first_dep[trips]) // step), 0)
+        last = np.minimum((tt.trip_last_arr[trips] - first_clock) // step, n_frames - 1)
+        counts = np.maximum(last - first + 1, 0)
+
+        frames = np.repeat(first, counts) + (
+            np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+        )
+        pair_trip.append(np.repeat(trips, counts))
+        pair_frame.append(frames)
+        pair_clock.append(first_clock + frames * step)
+
+    pair_frame = np.concatenate(pair_frame)
+    order = np.argsort(pair_frame, kind="stable")
+    pair_frame = pair_frame[order]
+    pair_trip = np.concatenate(pair_trip)[order]
+    pair_clock = np.concatenate(pair_clock)[order]
+
+    frame_start = np.zeros(n_frames + 1, dtype=np.int32)
+    np.cumsum(np.bincount(pair_frame, minlength=n_frames), out=frame_start[1:])
+    return frame_start, train_positions(tt, pair_clock, pair_trip)
+
+
+def live_positions(tt, moment=None):
+    """
+    ``train_positions`` of every train running at ``moment`` (default now):
+    today's trips, then yesterday's trips still running past midnight
+    ("25:10:00").
+    """
+    local = timezone.localtime(moment)
+    now_sec = local.hour * 3600 + local.minute * 60 + local.second
+    today = local.date()
+
+    parts = []
+    for clock, service_day in ((now_sec, today), (now_sec + 86400, today - timedelta(days=1))):
+        active, _ = tt.service_day(service_day)
+        parts.append(train_positions(tt, clock, running_trips(tt, clock, active)))
+    return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+
+def position_rows(tt, trains):
+    # one /api/live-metro/ record per train
+    rows = []
+    for trip, s1, s2, t1, t2, progress, lat, lon, bearing in zip(
+        trains["trip"].tolist(), trains["from_stop"].tolist(), trains["to_stop"].tolist(),
+        trains["depart"].tolist(), trains["arrive"].tolist(), trains["progress"].tolist(),
+        trains["lat"].tolist(), trains["lon"].tolist(), trains["bearing"].tolist(),
+    ):
+        rows.append({
+            "trip_id": tt.trip_ids[trip],
+            "route_id": tt.route_ids[tt.trip_route[trip]],
+            "progress": round(progress * 100, 2),
+            "current_lat": round(lat, 6),
+            "current_lon": round(lon, 6),
+            "bearing": round(bearing, 1),
+            "from_stop": tt.stop_name[s1],
+            "to_stop": tt.stop_name[s2],
+            "next_stop": tt.stop_name[s2],
+            "start_time": format_gtfs_time(t1),
+            "end_time": format_gtfs_time(t2),
+        })
+    return rows
@@ -0,0 +1,599 @@
+import numpy as np
+
+
+INF = 1 << 40
+
+TRIP = "trip"
+WALK = "walk"
+
+
+# -----------------------------
+# Round-based search (RAPTOR)
+# -----------------------------
+
+class RaptorSearch:
+    """
+    Earliest-arrival search over a ``Timetable``.
+
+    ``labels[k][s]`` is the earliest arrival at stop ``s`` using at most
+    ``k`` trips and ``parents[k]`` holds the leg that set it in round ``k``
+    (a stop without a parent in round ``k`` kept its round ``k - 1`` label).
+
+    Each round scans every pattern touched by a stop improved in the
+    previous round exactly once, boarding the earliest catchable trip by
+    binary search on the pattern's departure column (trips of a pattern
+    never overtake each other). Arrivals no better than the current label
+    at ``targets`` are pruned. ``active`` / ``active_patterns`` optionally
+    mask the trips and patterns that do not run on the service day.
+
+    Labels are kept between calls to ``run``, so running it for decreasing
+    departure times gives a range (rRAPTOR) query.
+    """
+
+    def __init__(self, tt, max_trips, targets=(), active=None, active_patterns=None):
+        self.tt = tt
+        self.max_trips = max_trips
+        self.targets = list(targets)
+        self.target_set = set(targets)
+        self.active = active
+        self.active_patterns = active_patterns
+        self.labels = [[INF] * tt.n_stops for _ in range(max_trips + 1)]
+        self.parents = [{} for _ in range(max_trips + 1)]
+
+    def run(self, sources):
+        """``sources`` maps stop index -> departure seconds."""
+        label = self.labels[0]
+        parent = self.parents[0]
+        marked = set()
+
+        for s, t in sources.items():
+            if t < label[s]:
+                label[s] = t
+                parent.pop(s, None)
+                marked.add(s)
+
+        self._relax_transfers(marked, label, parent)
+        touched = set(marked)
+
+        for k in range(1, self.max_trips + 1):
+            if not marked:
+                break
+
+            prev = self.labels[k - 1]
+            label = self.labels[k]
+            parent = self.parents[k]
+
+            # keep labels[k] <= labels[k - 1] for every stop reached so far
+            for s in touched:
+                if prev[s] < label[s]:
+                    label[s] = prev[s]
+                    parent.pop(s, None)
+
+            queue = _pattern_queue(self.tt, marked, self.active_patterns)
+
+            marked = set()
+            for p, start in queue.items():
+                self._scan_pattern(p, start, prev, label, parent, marked)
+
+            self._relax_transfers(marked, label, parent)
+            touched |= marked
+
+        return self
+
+    def _bound(self, label):
+        bound = INF
+        for s in self.targets:
+            if label[s] < bound:
+                bound = label[s]
+        return bound
+
+    def _scan_pattern(self, p, start, prev, label, parent, marked):
+        tt = self.tt
+        active = self.active
+        seq = tt.pattern_stop_list(p).tolist()
+        trips = tt.pattern_trip_list(p)
+        n_p = len(seq)
+        n_trips = len(trips)
+        base = int(tt.pattern_time_start[p])
+        bound = self._bound(label)
+
+        trip_j = -1
+        row_arr = row_dep = None
+        board_pos = board_stop = -1
+
+        for i in range(start, n_p):
+            s = seq[i]
+
+            if trip_j >= 0:
+                a = row_arr[i]
+                if a < label[s] and a < bound:
+                    label[s] = a
+                    parent[s] = (TRIP, int(trips[trip_j]), board_pos, i, board_stop)
+                    marked.add(s)
+                    if s in self.target_set:
+                        bound = a
+
+            t_prev = prev[s]
+            if t_prev >= INF or (trip_j >= 0 and t_prev > row_dep[i]):
+                continue
+
+            col = tt.dep[base + i:base + n_trips * n_p:n_p]
+            j = int(np.searchsorted(col, t_prev, side="left"))
+            if active is not None:
+                while j < n_trips and not active[trips[j]]:
+                    j += 1
+            if j < n_trips and (trip_j < 0 or j < trip_j):
+                trip_j = j
+                off = base + j * n_p
+                row_arr = tt.arr[off:off + n_p].tolist()
+                row_dep = tt.dep[off:off + n_p].tolist()
+                board_pos = i
+                board_stop = s
+
+    def _relax_transfers(self, marked, label, parent):
+        bound = self._bound(label)
+        for s in list(marked):
+            t0 = label[s]
+            for to, secs, dist in self.tt.transfers_from(s):
+                a = t0 + secs
+                if a < label[to] and a < bound:
+                    label[to] = a
+                    parent[to] = (WALK, s, secs, dist)
+                    marked.add(to)
+                    if to in self.target_set:
+                        bound = a
+
+    # -----------------------------
+    # Results
+    # -----------------------------
+
+    def target_labels(self):
+        # best arrival at any target, per round
+        return [self._bound(label) for label in self.labels]
+
+    def arrival(self, targets=None):
+        # (arrival, round, stop) of the earliest arrival at any target,
+        # preferring fewer trips on ties
+        found = None
+        for k, label in enumerate(self.labels):
+            for s in targets if targets is not None else self.targets:
+                if label[s] < INF and (found is None or label[s] < found[0]):
+                    found = (label[s], k, s)
+        return found
+
+    def best_target(self, k):
+        label = self.labels[k]
+        return min(self.targets, key=lambda s: label[s])
+
+    def journey(self, stop, k):
+        """Legs leading to ``stop`` in round ``k``, in travel order."""
+        legs = []
+        s = stop
+        while k >= 0:
+            par = self.parents[k].get(s)
+            if par is None:
+                if k == 0:
+                    break
+                k -= 1
+                continue
+            if par[0] == WALK:
+                _, from_stop, secs, dist = par
+                end = self.labels[k][s]
+                legs.append((WALK, from_stop, s, end - secs, end, dist))
+                s = from_stop
+                continue
+            _, trip, board_pos, alight_pos, board_stop = par
+            legs.append((TRIP, trip, board_pos, alight_pos))
+            s = board_stop
+            k -= 1
+        legs.reverse()
+        return legs
+
+
+def _pattern_queue(tt, marked, active_patterns=None):
+    # pattern -> earliest position of a marked stop on it
+    queue = {}
+    for s in marked:
+        for p, pos in tt.patterns_at(s):
+            if active_patterns is not None and not active_patterns[p]:
+                continue
+            if pos < queue.get(p, INF):
+                queue[p] = pos
+    return queue
+
+
+def raptor(tt, sources, max_trips, targets=(), active=None, active_patterns=None):
+    search = RaptorSearch(
+        tt, max_trips, targets=targets, active=active, active_patterns=active_patterns
+    )
+    return search.run(sources)
+
+
+def one_to_all(tt, sources, max_trips, active=None, active_patterns=None):
+    """Earliest arrival at every stop (``INF`` when unreachable)."""
+    search = RaptorSearch(tt, max_trips, active=active, active_patterns=active_patterns)
+    search.run(sources)
+    return [min(col) for col in zip(*search.labels)]
+
+
+# -----------------------------
+# Arrive-by search (reverse RAPTOR)
+# -----------------------------
+
+class ReverseRaptorSearch:
+    """
+    Latest-departure search: ``labels[k][s]`` is the latest time one can
+    leave stop ``s`` and still reach a source by its deadline using at most
+    ``k`` trips.
+
+    The mirror image of ``RaptorSearch``: patterns are scanned from the
+    last marked stop backwards, alighting from the latest trip that still
+    arrives in time (binary search on the pattern's arrival column), and
+    departures no later than the current label at ``targets`` are pruned.
+    Footpaths are symmetric, so they are walked in the same table.
+    """
+
+    def __init__(self, tt, max_trips, targets=(), active=None, active_patterns=None):
+        self.tt = tt
+        self.max_trips = max_trips
+        self.targets = list(targets)
+        self.target_set = set(targets)
+        self.active = active
+        self.active_patterns = active_patterns
+        self.labels = [[-INF] * tt.n_stops for _ in range(max_trips + 1)]
+        self.parents = [{} for _ in range(max_trips + 1)]
+
+    def run(self, sources):
+        """``sources`` maps stop index -> arrival deadline in seconds."""
+        label = self.labels[0]
+        parent = self.parents[0]
+        marked = set()
+
+        for s, t in sources.items():
+            if t > label[s]:
+                label[s] = t
+                parent.pop(s, None)
+                marked.add(s)
+
+        self._relax_transfers(marked, label, parent)
+        touched = set(marked)
+
+        for k in range(1, self.max_trips + 1):
+            if not marked:
+                break
+
+            prev = self.labels[k - 1]
+            label = self.labels[k]
+            parent = self.parents[k]
+
+            for s in touched:
+                if prev[s] > label[s]:
+                    label[s] = prev[s]
+                    parent.pop(s, None)
+
+            # pattern -> latest position of a marked stop on it
+            queue = {}
+            for s in marked:
+                for p, pos in self.tt.patterns_at(s):
+                    if self.active_patterns is not None and not self.active_patterns[p]:
+                        continue
+                    if pos > queue.get(p, -1):
+                        queue[p] = pos
+
+            marked = set()
+            for p, end in queue.items():
+                self._scan_pattern(p, end, prev, label, parent, marked)
+
+            self._relax_transfers(marked, label, parent)
+            touched |= marked
+
+        return self
+
+    def _bound(self, label):
+        bound = -INF
+        for s in self.targets:
+            if label[s] > bound:
+                bound = label[s]
+        return bound
+
+    def _scan_pattern(self, p, end, prev, label, parent, marked):
+        tt = self.tt
+        active = self.active
+        seq = tt.pattern_stop_list(p).tolist()
+        trips = tt.pattern_trip_list(p)
+        n_p = len(seq)
+        n_trips = len(trips)
+        base = int(tt.pattern_time_start[p])
+        bound = self._bound(label)
+
+        trip_j = -1
+        row_arr = row_dep = None
+        alight_pos = alight_stop = -1
+
+        for i in range(end, -1, -1):
+            s = seq[i]
+
+            if trip_j >= 0:
+                d = row_dep[i]
+                if d > label[s] and d > bound:
+                    label[s] = d
+                    parent[s] = (TRIP, int(trips[trip_j]), i, alight_pos, alight_stop)
+                    marked.add(s)
+                    if s in self.target_set:
+                        bound = d
+
+            t_prev = prev[s]
+            if t_prev <= -INF or (trip_j >= 0 and t_prev < row_arr[i]):
+                continue
+
+            col = tt.arr[base + i:base + n_trips * n_p:n_p]
+            j = int(np.searchsorted(col, t_prev, side="right")) - 1
+            if active is not None:
+                while j >= 0 and not active[trips[j]]:
+                    j -= 1
+            if j >= 0 and j > trip_j:
+                trip_j = j
+                off = base + j * n_p
+                row_arr = tt.arr[off:off + n_p].tolist()
+                row_dep = tt.dep[off:off + n_p].tolist()
+                alight_pos = i
+                alight_stop = s
+
+    def _relax_transfers(self, marked, label, parent):
+        bound = self._bound(label)
+        for s in list(marked):
+            t0 = label[s]
+            for to, secs, dist in self.tt.transfers_from(s):
+                d = t0 - secs
+                if d > label[to] and d > bound:
+                    label[to] = d
+                    parent[to] = (WALK, s, secs, dist)
+                    marked.add(to)
+                    if to in self.target_set:
+                        bound = d
+
+    def departure(self, targets=None):
+        # (departure, round, stop) of the latest departure from any target,
+        # preferring fewer trips on ties
+        found = None
+        for k, label in enumerate(self.labels):
+            for s in targets if targets is not None else self.targets:
+                if label[s] > -INF and (found is None or label[s] > found[0]):
+                    found = (label[s], k, s)
+        return found
+
+    def journey(self, stop, k):
+        """Legs leaving ``stop`` in round ``k``, in travel order."""
+        legs = []
+        s = stop
+        while k >= 0:
+            par = self.parents[k].get(s)
+            if par is None:
+                if k == 0:
+                    break
+                k -= 1
+                continue
+            if par[0] == WALK:
+                _, to_stop, secs, dist = par
+                start = self.labels[k][s]
+                legs.append((WALK, s, to_stop, start, start + secs, dist))
+                s = to_stop
+                continue
+            _, trip, board_pos, alight_pos, alight_stop = par
+            legs.append((TRIP, trip, board_pos, alight_pos))
+            s = alight_stop
+            k -= 1
+
+        # labels time each walk as late as possible; report it as starting
+        # on arrival instead, like the forward search does
+        prev_end = None
+        for i, leg in enumerate(legs):
+            if leg[0] == WALK:
+                if prev_end is not None:
+                    _, a, b, start, end, dist = leg
+                    legs[i] = (WALK, a, b, prev_end, prev_end + end - start, dist)
+                prev_end = legs[i][4]
+            else:
+                prev_end = int(self.tt.trip_times(leg[1])[0][leg[3]])
+        return legs
+
+
+def reverse_raptor(tt, sources, max_trips, targets=(), active=None, active_patterns=None):
+    search = ReverseRaptorSearch(
+        tt, max_trips, targets=targets, active=active, active_patterns=active_patterns
+    )
+    return search.run(sources)
+
+
+# -----------------------------
+# Range queries (rRAPTOR)
+# -----------------------------
+
+def origin_departures(tt, origins, start, end, active=None):
+    """Distinct trip departure times from ``origins`` within [start, end]."""
+    times = set()
+    for s in origins:
+        for p, pos in tt.patterns_at(s):
+            col = tt.departures(p, pos)
+            lo = int(np.searchsorted(col, start, side="left"))
+            hi = int(np.searchsorted(col, end, side="right"))
+            if active is None:
+                times.update(col[lo:hi].tolist())
+            else:
+                trips = tt.pattern_trip_list(p)
+                times.update(
+                    t for t, trip in zip(col[lo:hi].tolist(), trips[lo:hi].tolist())
+                    if active[trip]
+                )
+    return sorted(times)
+
+
+def range_search(tt, origins, targets, start, end, max_trips, active=None, active_patterns=None):
+    """
+    Every Pareto-optimal (departure, arrival, trips) journey departing from
+    ``origins`` within [start, end], as ``(departure, arrival, k, legs)``.
+
+    Departures are processed latest first over one ``RaptorSearch`` so the
+    labels of later departures bound (and prune) the earlier ones.
+    """
+    search = RaptorSearch(
+        tt, max_trips, targets=targets, active=active, active_patterns=active_patterns
+    )
+    journeys = []
+
+    for dep in reversed(origin_departures(tt, origins, start, end, active)):
+        before = search.target_labels()
+        search.run({s: dep for s in origins})
+        after = search.target_labels()
+
+        for k in range(1, max_trips + 1):
+            if after[k] < before[k] and after[k] < after[k - 1]:
+                legs = search.journey(search.best_target(k), k)
+                journeys.append((dep, after[k], k, legs))
+
+    pareto = []
+    for j in sorted(journeys, key=lambda j: (-j[0], j[1], j[2])):
+        if any(o[1] <= j[1] and o[2] <= j[2] for o in pareto):
+            continue
+        pareto.append(j)
+
+    pareto.sort(key=lambda j: (j[0], j[1]))
+    return pareto
+
+
+# -----------------------------
+# Multi-criteria search (McRAPTOR)
+# -----------------------------
+
+# A label is (arrival, walk_m, trips, stop, leg, prev_label); a stop's bag
+# keeps the labels no other label beats on all three criteria.
+MAX_BAG_SIZE = 8
+
+
+def _dominated(bag, a, w):
+    for label in bag:
+        if label[0] <= a and label[1] <= w:
+            return True
+    return False
+
+
+def mc_raptor(tt, sources, max_trips, targets, active=None, active_patterns=None,
+              max_bag=MAX_BAG_SIZE):
+    """
+    Pareto set of (arrival, trips, walking metres) journeys to ``targets``.
+
+    Bags are pruned against the labels already reaching any target (target
+    pruning) and capped at ``max_bag`` labels per stop and round, keeping
+    the earliest arrivals, so the search stays bounded on dense timetables.
+    Returns ``(arrival, trips, walk_m, legs)`` tuples, earliest first.
+    """
+    target_set = set(targets)
+    best = {}
+    target_bag = []
+
+    def add(bag_new, s, a, w, k, leg, prev):
+        if _dominated(target_bag, a, w):
+            return False
+        bag = best.setdefault(s, [])
+        if _dominated(bag, a, w):
+            return False
+
+        cur = bag_new.setdefault(s, [])
+        if len(cur) >= max_bag:
+            worst = max(cur, key=lambda lb: lb[0])
+            if worst[0] <= a:
+                return False
+            cur.remove(worst)
+            bag.remove(worst)
+
+        label = (a, w, k, s, leg, prev)
+        # drop same-round labels the new one beats
+        for old in [lb for lb in cur if a <= lb[0] and w <= lb[1]]:
+            cur.remove(old)
+            bag.remove(old)
+        cur.append(label)
+        bag.append(label)
+        if s in target_set:
+            # earlier rounds' target labels take fewer trips: keep them
+            # unless the new label beats them on trips as well
+            target_bag[:] = [
+                lb for lb in target_bag if not (a <= lb[0] and w <= lb[1] and k <= lb[2])
+            ]
+            target_bag.append(label)
+        return True
+
+    new = {}
+    for s, t in sources.items():
+        add(new, s, t, 0, 0, None, None)
+    _mc_transfers(tt, new, add, 0)
+
+    for k in range(1, max_trips + 1):
+        if not new:
+            break
+
+        queue = _pattern_queue(tt, new, active_patterns)
+
+        prev_bags = new
+        new = {}
+
+        for p, start in queue.items():
+            seq = tt.pattern_stop_list(p).tolist()
+            trips = tt.pattern_trip_list(p)
+            n_p = len(seq)
+            n_trips = len(trips)
+            base = int(tt.pattern_time_start[p])
+
+            # route bag: (trip_j, row_arr, board_pos, source_label)
+            route_bag = []
+
+            for i in range(start, n_p):
+                s = seq[i]
+
+                for trip_j, row_arr, board_pos, src in route_bag:
+                    leg = (TRIP, int(trips[trip_j]), board_pos, i)
+                    add(new, s, row_arr[i], src[1], k, leg, src)
+
+                for src in prev_bags.get(s, ()):
+                    col = tt.dep[base + i:base + n_trips * n_p:n_p]
+                    j = int(np.searchsorted(col, src[0], side="left"))
+                    if active is not None:
+                        while j < n_trips and not active[trips[j]]:
+                            j += 1
+                    if j >= n_trips:
+                        continue
+                    if any(rj <= j and rs[1] <= src[1] for rj, _, _, rs in route_bag):
+                        continue
+                    route_bag = [
+                        r for r in route_bag if not (j <= r[0] and src[1] <= r[3][1])
+                    ]
+                    off = base + j * n_p
+                    route_bag.append((j, tt.arr[off:off + n_p].tolist(), i, src))
+
+        _mc_transfers(tt, new, add, k)
+
+    journeys = []
+    for label in sorted(target_bag, key=lambda lb: (lb[0], lb[2], lb[1])):
+        if any(o[0] <= label[0] and o[2] <= label[2] and o[1] <= label[1] for o in journeys):
+            continue
+        journeys.append(label)
+
+    return [(lb[0], lb[2], lb[1], _mc_legs(lb)) for lb in journeys]
+
+
+def _mc_transfers(tt, new, add, k):
+    for s, bag in list(new.items()):
+        for label in list(bag):
+            if label[4] is not None and label[4][0] == WALK:
+                continue
+            for to, secs, dist in tt.transfers_from(s):
+                leg = (WALK, s, to, label[0], label[0] + secs, dist)
+                add(new, to, label[0] + secs, label[1] + dist, k, leg, label)
+
+
+def _mc_legs(label):
+    legs = []
+    while label is not None and label[4] is not None:
+        legs.append(label[4])
+        label = label[5]
+    legs.reverse()
+    return legs
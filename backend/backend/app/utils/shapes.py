@@ -0,0 +1,112 @@
+from itertools import groupby
+from math import cos, radians
+
+import numpy as np
+
+from ..models import BusStop, BusStopTime, Shape, StopTime, Stops, Trip
+
+
+CHUNK = 2000
+
+
+def load_shapes():
+    """shape_id -> (lats, lons) in shape_pt_sequence order."""
+    points = {}
+    rows = Shape.objects.order_by("shape_id", "shape_pt_sequence").values_list(
+        "shape_id", "shape_pt_lat", "shape_pt_lon"
+    )
+    for shape_id, lat, lon in rows.iterator(chunk_size=5000):
+        entry = points.setdefault(shape_id, ([], []))
+        entry[0].append(lat)
+        entry[1].append(lon)
+    return {
+        shape_id: (np.array(lats, dtype=np.float64), np.array(lons, dtype=np.float64))
+        for shape_id, (lats, lons) in points.items()
+    }
+
+
+def project_stops(lats, lons, stop_lats, stop_lons):
+    """
+    Index of the shape segment (points i, i + 1) each stop lies on.
+
+    Stops are taken in travel order and each one is matched to the nearest
+    segment at or after the previous stop's, so loops and out-and-back
+    shapes cannot send a stop to the wrong pass over the same street.
+    """
+    if len(lats) < 2:
+        return [0] * len(stop_lats)
+
+    # equirectangular plane; plenty at city scale
+    scale = cos(radians(float(np.mean(lats))))
+    ax, ay = lons[:-1] * scale, lats[:-1]
+    dx, dy = lons[1:] * scale - ax, lats[1:] - ay
+    length2 = dx * dx + dy * dy
+    length2[length2 == 0] = 1e-18
+
+    found = []
+    lo = 0
+    for slat, slon in zip(stop_lats, stop_lons):
+        px, py = slon * scale, slat
+        t = ((px - ax[lo:]) * dx[lo:] + (py - ay[lo:]) * dy[lo:]) / length2[lo:]
+        np.clip(t, 0.0, 1.0, out=t)
+        qx = ax[lo:] + t * dx[lo:] - px
+        qy = ay[lo:] + t * dy[lo:] - py
+        lo += int(np.argmin(qx * qx + qy * qy))
+        found.append(lo)
+    return found
+
+
+def project_stop_times(bus=False):
+    """
+    Store on every StopTime (BusStopTime with ``bus``) the shape segment its
+    stop projects onto, so planned legs can be cut from the shape without
+    searching it again. Returns the number of rows updated.
+    """
+    if bus:
+        model, stop_field = BusStopTime, "bus_stop_id"
+        stops = BusStop.objects.values_list("bus_stop_id", "stop_lat", "stop_lon")
+    else:
+        model, stop_field = StopTime, "stops_id"
+        stops = Stops.objects.values_list("id", "stop_lat", "stop_lon")
+
+    shapes = load_shapes()
+    trip_shape = dict(Trip.objects.values_list("trip_id", "shape_id__shape_id"))
+    coords = {pk: (lat, lon) for pk, lat, lon in stops}
+
+    # trips of one pattern share shape and stops: project once
+    projected = {}
+    batch = []
+    updated = 0
+
+    rows = model.objects.order_by("trip_id", "stop_sequence").values_list(
+        "id", "trip_id", stop_field
+    )
+    for trip_id, group in groupby(rows.iterator(chunk_size=5000), key=lambda r: r[1]):
+        group = list(group)
+        shape_id = trip_shape.get(trip_id)
+        if shape_id not in shapes:
+            continue
+
+        stop_ids = tuple(r[2] for r in group)
+        key = (shape_id, stop_ids)
+        if key not in projected:
+            lats, lons = shapes[shape_id]
+            projected[key] = project_stops(
+                lats, lons,
+                [coords[s][0] for s in stop_ids],
+                [coords[s][1] for s in stop_ids],
+            )
+
+        for (pk, _, _), index in zip(group, projected[key]):
+            batch.append(model(id=pk, shape_pt_index=index))
+
+        if len(batch) >= CHUNK:
+            model.objects.bulk_update(batch, ["shape_pt_index"])
+            updated += len(batch)
+            batch = []
+
+    if batch:
+        model.objects.bulk_update(batch, ["shape_pt_index"])
+        updated += len(batch)
+
+    return updated
@@ -0,0 +1,61 @@
+from math import ceil, cos, floor, radians
+
+import numpy as np
+
+from .geo import METERS_PER_DEGREE, haversine
+
+
+class GridIndex:
+    """
+    Uniform lat/lon grid over a set of points for radius queries.
+
+    Cells are ``cell_m`` metres on a side (at the points' mean latitude), so
+    a query only visits the few cells around it instead of every point.
+    """
+
+    def __init__(self, lats, lons, cell_m):
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        mean_lat = float(self.lats.mean()) if len(self.lats) else 0.0
+        self.cell_lat = cell_m / METERS_PER_DEGREE
+        self.cell_lon = cell_m / (METERS_PER_DEGREE * max(cos(radians(mean_lat)), 0.01))
+        self.cell_m = cell_m
+
+        self.cells = {}
+        rows = np.floor(self.lats / self.cell_lat).astype(np.int64).tolist()
+        cols = np.floor(self.lons / self.cell_lon).astype(np.int64).tolist()
+        for i, key in enumerate(zip(rows, cols)):
+            self.cells.setdefault(key, []).append(i)
+
+    def near(self, lat, lon, radius_m):
+        """``(index, metres)`` of every point within ``radius_m``, nearest first."""
+        reach = max(int(ceil(radius_m / self.cell_m)), 1)
+        row = int(np.floor(lat / self.cell_lat))
+        col = int(np.floor(lon / self.cell_lon))
+
+        found = []
+        for r in range(row - reach, row + reach + 1):
+            for c in range(col - reach, col + reach + 1):
+                for i in self.cells.get((r, c), ()):
+                    d = haversine(lat, lon, self.lats[i], self.lons[i])
+                    if d <= radius_m:
+                        found.append((i, d))
+        found.sort(key=lambda f: f[1])
+        return found
+
+    def within(self, south, west, north, east):
+        """Indexes of the points inside a lat/lon box."""
+        r0, r1 = floor(south / self.cell_lat), floor(north / self.cell_lat)
+        c0, c1 = floor(west / self.cell_lon), floor(east / self.cell_lon)
+        if (r1 - r0 + 1) * (c1 - c0 + 1) > len(self.cells):
+            # zoomed far out: cheaper to walk the occupied cells
+            keys = [k for k in self.cells if r0 <= k[0] <= r1 and c0 <= k[1] <= c1]
+        else:
+            keys = [(r, c) for r in range(r0, r1 + 1) for c in range(c0, c1 + 1)]
+
+        found = []
+        for key in keys:
+            for i in self.cells.get(key, ()):
+                if south <= self.lats[i] <= north and west <= self.lons[i] <= east:
+                    found.append(i)
+        return found
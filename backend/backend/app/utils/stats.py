@@ -0,0 +1,9 @@
+def percentile(values, q):
+    """``q``-th percentile of ``values`` (0-100), linearly interpolated; None if empty."""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    k = (len(ordered) - 1) * q / 100
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
@@ -0,0 +1,228 @@
+import re
+import threading
+from collections import namedtuple
+
+from django.db.models import Case, IntegerField, When
+
+from ..models import BusStop, Stops
+from .timetable import get_timetable
+
+
+# Words riders add to a station name that never distinguish two stations.
+NOISE_TOKENS = {"metro", "station", "stn", "stop", "the"}
+
+# Common alternative spellings -> name as stored in Stops.
+STOP_NAME_ALIASES = {
+    "cp": "rajiv chowk",
+    "connaught place": "rajiv chowk",
+    "kashmiri gate": "kashmere gate",
+    "ndls": "new delhi",
+    "new delhi railway station": "new delhi",
+    "airport": "igi airport",
+    "hauz khaz": "hauz khas",
+}
+
+MIN_SIMILARITY = 0.3
+
+StopMatch = namedtuple("StopMatch", "id stop_name stop_lat stop_lon line score")
+
+
+def normalize_name(name):
+    tokens = re.sub(r"[^a-z0-9]+", " ", str(name).lower()).split()
+    return " ".join(t for t in tokens if t not in NOISE_TOKENS)
+
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# -----------------------------
+# In-memory stop name index
+# -----------------------------
+
+class StopNameIndex:
+    """
+    Resolves free-text station names without touching the database.
+
+    Each distinct normalized name is one entry (Stops rows of the same
+    station on several lines share it). Bus stops are indexed too, unless
+    a metro station already has their name. Lookups try, in order: exact or
+    aliased name, word-prefix matches from a token trie, and trigram
+    similarity for typos.
+    """
+
+    def __init__(self, version=None):
+        self.version = version
+        self.names = []          # normalized name per entry
+        self.entries = []        # StopMatch (score 0) per entry
+        self.entry_ids = []      # every Stops id sharing the entry's name
+        self.by_name = {}        # normalized name -> entry
+        self.trie = {}           # token prefix trie, "$" -> entry ids
+        self.grams = {}          # trigram -> entry ids
+
+    @classmethod
+    def build(cls, version=None):
+        index = cls(version)
+        rows = Stops.objects.order_by("id").values_list(
+            "id", "stop_name", "stop_lat", "stop_lon", "line"
+        )
+        for pk, name, lat, lon, line in rows:
+            key = normalize_name(name)
+            if not key:
+                continue
+            if key in index.by_name:
+                index.entry_ids[index.by_name[key]].append(pk)
+                continue
+            e = len(index.names)
+            index.by_name[key] = e
+            index.names.append(key)
+            index.entries.append(StopMatch(pk, name, lat, lon, line, 0.0))
+            index.entry_ids.append([pk])
+            index._add_terms(e, key)
+
+        rows = BusStop.objects.order_by("bus_stop_id").values_list(
+            "bus_stop_id", "stop_name", "stop_lat", "stop_lon"
+        )
+        for bus_id, name, lat, lon in rows:
+            key = normalize_name(name)
+            if not key or key in index.by_name:
+                continue
+            e = len(index.names)
+            index.by_name[key] = e
+            index.names.append(key)
+            index.entries.append(StopMatch(bus_id, name, lat, lon, "BUS", 0.0))
+            index.entry_ids.append([])  # no Stops rows behind it
+            index._add_terms(e, key)
+
+        return index
+
+    def _add_terms(self, e, key):
+        for token in key.split():
+            node = self.trie
+            for ch in token:
+                node = node.setdefault(ch, {})
+            node.setdefault("$", set()).add(e)
+
+        for g in _trigrams(key):
+            self.grams.setdefault(g, set()).add(e)
+
+    def _prefix(self, token):
+        node = self.trie
+        for ch in token:
+            node = node.get(ch)
+            if node is None:
+                return set()
+        found = set()
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            for k, child in node.items():
+                if k == "$":
+                    found |= child
+                else:
+                    stack.append(child)
+        return found
+
+    def search(self, query, limit=10):
+        return [
+            self.entries[e]._replace(score=score)
+            for e, score in self._rank(query, limit)
+        ]
+
+    def search_ids(self, query, limit=None):
+        # Stops ids of every row behind the ranked matches (all of them by
+        # default), best match first
+        return [self.entry_ids[e] for e, _ in self._rank(query, limit) if self.entry_ids[e]]
+
+    def _rank(self, query, limit):
+        key = normalize_name(query)
+        if not key:
+            return []
+        key = STOP_NAME_ALIASES.get(key, key)
+
+        scores = {}
+        exact = self.by_name.get(key)
+        if exact is not None:
+            scores[exact] = 1.0
+
+        # every query word must prefix some word of the name
+        tokens = key.split()
+        matched = None
+        for token in tokens:
+            hits = self._prefix(token)
+            matched = hits if matched is None else matched & hits
+        for e in matched or ():
+            if e not in scores:
+                scores[e] = 0.9 - 0.4 * (1 - len(key) / max(len(self.names[e]), 1))
+
+        if limit is None or len(scores) < limit:
+            grams = _trigrams(key)
+            shared = {}
+            for g in grams:
+                for e in self.grams.get(g, ()):
+                    shared[e] = shared.get(e, 0) + 1
+            for e, n in shared.items():
+                if e in scores:
+                    continue
+                sim = n / (len(grams) + len(_trigrams(self.names[e])) - n)
+                if sim >= MIN_SIMILARITY:
+                    scores[e] = round(sim * 0.8, 4)
+
+        ranked = sorted(scores.items(), key=lambda kv: (-kv[1], self.names[kv[0]]))
+        return [(e, round(score, 4)) for e, score in ranked[:limit]]
+
+    def resolve(self, query):
+        matches = self.search(query, limit=1)
+        return matches[0] if matches else None
+
+
+# -----------------------------
+# Process-wide instance
+# -----------------------------
+
+_stop_index = None
+_stop_index_lock = threading.Lock()
+
+
+def get_stop_index():
+    """
+    The process-wide name index, rebuilt whenever the timetable version
+    changes: every Stops import publishes a new timetable, which all
+    processes see, and the index must map names to the same Stops ids.
+    """
+    global _stop_index
+
+    version = get_timetable().version
+    index = _stop_index
+    if index is not None and index.version == version:
+        return index
+
+    with _stop_index_lock:
+        index = _stop_index
+        if index is None or index.version != version:
+            index = StopNameIndex.build(version)
+            _stop_index = index
+    return index
+
+
+def invalidate_stop_index():
+    # other processes follow the timetable version (see get_stop_index)
+    global _stop_index
+    with _stop_index_lock:
+        _stop_index = None
+
+
+def search_stops_queryset(queryset, query):
+    """Restrict a Stops queryset to names matching ``query``, best match first."""
+    ranked = get_stop_index().search_ids(query)
+    if not ranked:
+        return queryset.none()
+
+    return queryset.filter(id__in=[pk for ids in ranked for pk in ids]).order_by(
+        Case(
+            *[When(id__in=ids, then=rank) for rank, ids in enumerate(ranked)],
+            output_field=IntegerField(),
+        ),
+        "stop_id",
+    )
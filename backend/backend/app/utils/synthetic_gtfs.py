@@ -0,0 +1,146 @@
+import csv
+import os
+from datetime import date
+
+from ..models import Stops
+from .stop_index import invalidate_stop_index
+
+
+# A 1x feed is roughly DMRC sized: 10 lines of 25 stations, a train every
+# 5 minutes each way from 06:00 to 23:00 (~100k stop_times).
+DISTRICT_LINES = 10
+STATIONS_PER_LINE = 25
+HEADWAY_SECONDS = 300
+SERVICE_START_HOUR = 6
+SERVICE_END_HOUR = 23
+RUN_SECONDS = 150
+DWELL_SECONDS = 30
+
+BASE_LAT = 28.40
+BASE_LON = 76.80
+SPACING_DEG = 0.01
+
+SERVICE_ID = "DAILY"
+SERVICE_START_DATE = date(2026, 1, 1)
+SERVICE_END_DATE = date(2026, 12, 31)
+
+
+def _fmt(seconds):
+    return f"{seconds // 3600:02}:{seconds % 3600 // 60:02}:{seconds % 60:02}"
+
+
+def synthetic_lines(scale=1, stations_per_line=STATIONS_PER_LINE):
+    """
+    Line layouts for a feed ``scale`` times the base size, as
+    ``{line_id: [(x, y), ...]}`` grid positions in travel order.
+
+    Each district is a grid of horizontal and vertical lines crossing at
+    interchanges; district ``d`` is shifted so its horizontal lines start
+    where district ``d - 1``'s end, which keeps the whole network connected.
+    """
+    n = stations_per_line
+    half = DISTRICT_LINES // 2
+    gap = max(n // half, 1)
+    lines = {}
+    for d in range(scale):
+        x0 = d * (n - 1)
+        for i in range(half):
+            row = i * gap
+            lines[f"D{d:03}H{i}"] = [(x0 + x, row) for x in range(n)]
+        for i in range(DISTRICT_LINES - half):
+            col = x0 + i * gap + gap // 2
+            lines[f"D{d:03}V{i}"] = [(col, y) for y in range(n)]
+    return lines
+
+
+def create_stops(lines):
+    """Replace the Stops table with one row per (station, line)."""
+    lines_at = {}
+    for line_id, points in lines.items():
+        for point in points:
+            lines_at.setdefault(point, []).append(line_id)
+
+    rows = []
+    for line_id, points in lines.items():
+        for x, y in points:
+            shared = lines_at[(x, y)]
+            rows.append(Stops(
+                stop_id=f"{line_id}_{x}_{y}",
+                station_code=f"S{x}_{y}",
+                stop_name=f"Station {x}-{y}",
+                line=line_id,
+                interchange=len(shared) > 1,
+                interchange_between=",".join(shared) if len(shared) > 1 else None,
+                stop_lat=BASE_LAT + y * SPACING_DEG,
+                stop_lon=BASE_LON + x * SPACING_DEG,
+            ))
+
+    Stops.objects.all().delete()
+    Stops.objects.bulk_create(rows, batch_size=5000)
+    invalidate_stop_index()
+    return len(rows)
+
+
+def write_gtfs(gtfs_dir, lines, headway=HEADWAY_SECONDS,
+               start_hour=SERVICE_START_HOUR, end_hour=SERVICE_END_HOUR):
+    """Write routes, shapes, trips, stop_times and calendar for ``lines``."""
+    os.makedirs(gtfs_dir, exist_ok=True)
+
+    def writer(name, header):
+        f = open(os.path.join(gtfs_dir, name), "w", newline="", encoding="utf-8")
+        w = csv.writer(f)
+        w.writerow(header)
+        return f, w
+
+    routes_f, routes = writer("routes.txt", ["route_id", "route_short_name", "route_long_name"])
+    shapes_f, shapes = writer("shapes.txt", ["shape_id", "shape_pt_lat", "shape_pt_lon", "shape_pt_sequence"])
+    trips_f, trips = writer("trips.txt", ["route_id", "service_id", "trip_id", "shape_id"])
+    st_f, stop_times = writer(
+        "stop_times.txt", ["trip_id", "arrival_time", "departure_time", "stop_id", "stop_sequence"]
+    )
+    n_stop_times = 0
+
+    try:
+        for line_id, points in lines.items():
+            routes.writerow([line_id, line_id, f"GREY_Line {line_id}"])
+
+            for direction, seq in ((0, points), (1, points[::-1])):
+                shape_id = f"{line_id}_{direction}"
+                for k, (x, y) in enumerate(seq):
+                    shapes.writerow([
+                        shape_id,
+                        f"{BASE_LAT + y * SPACING_DEG:.6f}",
+                        f"{BASE_LON + x * SPACING_DEG:.6f}",
+                        k,
+                    ])
+
+                t = start_hour * 3600
+                n = 0
+                while t < end_hour * 3600:
+                    trip_id = f"{line_id}_{direction}_{n}"
+                    trips.writerow([line_id, SERVICE_ID, trip_id, shape_id])
+                    for k, (x, y) in enumerate(seq):
+                        arr = t + k * (RUN_SECONDS + DWELL_SECONDS)
+                        stop_times.writerow([
+                            trip_id, _fmt(arr), _fmt(arr + DWELL_SECONDS),
+                            f"{line_id}_{x}_{y}", k + 1,
+                        ])
+                    n_stop_times += len(seq)
+                    t += headway
+                    n += 1
+    finally:
+        for f in (routes_f, shapes_f, trips_f, st_f):
+            f.close()
+
+    with open(os.path.join(gtfs_dir, "calendar.txt"), "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow([
+            "service_id", "monday", "tuesday", "wednesday", "thursday", "friday",
+            "saturday", "sunday", "start_date", "end_date",
+        ])
+        w.writerow([
+            SERVICE_ID, 1, 1, 1, 1, 1, 1, 1,
+            SERVICE_START_DATE.strftime("%Y%m%d"), SERVICE_END_DATE.strftime("%Y%m%d"),
+        ])
+
+    return n_stop_times
@@ -0,0 +1,937 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from datetime import date
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from itertools import chain
+
+from ..models import Stops, BusStop, Trip, StopTime, BusStopTime, Calendar, CalendarDate
+from .geo import WALK_SPEED_MPS, haversine, haversine_np
+from .shapes import load_shapes
+from .spatial import GridIndex
+
+
+logger = logging.getLogger(__name__)
+
+TIMETABLE_VERSION_KEY = "gtfs_timetable_version"
+
+# Walking time between two platforms (Stops rows) of the same station.
+INTERCHANGE_SECONDS = 180
+
+# Walking footpaths from a bus stop to nearby bus stops and metro Stops;
+# capped per stop so dense bus corridors don't blow up the search graph.
+MAX_WALK_METERS = 400
+MAX_FOOTPATHS_PER_STOP = 8
+
+# Service days whose active-trip masks are kept per timetable.
+SERVICE_DAY_CACHE = 8
+
+# time_key = trip block start * TIME_KEY_SPAN + departure; larger than any
+# GTFS time, so keys of one trip never reach into the next trip's block.
+TIME_KEY_SPAN = 1 << 20
+
+# Width of the time buckets indexing which trips are on the move.
+ACTIVE_BUCKET_SECONDS = 300
+
+# On-disk snapshots (settings.TIMETABLE_SNAPSHOT_DIR): one directory per
+# version plus a CURRENT file naming the live one, checked at most this often.
+SNAPSHOT_POINTER = "CURRENT"
+SNAPSHOT_META = "meta.json"
+SNAPSHOTS_KEPT = 2
+SNAPSHOT_CHECK_SECONDS = 1.0
+
+# Only the holder of the build lock builds a missing snapshot; the other
+# processes poll for its pointer, and a lock this old is taken as abandoned.
+SNAPSHOT_BUILD_LOCK = ".build.lock"
+SNAPSHOT_BUILD_SECONDS = 600
+SNAPSHOT_POLL_SECONDS = 0.2
+
+# Plain-Python fields written to meta.json; every ndarray gets its own .npy.
+_META_FIELDS = (
+    "stop_ids", "n_metro_stops", "stop_name", "stop_code",
+    "route_ids", "route_names", "trip_ids", "service_ids", "shape_ids",
+)
+
+
+def parse_gtfs_time(t):
+    if not t or ":" not in t:
+        return -1
+    try:
+        h, m, s = map(int, t.split(":"))
+        return h * 3600 + m * 60 + s
+    except ValueError:
+        return -1
+
+
+def format_gtfs_time(seconds):
+    # inverse of parse_gtfs_time; hours run past 24 like the feed's
+    return f"{seconds // 3600:02}:{seconds % 3600 // 60:02}:{seconds % 60:02}"
+
+
+def _csr(groups, size, dtype=np.int32):
+    # groups: list (len == size) of lists -> (start offsets, flat values)
+    start = np.zeros(size + 1, dtype=np.int32)
+    for i, g in enumerate(groups):
+        start[i + 1] = start[i] + len(g)
+    flat = np.fromiter(
+        (v for g in groups for v in g), dtype=dtype, count=int(start[-1])
+    )
+    return start, flat
+
+
+# -----------------------------
+# In-memory timetable index
+# -----------------------------
+
+class Timetable:
+    """
+    Compact, read-only view of the GTFS timetable used by the planner.
+
+    Stops, trips and routes are addressed by dense integer indexes; metro
+    ``Stops`` rows come first, followed by ``BusStop`` rows. Trips
+    with an identical stop sequence on the same route form a pattern; the
+    stop times of a pattern are stored trip-major in the flat ``arr``/``dep``
+    arrays, trips ordered by their first departure.
+    """
+
+    def __init__(self, version=None):
+        self.version = version
+
+        # stops: Stops pk (metro) or BusStop id per stop index
+        self.stop_ids = []
+        self.n_metro_stops = 0
+        self.stop_lat = np.zeros(0, dtype=np.float64)
+        self.stop_lon = np.zeros(0, dtype=np.float64)
+        self.stop_name = []
+        self.stop_code = []
+        self.stop_index = {}
+
+        # routes / trips
+        self.route_ids = []
+        self.route_names = []
+        self.route_type = np.zeros(0, dtype=np.int32)
+        self.trip_ids = []
+        self.trip_route = np.zeros(0, dtype=np.int32)
+        self.trip_pattern = np.zeros(0, dtype=np.int32)
+        self.trip_time_start = np.zeros(0, dtype=np.int32)
+
+        # service calendar: weekday bits (Mon = bit 0) and date range per
+        # service, plus calendar_dates exceptions {date: {service: type}};
+        # services with neither run every day
+        self.service_ids = []
+        self.trip_service = np.zeros(0, dtype=np.int32)
+        self.service_has_calendar = np.zeros(0, dtype=bool)
+        self.service_weekdays = np.zeros(0, dtype=np.uint8)
+        self.service_start = []
+        self.service_end = []
+        self.service_exceptions = {}
+        self._service_days = {}
+
+        # patterns
+        self.pattern_route = np.zeros(0, dtype=np.int32)
+        self.pattern_stop_start = np.zeros(1, dtype=np.int32)
+        self.pattern_stops = np.zeros(0, dtype=np.int32)
+        self.pattern_trip_start = np.zeros(1, dtype=np.int32)
+        self.pattern_trips = np.zeros(0, dtype=np.int32)
+        self.pattern_time_start = np.zeros(1, dtype=np.int32)
+        self.arr = np.zeros(0, dtype=np.int32)
+        self.dep = np.zeros(0, dtype=np.int32)
+
+        # per trip: first departure and last arrival; parallel to arr/dep:
+        # sorted (trip, departure) keys, see TIME_KEY_SPAN
+        self.trip_first_dep = np.zeros(0, dtype=np.int32)
+        self.trip_last_arr = np.zeros(0, dtype=np.int32)
+        self.time_key = np.zeros(0, dtype=np.int64)
+
+        # bucket b -> trips running at some point in [b, b + 1) * ACTIVE_BUCKET_SECONDS
+        self.active_bucket_start = np.zeros(1, dtype=np.int32)
+        self.active_bucket_trips = np.zeros(0, dtype=np.int32)
+
+        # stop -> (pattern, position in pattern)
+        self.stop_pattern_start = np.zeros(1, dtype=np.int32)
+        self.stop_patterns = np.zeros(0, dtype=np.int32)
+        self.stop_pattern_pos = np.zeros(0, dtype=np.int32)
+
+        # stations: Stops rows grouped by station_code / interchange name
+        self.stop_station = np.zeros(0, dtype=np.int32)
+        self.station_start = np.zeros(1, dtype=np.int32)
+        self.station_stops = np.zeros(0, dtype=np.int32)
+
+        # shape geometry: points per shape, each trip's shape (-1 if none)
+        # and, parallel to arr/dep, the shape segment each stop projects onto
+        self.shape_ids = []
+        self.shape_start = np.zeros(1, dtype=np.int32)
+        self.shape_lat = np.zeros(0, dtype=np.float64)
+        self.shape_lon = np.zeros(0, dtype=np.float64)
+        self.trip_shape = np.zeros(0, dtype=np.int32)
+        self.shape_pos = np.zeros(0, dtype=np.int32)
+
+        # metres along the shapes, cumulative over all of them (no jump
+        # between one shape and the next), and parallel to arr/dep the
+        # distance at which each stop sits on its trip's shape (NaN if none)
+        self.shape_dist = np.zeros(0, dtype=np.float64)
+        self.time_shape_dist = np.zeros(0, dtype=np.float64)
+
+        # footpaths: stop -> (stop, seconds, metres)
+        self.transfer_start = np.zeros(1, dtype=np.int32)
+        self.transfer_to = np.zeros(0, dtype=np.int32)
+        self.transfer_secs = np.zeros(0, dtype=np.int32)
+        self.transfer_dist = np.zeros(0, dtype=np.int32)
+
+    @property
+    def n_stops(self):
+        return len(self.stop_ids)
+
+    @property
+    def n_patterns(self):
+        return len(self.pattern_route)
+
+    # -----------------------------
+    # Build
+    # -----------------------------
+
+    @classmethod
+    def build(cls, version=None):
+        tt = cls(version)
+
+        stop_rows = list(
+            Stops.objects.order_by("id").values_list(
+                "id", "stop_name", "station_code", "stop_lat", "stop_lon", "interchange"
+            )
+        )
+        tt.n_metro_stops = len(stop_rows)
+        # bus stops: string ids never collide with the integer Stops pks
+        stop_rows += [
+            (bus_id, name, "", lat, lon, False)
+            for bus_id, name, lat, lon in BusStop.objects.order_by("bus_stop_id").values_list(
+                "bus_stop_id", "stop_name", "stop_lat", "stop_lon"
+            )
+        ]
+        tt.stop_ids = [r[0] for r in stop_rows]
+        tt.stop_name = [r[1] for r in stop_rows]
+        tt.stop_code = [(r[2] or "").strip() for r in stop_rows]
+        tt.stop_lat = np.array([r[3] or 0.0 for r in stop_rows], dtype=np.float64)
+        tt.stop_lon = np.array([r[4] or 0.0 for r in stop_rows], dtype=np.float64)
+        tt.stop_index = {pk: i for i, pk in enumerate(tt.stop_ids)}
+
+        route_index = {}
+        service_index = {}
+        trip_route_of = {}
+        trip_service_of = {}
+        trip_shape_of = {}
+        route_type = []
+        for trip_id, route_id, long_name, rtype, service_id, shape_id in Trip.objects.values_list(
+            "trip_id", "route_id", "route__route_long_name", "route__route_type",
+            "service_id", "shape_id__shape_id",
+        ):
+            if route_id not in route_index:
+                route_index[route_id] = len(tt.route_ids)
+                tt.route_ids.append(route_id)
+                tt.route_names.append(long_name or "")
+                route_type.append(rtype)
+            if service_id not in service_index:
+                service_index[service_id] = len(tt.service_ids)
+                tt.service_ids.append(service_id)
+            trip_route_of[trip_id] = route_index[route_id]
+            trip_service_of[trip_id] = service_index[service_id]
+            trip_shape_of[trip_id] = shape_id
+
+        tt.route_type = np.array(route_type, dtype=np.int32)
+        tt._build_calendar(service_index)
+
+        # trip_id -> (stops, arrivals, departures, shape segments), in stop_sequence order
+        trips = {}
+        rows = StopTime.objects.order_by("trip_id", "stop_sequence").values_list(
+            "trip_id", "stops_id", "arrival_seconds", "departure_seconds",
+            "arrival_time", "departure_time", "shape_pt_index",
+        )
+        bus_rows = BusStopTime.objects.order_by("trip_id", "stop_sequence").values_list(
+            "trip_id", "bus_stop_id", "arrival_seconds", "departure_seconds",
+            "arrival_time", "departure_time", "shape_pt_index",
+        )
+        for trip_id, stop_pk, arr_sec, dep_sec, arr_t, dep_t, shape_idx in chain(
+            rows.iterator(chunk_size=5000), bus_rows.iterator(chunk_size=5000)
+        ):
+            s = tt.stop_index.get(stop_pk)
+            if s is None or trip_id not in trip_route_of:
+                continue
+            # rows imported before the integer columns existed
+            if arr_sec is None:
+                arr_sec = parse_gtfs_time(arr_t)
+            if dep_sec is None:
+                dep_sec = parse_gtfs_time(dep_t)
+            if arr_sec < 0:
+                arr_sec = dep_sec
+            if dep_sec < 0:
+                dep_sec = arr_sec
+            if dep_sec < 0:
+                continue
+            entry = trips.setdefault(trip_id, ([], [], [], []))
+            entry[0].append(s)
+            entry[1].append(arr_sec)
+            entry[2].append(dep_sec)
+            entry[3].append(-1 if shape_idx is None else shape_idx)
+
+        patterns = {}
+        for trip_id, (seq, arrs, deps, shape_idx) in trips.items():
+            if len(seq) < 2:
+                continue
+            key = (trip_route_of[trip_id], tuple(seq))
+            patterns.setdefault(key, []).append((deps[0], trip_id, arrs, deps, shape_idx))
+
+        pattern_stops, pattern_trips = [], []
+        pattern_route = []
+        arr_blocks, dep_blocks, shape_blocks = [], [], []
+        trip_route, trip_pattern, trip_time_start, trip_service = [], [], [], []
+        offset = 0
+        time_starts = [0]
+
+        for (route_idx, seq), members in patterns.items():
+            members.sort(key=lambda m: m[0])
+            p = len(pattern_route)
+            pattern_route.append(route_idx)
+            pattern_stops.append(seq)
+            trip_idx = []
+            for _, trip_id, arrs, deps, shape_idx in members:
+                t = len(tt.trip_ids)
+                tt.trip_ids.append(trip_id)
+                trip_route.append(route_idx)
+                trip_service.append(trip_service_of[trip_id])
+                trip_pattern.append(p)
+                trip_time_start.append(offset)
+                trip_idx.append(t)
+                arr_blocks.append(arrs)
+                dep_blocks.append(deps)
+                shape_blocks.append(shape_idx)
+                offset += len(seq)
+            pattern_trips.append(trip_idx)
+            time_starts.append(offset)
+
+        tt.pattern_route = np.array(pattern_route, dtype=np.int32)
+        tt.pattern_stop_start, tt.pattern_stops = _csr(pattern_stops, len(pattern_stops))
+        tt.pattern_trip_start, tt.pattern_trips = _csr(pattern_trips, len(pattern_trips))
+        tt.pattern_time_start = np.array(time_starts, dtype=np.int32)
+        tt.arr = np.fromiter((v for b in arr_blocks for v in b), dtype=np.int32, count=offset)
+        tt.dep = np.fromiter((v for b in dep_blocks for v in b), dtype=np.int32, count=offset)
+        tt.trip_route = np.array(trip_route, dtype=np.int32)
+        tt.trip_pattern = np.array(trip_pattern, dtype=np.int32)
+        tt.trip_time_start = np.array(trip_time_start, dtype=np.int32)
+        tt.trip_service = np.array(trip_service, dtype=np.int32)
+        tt.shape_pos = np.fromiter((v for b in shape_blocks for v in b), dtype=np.int32, count=offset)
+
+        # trips are numbered in arr/dep order, so their blocks are consecutive
+        n_trip_stops = tt.trip_stop_counts()
+        tt.trip_first_dep = tt.dep[tt.trip_time_start]
+        tt.trip_last_arr = tt.arr[tt.trip_time_start + n_trip_stops - 1]
+        tt.time_key = (
+            np.repeat(tt.trip_time_start.astype(np.int64), n_trip_stops) * TIME_KEY_SPAN + tt.dep
+        )
+        tt._build_active_buckets()
+        tt._build_shapes([trip_shape_of[trip_id] for trip_id in tt.trip_ids])
+
+        by_stop = [[] for _ in range(tt.n_stops)]
+        for p, seq in enumerate(pattern_stops):
+            seen = set()
+            for pos, s in enumerate(seq):
+                if s in seen:
+                    continue
+                seen.add(s)
+                by_stop[s].append((p, pos))
+        tt.stop_pattern_start, tt.stop_patterns = _csr(
+            [[p for p, _ in g] for g in by_stop], tt.n_stops
+        )
+        _, tt.stop_pattern_pos = _csr([[pos for _, pos in g] for g in by_stop], tt.n_stops)
+
+        transfers = tt._build_stations([r[5] for r in stop_rows])
+        tt._build_footpaths(transfers)
+        tt.transfer_start, tt.transfer_to = _csr(
+            [[t[0] for t in g] for g in transfers], tt.n_stops
+        )
+        _, tt.transfer_secs = _csr([[t[1] for t in g] for g in transfers], tt.n_stops)
+        _, tt.transfer_dist = _csr([[t[2] for t in g] for g in transfers], tt.n_stops)
+
+        return tt
+
+    def _build_calendar(self, service_index):
+        n = len(self.service_ids)
+        covered = np.zeros(n, dtype=bool)
+        weekdays = np.zeros(n, dtype=np.uint8)
+        self.service_start = [None] * n
+        self.service_end = [None] * n
+        days = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+        for row in Calendar.objects.values("service_id", "start_date", "end_date", *days):
+            i = service_index.get(row["service_id"])
+            if i is None:
+                continue
+            covered[i] = True
+            weekdays[i] = sum(1 << d for d, name in enumerate(days) if row[name])
+            self.service_start[i] = row["start_date"]
+            self.service_end[i] = row["end_date"]
+
+        for service_id, day, exception_type in CalendarDate.objects.values_list(
+            "service_id", "date", "exception_type"
+        ):
+            i = service_index.get(service_id)
+            if i is None:
+                continue
+            covered[i] = True
+            self.service_exceptions.setdefault(day, {})[i] = exception_type
+
+        self.service_has_calendar = covered
+        self.service_weekdays = weekdays
+
+    def _build_shapes(self, trip_shape_ids):
+        shapes = load_shapes()
+        shape_index = {}
+        lats, lons = [], []
+        starts = [0]
+        trip_shape = []
+        for shape_id in trip_shape_ids:
+            if shape_id not in shapes:
+                trip_shape.append(-1)
+                continue
+            if shape_id not in shape_index:
+                shape_index[shape_id] = len(self.shape_ids)
+                self.shape_ids.append(shape_id)
+                lats.append(shapes[shape_id][0])
+                lons.append(shapes[shape_id][1])
+                starts.append(starts[-1] + len(shapes[shape_id][0]))
+            trip_shape.append(shape_index[shape_id])
+
+        self.trip_shape = np.array(trip_shape, dtype=np.int32)
+        self.shape_start = np.array(starts, dtype=np.int32)
+        if lats:
+            self.shape_lat = np.concatenate(lats)
+            self.shape_lon = np.concatenate(lons)
+            step = haversine_np(
+                self.shape_lat[:-1], self.shape_lon[:-1], self.shape_lat[1:], self.shape_lon[1:]
+            )
+            step[self.shape_start[1:-1] - 1] = 0.0
+            self.shape_dist = np.concatenate(([0.0], np.cumsum(step)))
+        self._build_shape_offsets()
+
+    def _build_shape_offsets(self):
+        # each stop projected onto its stored shape segment, as a distance
+        n = len(self.arr)
+        self.time_shape_dist = np.full(n, np.nan)
+        if not n or not len(self.shape_dist):
+            return
+
+        counts = self.trip_stop_counts()
+        time_trip = np.repeat(np.arange(len(self.trip_ids)), counts)
+        offset = np.arange(n) - np.repeat(self.trip_time_start, counts)
+        stops = self.pattern_stops[self.pattern_stop_start[self.trip_pattern[time_trip]] + offset]
+
+        shape = self.trip_shape[time_trip]
+        shape_len = self.shape_start[shape + 1] - self.shape_start[shape]
+        ok = (shape >= 0) & (self.shape_pos >= 0) & (self.shape_pos < shape_len - 1)
+        i = self.shape_start[shape[ok]] + self.shape_pos[ok]
+        j = i + 1
+
+        # same equirectangular plane as shapes.project_stops
+        slat, slon = self.stop_lat[stops[ok]], self.stop_lon[stops[ok]]
+        scale = np.cos(np.radians(slat))
+        ax, ay = self.shape_lon[i] * scale, self.shape_lat[i]
+        dx, dy = self.shape_lon[j] * scale - ax, self.shape_lat[j] - ay
+        length2 = dx * dx + dy * dy
+        t = ((slon * scale - ax) * dx + (slat - ay) * dy) / np.where(length2 > 0, length2, 1.0)
+        t = np.clip(t, 0.0, 1.0)
+        self.time_shape_dist[ok] = self.shape_dist[i] + t * (self.shape_dist[j] - self.shape_dist[i])
+
+    def _build_stations(self, interchange):
+        # union Stops rows sharing a station_code, or an interchange station name
+        parent = list(range(self.n_stops))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        first_by_key = {}
+        for i in range(self.n_stops):
+            keys = []
+            if self.stop_code[i]:
+                keys.append(("code", self.stop_code[i].upper()))
+            if interchange[i]:
+                keys.append(("name", self.stop_name[i].strip().lower()))
+            for key in keys:
+                j = first_by_key.setdefault(key, i)
+                parent[find(i)] = find(j)
+
+        station_of_root = {}
+        members = []
+        stop_station = []
+        for i in range(self.n_stops):
+            root = find(i)
+            if root not in station_of_root:
+                station_of_root[root] = len(members)
+                members.append([])
+            members[station_of_root[root]].append(i)
+            stop_station.append(station_of_root[root])
+
+        self.stop_station = np.array(stop_station, dtype=np.int32)
+        self.station_start, self.station_stops = _csr(members, len(members))
+
+        transfers = [[] for _ in range(self.n_stops)]
+        for group in members:
+            for a in group:
+                for b in group:
+                    if a == b:
+                        continue
+                    dist = haversine(
+                        self.stop_lat[a], self.stop_lon[a],
+                        self.stop_lat[b], self.stop_lon[b],
+                    )
+                    transfers[a].append((b, INTERCHANGE_SECONDS, int(round(dist))))
+        return transfers
+
+    def _build_footpaths(self, transfers):
+        # bus stop <-> bus stop / metro Stops within walking distance, found
+        # through a grid index instead of comparing every pair
+        if self.n_stops == self.n_metro_stops:
+            return
+        grid = GridIndex(self.stop_lat, self.stop_lon, MAX_WALK_METERS)
+        pairs = {}
+        for a in range(self.n_metro_stops, self.n_stops):
+            near = [
+                (b, dist)
+                for b, dist in grid.near(self.stop_lat[a], self.stop_lon[a], MAX_WALK_METERS)
+                if b != a and self.stop_station[a] != self.stop_station[b]
+            ]
+            for b, dist in near[:MAX_FOOTPATHS_PER_STOP]:
+                pairs[(min(a, b), max(a, b))] = dist
+
+        for (a, b), dist in pairs.items():
+            secs = int(np.ceil(dist / WALK_SPEED_MPS))
+            transfers[a].append((b, secs, int(round(dist))))
+            transfers[b].append((a, secs, int(round(dist))))
+
+    # -----------------------------
+    # Accessors
+    # -----------------------------
+
+    def pattern_stop_list(self, p):
+        return self.pattern_stops[self.pattern_stop_start[p]:self.pattern_stop_start[p + 1]]
+
+    def pattern_trip_list(self, p):
+        return self.pattern_trips[self.pattern_trip_start[p]:self.pattern_trip_start[p + 1]]
+
+    def patterns_at(self, stop):
+        a, b = self.stop_pattern_start[stop], self.stop_pattern_start[stop + 1]
+        return zip(self.stop_patterns[a:b].tolist(), self.stop_pattern_pos[a:b].tolist())
+
+    def station_members(self, stop):
+        st = self.stop_station[stop]
+        return self.station_stops[self.station_start[st]:self.station_start[st + 1]].tolist()
+
+    def transfers_from(self, stop):
+        a, b = self.transfer_start[stop], self.transfer_start[stop + 1]
+        return zip(
+            self.transfer_to[a:b].tolist(),
+            self.transfer_secs[a:b].tolist(),
+            self.transfer_dist[a:b].tolist(),
+        )
+
+    def departures(self, p, pos):
+        # departure column of every trip of pattern p at position pos
+        n = self.pattern_stop_start[p + 1] - self.pattern_stop_start[p]
+        return self.dep[self.pattern_time_start[p] + pos:self.pattern_time_start[p + 1]:n]
+
+    def _build_active_buckets(self):
+        if not len(self.trip_ids):
+            return
+        first = self.trip_first_dep // ACTIVE_BUCKET_SECONDS
+        last = self.trip_last_arr // ACTIVE_BUCKET_SECONDS
+        spans = (last - first + 1).astype(np.int64)
+
+        # one (bucket, trip) entry per bucket a trip spans, grouped by bucket
+        trips = np.repeat(np.arange(len(self.trip_ids), dtype=np.int32), spans)
+        offsets = np.arange(len(trips)) - np.repeat(np.cumsum(spans) - spans, spans)
+        buckets = np.repeat(first, spans) + offsets
+        order = np.argsort(buckets, kind="stable")
+
+        counts = np.bincount(buckets, minlength=int(last.max()) + 1)
+        self.active_bucket_start = np.zeros(len(counts) + 1, dtype=np.int32)
+        np.cumsum(counts, out=self.active_bucket_start[1:])
+        self.active_bucket_trips = trips[order]
+
+    def trips_between(self, start, end):
+        """
+        Trips whose [first departure, last arrival] may overlap [start, end]
+        seconds, from the time buckets: a superset, in trip order.
+        """
+        a = max(start // ACTIVE_BUCKET_SECONDS, 0)
+        b = min(end // ACTIVE_BUCKET_SECONDS, len(self.active_bucket_start) - 2)
+        if a > b:
+            return np.zeros(0, dtype=np.int32)
+        trips = self.active_bucket_trips[self.active_bucket_start[a]:self.active_bucket_start[b + 1]]
+        return np.unique(trips) if b > a else trips
+
+    def trip_stop_counts(self, trips=None):
+        # number of stops of each trip (all trips when ``trips`` is None)
+        patterns = self.trip_pattern if trips is None else self.trip_pattern[trips]
+        return self.pattern_stop_start[patterns + 1] - self.pattern_stop_start[patterns]
+
+    def trip_times(self, trip):
+        # (arrivals, departures) of one trip, indexed by position in its pattern
+        p = self.trip_pattern[trip]
+        n = self.pattern_stop_start[p + 1] - self.pattern_stop_start[p]
+        a = self.trip_time_start[trip]
+        return self.arr[a:a + n], self.dep[a:a + n]
+
+    def trip_path(self, trip, board_pos, alight_pos):
+        """
+        ``[lat, lon]`` points along the trip's shape from ``board_pos`` to
+        ``alight_pos``, or None when the stops were never projected.
+        """
+        sh = self.trip_shape[trip]
+        if sh < 0:
+            return None
+        base = self.trip_time_start[trip]
+        a = self.shape_pos[base + board_pos]
+        b = self.shape_pos[base + alight_pos]
+        if a < 0 or b < a:
+            return None
+
+        seq = self.pattern_stop_list(self.trip_pattern[trip])
+        on, off = seq[board_pos], seq[alight_pos]
+        start = self.shape_start[sh]
+        first = [float(self.stop_lat[on]), float(self.stop_lon[on])]
+        last = [float(self.stop_lat[off]), float(self.stop_lon[off])]
+        inner = np.column_stack((
+            self.shape_lat[start + a + 1:start + b + 1],
+            self.shape_lon[start + a + 1:start + b + 1],
+        )).tolist()
+        # stops usually sit on a shape vertex; don't repeat it
+        if inner and inner[0] == first:
+            inner = inner[1:]
+        if inner and inner[-1] == last:
+            inner = inner[:-1]
+        return [first] + inner + [last]
+
+    def route_path(self, route_id, from_stop, to_stop):
+        # shape of a trip of ``route_id`` riding from one stop (or its station) to another
+        if route_id not in self.route_ids:
+            return None
+        r = self.route_ids.index(route_id)
+        origins = set(self.station_members(from_stop))
+        targets = set(self.station_members(to_stop))
+        for p in np.flatnonzero(self.pattern_route == r).tolist():
+            seq = self.pattern_stop_list(p).tolist()
+            on = next((i for i, s in enumerate(seq) if s in origins), None)
+            if on is None:
+                continue
+            off = next((i for i in range(on + 1, len(seq)) if seq[i] in targets), None)
+            if off is None:
+                continue
+            path = self.trip_path(self.pattern_trip_list(p)[0], on, off)
+            if path is not None:
+                return path
+        return None
+
+    # -----------------------------
+    # Service days
+    # -----------------------------
+
+    def services_on(self, day):
+        # bool mask over services running on ``day``; a service without
+        # calendar or calendar_dates rows runs every day
+        n = len(self.service_ids)
+        bit = 1 << day.weekday()
+        running = ((self.service_weekdays & bit) != 0) | ~self.service_has_calendar
+        for i in range(n):
+            if running[i] and self.service_start[i] and not (self.service_start[i] <= day <= self.service_end[i]):
+                running[i] = False
+        for i, exception_type in self.service_exceptions.get(day, {}).items():
+            running[i] = exception_type == 1
+        return running
+
+    def service_day(self, day):
+        """
+        ``(trip_mask, pattern_mask)`` of trips / patterns running on ``day``,
+        or ``(None, None)`` when no service has a calendar (everything runs).
+        """
+        if day is None or not self.service_has_calendar.any():
+            return None, None
+
+        masks = self._service_days.get(day)
+        if masks is None:
+            trip_mask = self.services_on(day)[self.trip_service]
+            counts = np.add.reduceat(
+                trip_mask[self.pattern_trips].astype(np.int32),
+                self.pattern_trip_start[:-1],
+            ) if len(self.pattern_trips) else np.zeros(0, dtype=np.int32)
+            masks = (trip_mask, counts > 0)
+            if len(self._service_days) >= SERVICE_DAY_CACHE:
+                self._service_days.pop(next(iter(self._service_days)))
+            self._service_days[day] = masks
+        return masks
+
+    def active_service_ids(self, day):
+        if not self.service_has_calendar.any():
+            return None
+        running = self.services_on(day)
+        return [sid for sid, on in zip(self.service_ids, running) if on]
+
+    def nbytes(self):
+        return sum(
+            v.nbytes for v in vars(self).values() if isinstance(v, np.ndarray)
+        )
+
+    # -----------------------------
+    # Snapshots
+    # -----------------------------
+
+    def save(self, path):
+        """Write the timetable to a new directory: one .npy per array plus meta.json."""
+        os.makedirs(path)
+        for name, value in vars(self).items():
+            if isinstance(value, np.ndarray):
+                np.save(os.path.join(path, f"{name}.npy"), value, allow_pickle=False)
+
+        meta = {name: getattr(self, name) for name in _META_FIELDS}
+        meta["version"] = self.version
+        meta["service_start"] = [d.isoformat() if d else None for d in self.service_start]
+        meta["service_end"] = [d.isoformat() if d else None for d in self.service_end]
+        meta["service_exceptions"] = {
+            day.isoformat(): {str(i): t for i, t in exceptions.items()}
+            for day, exceptions in self.service_exceptions.items()
+        }
+        with open(os.path.join(path, SNAPSHOT_META), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Open a snapshot written by ``save``. Arrays are memory-mapped
+        read-only, so every process loading the same snapshot shares one
+        copy in the page cache and startup costs no parsing.
+        """
+        with open(os.path.join(path, SNAPSHOT_META), encoding="utf-8") as f:
+            meta = json.load(f)
+
+        tt = cls(meta["version"])
+        for name in _META_FIELDS:
+            setattr(tt, name, meta[name])
+        tt.stop_index = {pk: i for i, pk in enumerate(tt.stop_ids)}
+
+        def parse_date(value):
+            return date.fromisoformat(value) if value else None
+
+        tt.service_start = [parse_date(d) for d in meta["service_start"]]
+        tt.service_end = [parse_date(d) for d in meta["service_end"]]
+        tt.service_exceptions = {
+            date.fromisoformat(day): {int(i): t for i, t in exceptions.items()}
+            for day, exceptions in meta["service_exceptions"].items()
+        }
+
+        for name, value in list(vars(tt).items()):
+            if isinstance(value, np.ndarray):
+                setattr(tt, name, _load_array(os.path.join(path, f"{name}.npy")))
+        return tt
+
+
+def _load_array(path):
+    try:
+        return np.load(path, mmap_mode="r", allow_pickle=False)
+    except ValueError:
+        # numpy can't map a zero-length file region
+        return np.load(path, allow_pickle=False)
+
+
+# -----------------------------
+# Process-wide instance
+# -----------------------------
+
+_timetable = None
+_timetable_source = None          # published version _timetable was opened for
+_timetable_lock = threading.Lock()
+_pointer_checked = (0.0, None)    # (monotonic time, snapshot version)
+
+
+def _snapshot_root():
+    return getattr(settings, "TIMETABLE_SNAPSHOT_DIR", "") or None
+
+
+def _read_pointer(root):
+    try:
+        with open(os.path.join(root, SNAPSHOT_POINTER), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def current_snapshot():
+    """Version of the live on-disk snapshot, or None."""
+    global _pointer_checked
+
+    root = _snapshot_root()
+    if root is None:
+        return None
+    now = time.monotonic()
+    checked_at, version = _pointer_checked
+    if now - checked_at < SNAPSHOT_CHECK_SECONDS:
+        return version
+    version = _read_pointer(root)
+    _pointer_checked = (now, version)
+    return version
+
+
+def write_snapshot(tt):
+    """
+    Publish ``tt`` as the live snapshot. The directory and the pointer are
+    both swapped in with ``os.replace``, so readers never see a partial one.
+    """
+    global _pointer_checked
+
+    root = _snapshot_root()
+    os.makedirs(root, exist_ok=True)
+    tmp = os.path.join(root, f".{tt.version}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tt.save(tmp)
+    os.replace(tmp, os.path.join(root, tt.version))
+
+    pointer_tmp = os.path.join(root, f".{SNAPSHOT_POINTER}.{os.getpid()}")
+    with open(pointer_tmp, "w", encoding="utf-8") as f:
+        f.write(tt.version)
+    os.replace(pointer_tmp, os.path.join(root, SNAPSHOT_POINTER))
+    _pointer_checked = (time.monotonic(), tt.version)
+
+    # older snapshots may still be mapped by workers that haven't swapped yet
+    old = sorted(
+        (e for e in os.scandir(root) if e.is_dir() and not e.name.startswith(".") and e.name != tt.version),
+        key=lambda e: e.stat().st_mtime,
+    )
+    for entry in old[:max(len(old) - (SNAPSHOTS_KEPT - 1), 0)]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def _load_snapshot(root, version):
+    if version is None:
+        return None
+    try:
+        return Timetable.load(os.path.join(root, version))
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _acquire_build_lock(root):
+    """
+    Take the snapshot build lock, or return the snapshot another process
+    published while we waited for it. Returns ``(locked, snapshot)``.
+    """
+    lock = os.path.join(root, SNAPSHOT_BUILD_LOCK)
+    os.makedirs(root, exist_ok=True)
+    while True:
+        try:
+            os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True, None
+        except FileExistsError:
+            pass
+
+        tt = _load_snapshot(root, _read_pointer(root))
+        if tt is not None:
+            return False, tt
+        try:
+            if time.time() - os.path.getmtime(lock) > SNAPSHOT_BUILD_SECONDS:
+                os.remove(lock)
+                continue
+        except OSError:
+            continue
+        time.sleep(SNAPSHOT_POLL_SECONDS)
+
+
+def _open_timetable(version):
+    """``(timetable, published version it stands for)``."""
+    root = _snapshot_root()
+    if root is None:
+        return Timetable.build(version), version
+    tt = _load_snapshot(root, version)
+    if tt is not None:
+        return tt, version
+
+    # no usable snapshot yet: one process builds and writes it while the
+    # others wait for it, and a directory we can't write to leaves this
+    # process with its own in-memory timetable
+    try:
+        locked, tt = _acquire_build_lock(root)
+    except OSError:
+        logger.warning("timetable snapshot dir %s is not writable; building in memory", root)
+        return Timetable.build(uuid.uuid4().hex), version
+    if not locked:
+        return tt, tt.version
+
+    try:
+        tt = _load_snapshot(root, _read_pointer(root))
+        if tt is not None:
+            return tt, tt.version
+        tt = Timetable.build(uuid.uuid4().hex)
+        try:
+            write_snapshot(tt)
+        except OSError:
+            logger.warning("could not write timetable snapshot to %s; keeping it in memory", root, exc_info=True)
+            return tt, version
+        return tt, tt.version
+    finally:
+        try:
+            os.remove(os.path.join(root, SNAPSHOT_BUILD_LOCK))
+        except OSError:
+            pass
+
+
+def get_timetable():
+    """
+    Return the process-wide timetable, (re)loading it on first use and
+    whenever a new version is published: through the snapshot pointer when
+    ``TIMETABLE_SNAPSHOT_DIR`` is set, else through the cache (which must
+    be shared between processes, see ``CACHES``).
+    """
+    global _timetable, _timetable_source
+
+    if _snapshot_root() is None:
+        version = cache.get(TIMETABLE_VERSION_KEY)
+    else:
+        version = current_snapshot()
+    tt = _timetable
+    if tt is not None and _timetable_source == version:
+        return tt
+
+    with _timetable_lock:
+        tt = _timetable
+        if tt is None or _timetable_source != version:
+            tt, _timetable_source = _open_timetable(version)
+            _timetable = tt
+    return tt
+
+
+def invalidate_timetable():
+    """
+    Publish a new timetable version; every process reloads on next use.
+    With snapshots enabled the new timetable is built and written here, so
+    the workers only have to map it.
+    """
+    global _timetable, _timetable_source
+    version = uuid.uuid4().hex
+    cache.set(TIMETABLE_VERSION_KEY, version, timeout=None)
+    with _timetable_lock:
+        _timetable = None
+        if _snapshot_root() is not None:
+            tt = Timetable.build(version)
+            try:
+                write_snapshot(tt)
+            except OSError:
+                logger.warning("could not write timetable snapshot; other processes keep the old one", exc_info=True)
+                _timetable_source = current_snapshot()
+            else:
+                _timetable_source = version
+            _timetable = tt
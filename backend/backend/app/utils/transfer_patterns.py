@@ -0,0 +1,219 @@
+import threading
+import time
+
+import numpy as np
+from django.db.models import Count, Max
+
+from ..models import Route, TransferPattern
+from .raptor import INF, TRIP, WALK, RaptorSearch, origin_departures
+
+
+# The stored patterns are checked for a new computation at most this often.
+PATTERNS_CHECK_SECONDS = 1.0
+
+# Profile searches cover the whole service day, past-midnight trips included.
+DAY_END_SECONDS = 48 * 3600
+
+
+# -----------------------------
+# Precomputation
+# -----------------------------
+
+def station_transfer_patterns(tt, station, max_trips):
+    """
+    Transfer patterns of every optimal journey leaving ``station`` at any
+    time of day: destination station -> set of ``((board, alight), ...)``
+    stop-index pairs, one pair per ride.
+
+    Runs one rRAPTOR profile search (latest departure first) over the
+    metro patterns and records the journey behind every label a departure
+    improves. Bus stops are left to the regular search.
+    """
+    origins = tt.station_stops[tt.station_start[station]:tt.station_start[station + 1]].tolist()
+    origin_set = set(origins)
+    metro = tt.route_type[tt.pattern_route] != Route.BUS
+    search = RaptorSearch(tt, max_trips, active_patterns=metro)
+    found = {}
+
+    for dep in reversed(origin_departures(tt, origins, 0, DAY_END_SECONDS)):
+        before = np.array(search.labels)
+        search.run({s: dep for s in origins})
+        after = np.array(search.labels)
+
+        improved = (after[1:] < before[1:]) & (after[1:] < after[:-1])
+        for k, s in zip(*np.nonzero(improved)):
+            s = int(s)
+            if s in origin_set or s >= tt.n_metro_stops:
+                continue
+            rides = []
+            for leg in search.journey(s, int(k) + 1):
+                if leg[0] == TRIP:
+                    _, trip, board_pos, alight_pos = leg
+                    seq = tt.pattern_stop_list(tt.trip_pattern[trip])
+                    rides.append((int(seq[board_pos]), int(seq[alight_pos])))
+            if rides:
+                found.setdefault(int(tt.stop_station[s]), set()).add(tuple(rides))
+
+    return found
+
+
+# -----------------------------
+# Query evaluation
+# -----------------------------
+
+class TransferPatternIndex:
+    """
+    Persisted transfer patterns mapped onto the current timetable.
+
+    A query only evaluates the stored patterns of its station pair: each
+    ride is looked up in a direct-connection table (the patterns serving
+    both stops, in order) and boards the earliest catchable trip by binary
+    search, so no graph search happens at request time.
+    """
+
+    def __init__(self, version=None):
+        self.version = version
+        self.patterns = {}       # (origin station, destination station) -> [rides]
+        self._direct = {}        # (board stop, alight stop) -> [(pattern, i, j)]
+
+    @classmethod
+    def load(cls, tt, version=None):
+        index = cls(version)
+        for origin_pk, patterns in TransferPattern.objects.values_list("origin_id", "patterns"):
+            origin = tt.stop_index.get(origin_pk)
+            if origin is None:
+                continue
+            o = int(tt.stop_station[origin])
+            for dest_pk, rides_list in patterns.items():
+                dest = tt.stop_index.get(int(dest_pk))
+                if dest is None:
+                    continue
+                converted = []
+                for rides in rides_list:
+                    stops = [(tt.stop_index.get(b), tt.stop_index.get(a)) for b, a in rides]
+                    if all(b is not None and a is not None for b, a in stops):
+                        converted.append(stops)
+                index.patterns[(o, int(tt.stop_station[dest]))] = converted
+        return index
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def direct(self, tt, board, alight):
+        key = (board, alight)
+        conns = self._direct.get(key)
+        if conns is None:
+            conns = []
+            for p, i in tt.patterns_at(board):
+                seq = tt.pattern_stop_list(p).tolist()
+                if alight in seq[i + 1:]:
+                    conns.append((p, i, seq.index(alight, i + 1)))
+            self._direct[key] = conns
+        return conns
+
+    def _ride(self, tt, board, alight, t, active):
+        # (arrival, trip, board_pos, alight_pos) of the earliest arrival
+        best = None
+        for p, i, j in self.direct(tt, board, alight):
+            col = tt.departures(p, i)
+            trips = tt.pattern_trip_list(p)
+            k = int(np.searchsorted(col, t, side="left"))
+            if active is not None:
+                while k < len(trips) and not active[trips[k]]:
+                    k += 1
+            if k >= len(trips):
+                continue
+            n_p = tt.pattern_stop_start[p + 1] - tt.pattern_stop_start[p]
+            arr = int(tt.arr[tt.pattern_time_start[p] + k * n_p + j])
+            if best is None or arr < best[0]:
+                best = (arr, int(trips[k]), i, j)
+        return best
+
+    def evaluate(self, tt, rides, depart, active=None):
+        """``(arrival, legs)`` of one pattern departing at ``depart``, or None."""
+        t = depart
+        legs = []
+        prev = None
+        for board, alight in rides:
+            if prev is not None and prev != board:
+                walk = next(((secs, dist) for to, secs, dist in tt.transfers_from(prev) if to == board), None)
+                if walk is None:
+                    return None
+                legs.append((WALK, prev, board, t, t + walk[0], walk[1]))
+                t += walk[0]
+            ride = self._ride(tt, board, alight, t, active)
+            if ride is None:
+                return None
+            t, trip, i, j = ride
+            legs.append((TRIP, trip, i, j))
+            prev = alight
+        return t, legs
+
+    def query(self, tt, origin, target, depart, active=None):
+        """
+        Legs of the earliest journey between the stations of two stop
+        indices, ``[]`` when none runs, or None when the pair has no
+        stored patterns.
+        """
+        rides_list = self.patterns.get((int(tt.stop_station[origin]), int(tt.stop_station[target])))
+        if rides_list is None:
+            return None
+
+        best = (INF, 0, [])
+        for rides in rides_list:
+            found = self.evaluate(tt, rides, depart, active)
+            if found is not None and (found[0], len(rides)) < best[:2]:
+                best = (found[0], len(rides), found[1])
+        return best[2]
+
+
+# -----------------------------
+# Process-wide instance
+# -----------------------------
+
+_index = None
+_index_lock = threading.Lock()
+_stored_checked = (0.0, None)    # (monotonic time, stored patterns version)
+
+
+def stored_patterns_version():
+    """
+    ``(rows, highest id)`` of the stored patterns. compute_transfer_patterns
+    replaces every row, and new rows get new ids, so this changes with each
+    run and every process sees it.
+    """
+    global _stored_checked
+
+    now = time.monotonic()
+    checked_at, version = _stored_checked
+    if now - checked_at < PATTERNS_CHECK_SECONDS:
+        return version
+    stats = TransferPattern.objects.aggregate(rows=Count("id"), last=Max("id"))
+    version = (stats["rows"], stats["last"])
+    _stored_checked = (now, version)
+    return version
+
+
+def get_transfer_patterns(tt):
+    global _index
+
+    # patterns are stored by Stops id but indexed by timetable station
+    version = (stored_patterns_version(), tt.version)
+    index = _index
+    if index is not None and index.version == version:
+        return index
+
+    with _index_lock:
+        index = _index
+        if index is None or index.version != version:
+            index = TransferPatternIndex.load(tt, version)
+            _index = index
+    return index
+
+
+def invalidate_transfer_patterns():
+    # other processes notice the new rows (see stored_patterns_version)
+    global _index, _stored_checked
+    with _index_lock:
+        _index = None
+        _stored_checked = (0.0, None)
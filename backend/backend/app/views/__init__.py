@@ -4,4 +4,4 @@ from .trip_planner_views import *
 from .live_metro_flow_views import *
 from .dashboard_views import *
 from .nearest_stop_views import *
-
+from .isochrone_views import *
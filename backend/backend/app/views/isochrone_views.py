@@ -0,0 +1,131 @@
+from math import cos, radians
+
+from django.core.cache import cache
+from rest_framework.response import Response
+from rest_framework.decorators import api_view
+
+from ..utils.geo import METERS_PER_DEGREE, WALK_SPEED_MPS
+from ..utils.raptor import INF, one_to_all
+from ..utils.timetable import get_timetable
+from .trip_planner_views import PlanTripView, parse_ref_time
+
+try:
+    from shapely import affinity
+    from shapely.geometry import Point, mapping
+    from shapely.ops import unary_union
+    SHAPELY_AVAILABLE = True
+except ImportError:
+    SHAPELY_AVAILABLE = False
+
+
+TIME_BUCKET_SECONDS = 300
+MAX_WALK_RADIUS_M = 1000
+DEFAULT_BANDS = "10,20,30,45"
+MAX_BAND_MINUTES = 180
+CACHE_TIMEOUT = 3600
+
+
+def _one_to_all_cached(tt, origin, service_day, ref_seconds):
+    # one search per (timetable version, origin station, day, 5-minute bucket)
+    station = int(tt.stop_station[origin])
+    bucket = ref_seconds // TIME_BUCKET_SECONDS
+    cache_key = f"one_to_all_{tt.version}_{station}_{service_day}_{bucket}"
+
+    arrivals = cache.get(cache_key)
+    if arrivals is None:
+        depart = bucket * TIME_BUCKET_SECONDS
+        active, active_patterns = tt.service_day(service_day)
+        labels = one_to_all(
+            tt,
+            {s: depart for s in tt.station_members(origin)},
+            PlanTripView.MAX_TRANSFERS + 1,
+            active=active,
+            active_patterns=active_patterns,
+        )
+        arrivals = [a if a < INF else -1 for a in labels]
+        cache.set(cache_key, arrivals, timeout=CACHE_TIMEOUT)
+
+    return bucket * TIME_BUCKET_SECONDS, arrivals
+
+
+def _circle(lat, lon, radius_m):
+    # metre-radius circle in lon/lat degrees
+    circle = Point(lon, lat).buffer(1, 16)
+    return affinity.scale(
+        circle,
+        xfact=radius_m / (METERS_PER_DEGREE * cos(radians(lat))),
+        yfact=radius_m / METERS_PER_DEGREE,
+    )
+
+
+def _isochrone_bands(tt, depart, arrivals, bands):
+    features = []
+    for minutes in bands:
+        limit = depart + minutes * 60
+        circles = []
+        for s, a in enumerate(arrivals):
+            if a < 0 or a > limit:
+                continue
+            radius = min((limit - a) * WALK_SPEED_MPS, MAX_WALK_RADIUS_M)
+            if radius > 0:
+                circles.append(_circle(float(tt.stop_lat[s]), float(tt.stop_lon[s]), radius))
+
+        geometry = mapping(unary_union(circles)) if circles else None
+        features.append({
+            "type": "Feature",
+            "properties": {"minutes": minutes},
+            "geometry": geometry,
+        })
+
+    return {"type": "FeatureCollection", "features": features}
+
+
+@api_view(["GET"])
+def isochrone(request):
+    name = request.GET.get("from", "").strip()
+    if not name:
+        return Response({"error": "from is required"}, status=400)
+
+    try:
+        service_day, ref_seconds = parse_ref_time(request.GET.get("time"))
+        bands = sorted({
+            int(b) for b in request.GET.get("bands", DEFAULT_BANDS).split(",") if b.strip()
+        })
+    except ValueError:
+        return Response({"error": "Invalid time or bands"}, status=400)
+    if any(b < 1 or b > MAX_BAND_MINUTES for b in bands):
+        return Response({"error": f"bands must be between 1 and {MAX_BAND_MINUTES} minutes"}, status=400)
+
+    from_stop = PlanTripView()._find_stop(name)
+    if not from_stop:
+        return Response({"error": "Stop not found"}, status=404)
+
+    tt = get_timetable()
+    origin = tt.stop_index.get(from_stop.id)
+    if origin is None:
+        return Response({"error": "Stop has no timetable"}, status=404)
+
+    depart, arrivals = _one_to_all_cached(tt, origin, service_day, ref_seconds)
+
+    data = {
+        "origin": from_stop.stop_name,
+        "departure_seconds": depart,
+        "stop_ids": tt.stop_ids,
+        "arrival_seconds": arrivals,
+    }
+
+    if request.GET.get("polygons", "1") != "0" and bands:
+        if not SHAPELY_AVAILABLE:
+            return Response({"error": "shapely is required for isochrone polygons"}, status=501)
+
+        cache_key = (
+            f"isochrone_{tt.version}_{int(tt.stop_station[origin])}_{service_day}_{depart}_"
+            + "-".join(map(str, bands))
+        )
+        polygons = cache.get(cache_key)
+        if polygons is None:
+            polygons = _isochrone_bands(tt, depart, arrivals, bands)
+            cache.set(cache_key, polygons, timeout=CACHE_TIMEOUT)
+        data["isochrones"] = polygons
+
+    return Response(data)
@@ -1,25 +1,30 @@
 from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
 from django.utils import timezone
-from datetime import datetime, time, timedelta
-from rest_framework import generics, filters
+from datetime import date
+import asyncio
+import base64
+import json
+import numpy as np
+from rest_framework import generics
 from rest_framework.response import Response
 from rest_framework.decorators import api_view
 from rest_framework.pagination import PageNumberPagination
-from ..models import  Stops, BusStop, Route, Shape, Trip, StopTime
+from ..models import  BUS_ID_PREFIX, Stops, BusStop, Route, Shape, Trip, StopTime
 from ..serializers import (
     StopSerializer, BusStopSerializer, RouteSerializer,
     ShapeSerializer, StopTimeSerializer
 )
+from ..utils.live_broadcast import ticker
+from ..utils.live_cache import cached_per_second, live_cache_stats
+from ..utils.live_positions import live_positions, position_rows, replay_positions
+from ..utils.stop_index import search_stops_queryset
+from ..utils.timetable import format_gtfs_time, get_timetable, parse_gtfs_time
 
 
 
 
-def time_to_seconds(t):
-    if not t or ':' not in t:
-        return 0
-    h, m, s = map(int, t.split(":"))
-    return h * 3600 + m * 60 + s
-
 class StandardResultsSetPagination(PageNumberPagination):
     page_size = 100
     page_size_query_param = 'page_size'
@@ -28,63 +33,144 @@ class StandardResultsSetPagination(PageNumberPagination):
 
 @api_view(["GET"])
 def live_metro_positions(request):
-    now = timezone.localtime().time()
-    now_sec = now.hour * 3600 + now.minute * 60 + now.second
-
-    today = timezone.localdate()
-    start_time = datetime.combine(today, time(0, 0)) - timedelta(hours=4)
-    end_time = datetime.combine(today, time(23, 59, 59)) + timedelta(hours=2)
-
-    trips = Trip.objects.select_related('route', 'shape_id').prefetch_related(
-        'stoptime_set__stops'
-    ).filter(
-        stoptime__departure_time__isnull=False
-    ).distinct()
+    tt = get_timetable()
+    rows, status = cached_per_second(
+        "live_metro", tt.version, lambda moment: position_rows(tt, live_positions(tt, moment))
+    )
+    response = Response(rows)
+    response["X-Cache"] = status.upper()
+    return response
 
-    running_trains = []
 
-    for trip in trips:
-        stop_times = [st for st in trip.stoptime_set.all() if st.departure_time]
-        if len(stop_times) < 2:
-            continue
+@api_view(["GET"])
+def live_metro_cache_stats(request):
+    return Response(live_cache_stats())
 
-        stop_times.sort(key=lambda x: x.stop_sequence)
 
-        times_sec = [time_to_seconds(st.departure_time) for st in stop_times]
+# Frames per replay request; longer windows need a larger step_seconds.
+MAX_REPLAY_FRAMES = 2000
 
-        found = False
-        for i in range(len(stop_times) - 1):
-            t1_sec = times_sec[i]
-            t2_sec = time_to_seconds(stop_times[i + 1].arrival_time or stop_times[i + 1].departure_time)
 
-            if t1_sec <= now_sec <= t2_sec + 300:  # +5 min buffer for delays
-                progress = (now_sec - t1_sec) / (t2_sec - t1_sec) if (t2_sec > t1_sec) else 0.0
+def _b64(values, dtype):
+    # little-endian column, ready for a JS typed array
+    return base64.b64encode(np.ascontiguousarray(values, dtype=dtype).tobytes()).decode("ascii")
 
-                s1 = stop_times[i]
-                s2 = stop_times[i + 1]
 
-                lat = s1.stops.stop_lat + (s2.stops.stop_lat - s1.stops.stop_lat) * progress
-                lon = s1.stops.stop_lon + (s2.stops.stop_lon - s1.stops.stop_lon) * progress
+@api_view(["GET"])
+def live_metro_replay(request):
+    """
+    Scheduled train positions for animations: one frame every
+    ``step_seconds`` from ``start`` to ``end`` ("HH:MM[:SS]", past 24:00
+    allowed) of ``date`` (default today), all computed in one batch.
+
+    Columns are base64 little-endian arrays: frame ``f`` holds entries
+    ``frame_start[f]:frame_start[f + 1]`` of ``trip`` (int32 index into
+    ``trip_ids``), ``lat`` / ``lon`` (float32) and ``bearing`` (uint16).
+    """
+    def seconds(value):
+        value = (value or "").strip()
+        return parse_gtfs_time(value + ":00" if value.count(":") == 1 else value)
+
+    try:
+        service_day = date.fromisoformat(request.GET["date"]) if request.GET.get("date") else timezone.localdate()
+        step = int(request.GET.get("step_seconds", 60))
+    except ValueError:
+        return Response({"error": "date must be YYYY-MM-DD and step_seconds an integer"}, status=400)
+    start, end = seconds(request.GET.get("start")), seconds(request.GET.get("end"))
+    if start < 0 or end < start or step < 1:
+        return Response({"error": "start and end (HH:MM[:SS], start <= end) and step_seconds >= 1 required"}, status=400)
+    n_frames = (end - start) // step + 1
+    if n_frames > MAX_REPLAY_FRAMES:
+        return Response({"error": f"at most {MAX_REPLAY_FRAMES} frames; raise step_seconds"}, status=400)
+
+    tt = get_timetable()
+    cache_key = f"metro_replay_{tt.version}_{service_day}_{start}_{end}_{step}"
+    data = cache.get(cache_key)
+    if data is not None:
+        return Response(data)
+
+    frame_start, trains = replay_positions(tt, service_day, start, end, step)
+    trips, trip_index = np.unique(trains["trip"], return_inverse=True)
 
-                running_trains.append({
-                    "trip_id": trip.trip_id,
-                    "route_id": trip.route.route_id,
-                    "progress": round(progress * 100, 2),
-                    "current_lat": round(lat, 6),
-                    "current_lon": round(lon, 6),
-                    "from_stop": s1.stops.stop_name,
-                    "to_stop": s2.stops.stop_name,
-                    "next_stop": s2.stops.stop_name,
-                    "start_time": s1.departure_time,
-                    "end_time": s2.arrival_time or s2.departure_time,
-                })
-                found = True
-                break
+    data = {
+        "date": service_day.isoformat(),
+        "start": format_gtfs_time(start),
+        "end": format_gtfs_time(end),
+        "step_seconds": step,
+        "frames": n_frames,
+        "trip_ids": [tt.trip_ids[t] for t in trips.tolist()],
+        "route_ids": [tt.route_ids[tt.trip_route[t]] for t in trips.tolist()],
+        "frame_start": _b64(frame_start, "<i4"),
+        "trip": _b64(trip_index, "<i4"),
+        "lat": _b64(trains["lat"], "<f4"),
+        "lon": _b64(trains["lon"], "<f4"),
+        "bearing": _b64(np.rint(trains["bearing"]) % 360, "<u2"),
+    }
+    cache.set(cache_key, data, timeout=3600)
+    return Response(data)
 
-        if len(running_trains) > 200:
-            break
 
-    return Response(running_trains)
+# Comment line sent on idle streams so proxies keep the connection open.
+STREAM_HEARTBEAT_SECONDS = 15
+
+
+async def live_metro_stream(request):
+    """
+    Server-Sent Events twin of the WebSocket feed for clients that can't
+    use one. ``?bbox=south,west,north,east`` and ``?route=A,B`` are applied
+    server side; each event is a ``vehicles.frame`` delta against what
+    this client was last sent (the first is a keyframe). Needs ASGI.
+    """
+    if not isinstance(request, ASGIRequest):
+        # under WSGI Django would drain the endless stream into memory
+        return JsonResponse({"error": "live stream needs an ASGI server"}, status=501)
+
+    bbox = None
+    if request.GET.get("bbox"):
+        try:
+            bbox = tuple(float(v) for v in request.GET["bbox"].split(","))
+        except ValueError:
+            bbox = ()
+        if len(bbox) != 4 or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+            return JsonResponse({"error": "bbox must be south,west,north,east"}, status=400)
+    routes = {r.strip() for r in request.GET.get("route", "").split(",") if r.strip()}
+
+    response = StreamingHttpResponse(_vehicle_events(bbox, routes), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+async def _vehicle_events(bbox, routes):
+    sent = {}                                    # vehicle id -> encoded state
+    tick = 0
+    ticker.open_stream()
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                fleet = await asyncio.wait_for(ticker.next_fleet(tick), STREAM_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+
+            visible = {vid: fleet.encoded[vid] for vid in fleet.select(bbox, routes)}
+            updated = [text for vid, text in visible.items() if sent.get(vid) != text]
+            removed = [vid for vid in sent if vid not in visible]
+            keyframe = not tick
+            tick = fleet.tick
+            sent = visible
+            if not (updated or removed or keyframe):
+                continue
+
+            # vehicles were serialized once for every stream; only join them here
+            yield (
+                f'data: {{"type":"vehicles.frame","tick":{tick},'
+                f'"keyframe":{json.dumps(keyframe)},'
+                f'"updated":[{",".join(updated)}],"removed":{json.dumps(removed)}}}\n\n'
+            )
+    finally:
+        ticker.close_stream()
 
 
 @api_view(["GET"])
@@ -97,9 +183,9 @@ def metro_routes(request):
 
     routes = Route.objects.prefetch_related(
         'trip_set__stoptime_set__stops' 
-    ).all()
+    ).filter(route_type=Route.METRO)
 
-    all_shapes = Shape.objects.all()
+    all_shapes = Shape.objects.exclude(shape_id__startswith=BUS_ID_PREFIX)
     shapes_dict = {}
     for pt in all_shapes:
         sid = pt.shape_id
@@ -172,8 +258,13 @@ class MetroStopList(generics.ListAPIView):
     queryset = Stops.objects.all().order_by('stop_id')
     serializer_class = StopSerializer
     pagination_class = StandardResultsSetPagination
-    filter_backends = [filters.SearchFilter]
-    search_fields = ["stop_name"]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        search = self.request.query_params.get("search", "").strip()
+        if search:
+            queryset = search_stops_queryset(queryset, search)
+        return queryset
 
 
 
@@ -192,6 +283,11 @@ class RouteList(generics.ListAPIView):
 
 @api_view(["GET"])
 def get_route_shape(request, route_id):
+    from_stop = request.GET.get("from")
+    to_stop = request.GET.get("to")
+    if from_stop and to_stop:
+        return _route_shape_between(route_id, from_stop, to_stop)
+
     cache_key = f"route_shape_{route_id}"
     cached = cache.get(cache_key)
     if cached:
@@ -213,6 +309,28 @@ def get_route_shape(request, route_id):
     return Response(data)
 
 
+def _route_shape_between(route_id, from_stop, to_stop):
+    # slice between two Stops ids, straight from the in-memory timetable
+    tt = get_timetable()
+    try:
+        a = tt.stop_index.get(int(from_stop))
+        b = tt.stop_index.get(int(to_stop))
+    except ValueError:
+        return Response({"error": "from and to must be stop ids"}, status=400)
+
+    path = tt.route_path(route_id, a, b) if a is not None and b is not None else None
+    if path is None:
+        return Response({"route_id": route_id, "shape_path": []})
+
+    return Response({
+        "route_id": route_id,
+        "shape_path": [
+            {"shape_pt_lat": lat, "shape_pt_lon": lon, "shape_pt_sequence": i}
+            for i, (lat, lon) in enumerate(path)
+        ],
+    })
+
+
 @api_view(["GET"])
 def get_route_stops(request, route_id):
     cache_key = f"route_stops_{route_id}"
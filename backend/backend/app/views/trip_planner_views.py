@@ -1,18 +1,31 @@
 from rest_framework.views import APIView
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
-from rest_framework import generics, filters
+from rest_framework import generics
+from rest_framework.decorators import api_view
 from rest_framework.pagination import PageNumberPagination
 
+import django
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
 from django.utils import timezone
 from datetime import datetime
 
-from typing import Optional, List
+import json
+import multiprocessing
+import os
+import threading
+from typing import Optional
 
-from ..models import Stops, StopTime, Trip
+from ..models import Route, Stops
 from ..serializers import StopSerializer
+from ..utils.timetable import get_timetable
+from ..utils.stop_index import StopMatch, get_stop_index, search_stops_queryset
+from ..utils.journey_cache import departure_bucket, get_journeys, journey_cache_key, set_journeys
+from ..utils.raptor import RaptorSearch, raptor, reverse_raptor, range_search, mc_raptor, TRIP
+from ..utils.transfer_patterns import get_transfer_patterns
 
-OSMNX_AVAILABLE = False
 
 # Metro line color mapping
 METRO_COLORS = {
@@ -58,9 +71,24 @@ def seconds_to_time(sec):
     return f"{h:02}:{m:02}:{s:02}"
 
 
-def smooth_trip_segments(segments):
-    # Skipping expensive OSMNX route smoothing to keep API response fast.
-    return segments
+def parse_ref_time(depart_at):
+    # (service day, seconds after midnight) of an ISO datetime /
+    # "HH:MM[:SS]" today, or of now
+    if not depart_at:
+        ref_time = timezone.localtime(timezone.now())
+    elif "T" in str(depart_at):
+        ref_time = datetime.fromisoformat(str(depart_at).replace("Z", "+00:00"))
+        if timezone.is_aware(ref_time):
+            ref_time = timezone.localtime(ref_time)
+    else:
+        parts = [int(p) for p in str(depart_at).split(":")]
+        if len(parts) not in (2, 3):
+            raise ValueError(depart_at)
+        seconds = parts[0] * 3600 + parts[1] * 60 + (parts[2] if len(parts) == 3 else 0)
+        return timezone.localdate(), seconds
+
+    return ref_time.date(), ref_time.hour * 3600 + ref_time.minute * 60 + ref_time.second
+
 
 class StandardResultsSetPagination(PageNumberPagination):
     page_size = 100
@@ -76,8 +104,34 @@ class MetroStops(generics.ListAPIView):
     queryset = Stops.objects.all().order_by("stop_id")
     serializer_class = StopSerializer
     pagination_class = StandardResultsSetPagination
-    filter_backends = [filters.SearchFilter]
-    search_fields = ["stop_name"]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        search = self.request.query_params.get("search", "").strip()
+        if search:
+            queryset = search_stops_queryset(queryset, search)
+        return queryset
+
+
+@api_view(["GET"])
+def stop_autocomplete(request):
+    query = request.GET.get("q", "").strip()
+    try:
+        limit = min(max(int(request.GET.get("limit", 10)), 1), 50)
+    except ValueError:
+        return Response({"error": "limit must be an integer"}, status=400)
+
+    return Response([
+        {
+            "id": m.id,
+            "stop_name": m.stop_name,
+            "line": m.line,
+            "lat": m.stop_lat,
+            "lon": m.stop_lon,
+            "score": m.score,
+        }
+        for m in get_stop_index().search(query, limit=limit)
+    ])
 
 
 # -----------------------------
@@ -89,6 +143,10 @@ class PlanTripView(APIView):
     permission_classes = [AllowAny]
 
     MAX_TRANSFERS = 3
+    MAX_WINDOW_MINUTES = 240
+    MAX_ALTERNATIVES = 5
+    # departures searched for alternatives when no window_minutes is given
+    ALTERNATIVES_WINDOW_MINUTES = 60
 
     def post(self, request):
 
@@ -110,164 +168,477 @@ class PlanTripView(APIView):
             return Response({"error": "Stop not found"}, status=404)
 
         # Determine reference time
-        if when == "leave_now":
-            ref_time = timezone.localtime(timezone.now())
-        else:
-            ref_time = datetime.fromisoformat(depart_at.replace("Z", "+00:00"))
-
-        ref_seconds = time_to_seconds(ref_time.strftime("%H:%M:%S"))
-
-        segments = self.raptor_search(from_stop, to_stop, ref_seconds)
-
-        if not segments:
-            return Response({"trips": []})
-
-        start_sec = time_to_seconds(segments[0]["start_time"])
-        end_sec = time_to_seconds(segments[-1]["end_time"])
-
-        segments = smooth_trip_segments(segments)
+        try:
+            service_day, ref_seconds = parse_ref_time(None if when == "leave_now" else depart_at)
+        except ValueError:
+            return Response({"error": "Invalid depart_at"}, status=400)
+
+        try:
+            window_minutes = int(data.get("window_minutes") or 0)
+        except (TypeError, ValueError):
+            return Response({"error": "window_minutes must be an integer"}, status=400)
+
+        try:
+            alternatives = int(data.get("alternatives") or 1)
+        except (TypeError, ValueError):
+            return Response({"error": "alternatives must be an integer"}, status=400)
+
+        options = {
+            "multi": int(bool(data.get("multi_criteria"))),
+            "window": min(max(window_minutes, 0), self.MAX_WINDOW_MINUTES),
+            "patterns": int(bool(data.get("transfer_patterns"))),
+            "arrive_by": int(when == "arrive_by"),
+            "alternatives": min(max(alternatives, 1), self.MAX_ALTERNATIVES),
+        }
 
-        trip = {
+        journeys = self.cached_plan(from_stop, to_stop, service_day, ref_seconds, options)
+        if options["alternatives"] > 1:
+            journeys = self.pick_alternatives(journeys, options["alternatives"])
+
+        return Response({"trips": [self._build_trip(segments) for segments in journeys]})
+
+    def cached_plan(self, from_stop, to_stop, service_day, ref_seconds, options):
+        """
+        Journeys (lists of segments) for a request, served from the journey
+        cache when a search for the same departure bucket is still valid.
+        """
+        tt = get_timetable()
+
+        def cached(departure, extra_window=0):
+            key = journey_cache_key(tt.version, from_stop.id, to_stop.id, service_day, departure, options)
+            journeys = get_journeys(key)
+            if journeys is None:
+                journeys = self.plan(from_stop, to_stop, service_day, departure, options, extra_window)
+                set_journeys(key, journeys)
+            return journeys
+
+        if options["arrive_by"] or options["multi"]:
+            # not bucketed: an earlier deadline could miss the best trip, and
+            # a Pareto set searched from the bucket start can lack options
+            # dominated only by journeys leaving before ref_seconds
+            return cached(ref_seconds)
+
+        bucket = departure_bucket(ref_seconds)
+        journeys = cached(bucket, extra_window=ref_seconds - bucket)
+
+        # the bucket search may include departures just before ref_seconds
+        window_end = ref_seconds + options["window"] * 60
+        valid = [
+            segments for segments in journeys
+            if ref_seconds <= segments[0]["start_seconds"]
+            and (not options["window"] or segments[0]["start_seconds"] <= window_end)
+        ]
+        # all of them left already: search again from just after the last
+        # one, cached as well, so later requests of the bucket reuse it
+        while not valid and journeys and not options["window"]:
+            journeys = cached(max(segments[0]["start_seconds"] for segments in journeys) + 1)
+            valid = [segments for segments in journeys if ref_seconds <= segments[0]["start_seconds"]]
+        return valid
+
+    def plan(self, from_stop, to_stop, service_day, ref_seconds, options, extra_window=0):
+
+        if options["arrive_by"]:
+            segments = self.arrive_by_search(from_stop, to_stop, ref_seconds, service_day)
+            return [segments] if segments else []
+
+        if options["multi"]:
+            return self.multi_criteria_search(from_stop, to_stop, ref_seconds, service_day)
+
+        if options["window"] or options["alternatives"] > 1:
+            # one profile search yields every useful later departure too
+            window_minutes = options["window"] or self.ALTERNATIVES_WINDOW_MINUTES
+            window_seconds = window_minutes * 60 + extra_window
+            return self.range_search(from_stop, to_stop, ref_seconds, window_seconds, service_day)
+
+        segments = None
+        if options["patterns"]:
+            segments = self.transfer_pattern_search(from_stop, to_stop, ref_seconds, service_day)
+        if segments is None:
+            segments = self.raptor_search(from_stop, to_stop, ref_seconds, service_day)
+        return [segments] if segments else []
+
+    def pick_alternatives(self, journeys, k):
+        """
+        Up to ``k`` distinct journeys, earliest arrival first when choosing:
+        one per combination of lines and boarding/alighting stops before any
+        later departure of a combination already picked. Returned in
+        departure order.
+        """
+        def rides(segments):
+            return tuple(
+                (seg["route_name"], seg["on_stop"], seg["off_stop"])
+                for seg in segments if seg["mode"] != "walk"
+            )
+
+        ranked = sorted(journeys, key=lambda j: (j[-1]["end_seconds"], len(rides(j)), -j[0]["start_seconds"]))
+
+        picked, seen, later = [], set(), []
+        for segments in ranked:
+            signature = rides(segments)
+            if signature in seen:
+                later.append(segments)
+                continue
+            seen.add(signature)
+            picked.append(segments)
+
+        # identical journeys (same rides, same departure) are dropped
+        departures = {(rides(j), j[0]["start_seconds"]) for j in picked}
+        for segments in later:
+            key = (rides(segments), segments[0]["start_seconds"])
+            if key not in departures:
+                departures.add(key)
+                picked.append(segments)
+
+        picked = picked[:k]
+        picked.sort(key=lambda j: (j[0]["start_seconds"], j[-1]["end_seconds"]))
+        return picked
+
+    def _build_trip(self, segments):
+
+        start_sec = segments[0]["start_seconds"]
+        end_sec = segments[-1]["end_seconds"]
+
+        return {
             "trip_id": f"planned-{int(datetime.now().timestamp())}",
             "duration": round((end_sec - start_sec) / 60),
             "start_time": segments[0]["start_time"],
             "end_time": segments[-1]["end_time"],
+            # walk-only journeys have no ride at all
+            "transfers": max(0, sum(1 for seg in segments if seg["mode"] != "walk") - 1),
+            "walk_meters": sum(seg["distance_meters"] for seg in segments if seg["mode"] == "walk"),
             "segments": segments,
         }
 
-        return Response({"trips": [trip]})
-
     # -----------------------------
     # Stop Search
     # -----------------------------
 
-    def _find_stop(self, name: str) -> Optional[Stops]:
+    def _find_stop(self, name: str) -> Optional[StopMatch]:
 
-        return (
-            Stops.objects.filter(stop_name__iexact=name).first()
-            or Stops.objects.filter(stop_name__icontains=name).first()
-        )
+        return get_stop_index().resolve(name)
 
     
 
-    def raptor_search(self, from_stop, to_stop, ref_seconds):
+    def raptor_search(self, from_stop, to_stop, ref_seconds, service_day=None):
 
-        all_stop_ids = list(Stops.objects.values_list("id", flat=True))
-        earliest = {s: float("inf") for s in all_stop_ids}
-        earliest[from_stop.id] = ref_seconds
+        tt = get_timetable()
 
-        parent = {}
+        origin = tt.stop_index.get(from_stop.id)
+        target = tt.stop_index.get(to_stop.id)
+        if origin is None or target is None:
+            return []
 
-        stop_time_rows = StopTime.objects.values(
-            "trip_id",
-            "stops_id",
-            "stop_sequence",
-            "arrival_time",
-            "departure_time",
-        ).order_by("trip_id", "stop_sequence")
+        # every platform of the origin / destination station is a valid end
+        sources = {s: ref_seconds for s in tt.station_members(origin)}
+        targets = tt.station_members(target)
 
-        stop_to_stop_times = {}
-        trip_to_stop_times = {}
+        active, active_patterns = tt.service_day(service_day)
+        result = raptor(
+            tt, sources, self.MAX_TRANSFERS + 1, targets=targets,
+            active=active, active_patterns=active_patterns,
+        )
 
-        for row in stop_time_rows:
-            row["departure_sec"] = time_to_seconds(row["departure_time"])
-            row["arrival_sec"] = time_to_seconds(row["arrival_time"])
-            stop_to_stop_times.setdefault(row["stops_id"], []).append(row)
-            trip_to_stop_times.setdefault(row["trip_id"], []).append(row)
+        found = result.arrival(targets)
+        if found is None:
+            return []
 
-        trip_map = {
-            trip.trip_id: trip
-            for trip in Trip.objects.select_related("route").filter(trip_id__in=trip_to_stop_times)
-        }
-        stops = Stops.objects.in_bulk(all_stop_ids)
+        _, k, stop = found
+        return self.legs_to_segments(tt, result.journey(stop, k))
+
+    def arrive_by_search(self, from_stop, to_stop, deadline, service_day=None):
+        # latest departure reaching the destination by ``deadline``
+
+        tt = get_timetable()
+
+        origin = tt.stop_index.get(from_stop.id)
+        target = tt.stop_index.get(to_stop.id)
+        if origin is None or target is None:
+            return []
+
+        origins = tt.station_members(origin)
+        active, active_patterns = tt.service_day(service_day)
+        result = reverse_raptor(
+            tt, {s: deadline for s in tt.station_members(target)}, self.MAX_TRANSFERS + 1,
+            targets=origins, active=active, active_patterns=active_patterns,
+        )
 
-        current_stops = {from_stop.id}
+        found = result.departure(origins)
+        if found is None:
+            return []
 
-        for round_no in range(self.MAX_TRANSFERS + 1):
-            next_stops = set()
-            updated = False
+        _, k, stop = found
+        return self.legs_to_segments(tt, result.journey(stop, k))
 
-            for stop_id in current_stops:
-                if stop_id not in stop_to_stop_times:
-                    continue
+    def transfer_pattern_search(self, from_stop, to_stop, ref_seconds, service_day=None):
+        # None when compute_transfer_patterns has not covered this pair
 
-                for st in stop_to_stop_times[stop_id]:
-                    if st["departure_sec"] < earliest.get(stop_id, float("inf")):
-                        continue
+        tt = get_timetable()
 
-                    for next_st in trip_to_stop_times.get(st["trip_id"], []):
-                        if next_st["stop_sequence"] <= st["stop_sequence"]:
-                            continue
+        origin = tt.stop_index.get(from_stop.id)
+        target = tt.stop_index.get(to_stop.id)
+        if origin is None or target is None:
+            return []
 
-                        if next_st["arrival_sec"] < earliest.get(next_st["stops_id"], float("inf")):
-                            earliest[next_st["stops_id"]] = next_st["arrival_sec"]
-                            parent[next_st["stops_id"]] = {
-                                "prev_stop": stop_id,
-                                "trip_id": st["trip_id"],
-                                "dep": st["departure_time"],
-                                "arr": next_st["arrival_time"],
-                                "prev_seq": st["stop_sequence"],
-                                "next_seq": next_st["stop_sequence"],
-                            }
-                            next_stops.add(next_st["stops_id"])
-                            updated = True
+        active, _ = tt.service_day(service_day)
+        legs = get_transfer_patterns(tt).query(tt, origin, target, ref_seconds, active)
+        if legs is None:
+            return None
+        return self.legs_to_segments(tt, legs)
 
-            if not updated:
-                break
+    def range_search(self, from_stop, to_stop, ref_seconds, window_seconds, service_day=None):
 
-            current_stops = next_stops
+        tt = get_timetable()
 
-        if to_stop.id not in parent:
+        origin = tt.stop_index.get(from_stop.id)
+        target = tt.stop_index.get(to_stop.id)
+        if origin is None or target is None:
             return []
 
+        active, active_patterns = tt.service_day(service_day)
+        journeys = range_search(
+            tt,
+            tt.station_members(origin),
+            tt.station_members(target),
+            ref_seconds,
+            ref_seconds + window_seconds,
+            self.MAX_TRANSFERS + 1,
+            active=active,
+            active_patterns=active_patterns,
+        )
+        return [self.legs_to_segments(tt, legs) for _, _, _, legs in journeys]
+
+    def multi_criteria_search(self, from_stop, to_stop, ref_seconds, service_day=None):
+
+        tt = get_timetable()
+
+        origin = tt.stop_index.get(from_stop.id)
+        target = tt.stop_index.get(to_stop.id)
+        if origin is None or target is None:
+            return []
+
+        active, active_patterns = tt.service_day(service_day)
+        journeys = mc_raptor(
+            tt,
+            {s: ref_seconds for s in tt.station_members(origin)},
+            self.MAX_TRANSFERS + 1,
+            tt.station_members(target),
+            active=active,
+            active_patterns=active_patterns,
+        )
+        return [self.legs_to_segments(tt, legs) for _, _, _, legs in journeys if legs]
+
+    def legs_to_segments(self, tt, legs):
+
         segments = []
-        cur = to_stop.id
-
-        while cur != from_stop.id:
-            info = parent[cur]
-
-            prev_stop = stops.get(info["prev_stop"])
-            cur_stop = stops.get(cur)
-            trip = trip_map.get(info["trip_id"])
-
-            if not prev_stop or not cur_stop or not trip:
-                break
-
-            route = trip.route
-
-            
-            color_key = route.route_long_name.split("_", 1)[0] if "_" in route.route_long_name else "GRAY"
-            route_color = METRO_COLORS.get(color_key.upper(), "#777777")
-
-            segment_shape = []
-            for st in trip_to_stop_times.get(info["trip_id"], []):
-                if info["prev_seq"] <= st["stop_sequence"] <= info["next_seq"]:
-                    stop_obj = stops.get(st["stops_id"])
-                    if stop_obj and stop_obj.stop_lat is not None and stop_obj.stop_lon is not None:
-                        segment_shape.append([float(stop_obj.stop_lat), float(stop_obj.stop_lon)])
-
-            if not segment_shape and prev_stop.stop_lat is not None and prev_stop.stop_lon is not None and cur_stop.stop_lat is not None and cur_stop.stop_lon is not None:
-                segment_shape = [
-                    [float(prev_stop.stop_lat), float(prev_stop.stop_lon)],
-                    [float(cur_stop.stop_lat), float(cur_stop.stop_lon)]
-                ]
-
-            segments.append({
-                "mode": "metro",
-                "route_color": route_color,
-                "route_name": route.route_long_name.split("_", 1)[-1] if "_" in route.route_long_name else route.route_long_name,
-                "on_stop": prev_stop.stop_name,
-                "off_stop": cur_stop.stop_name,
-                "start_time": info["dep"],
-                "end_time": info["arr"],
-                "shape": segment_shape,
-                "from_lat": prev_stop.stop_lat,
-                "from_lon": prev_stop.stop_lon,
-                "to_lat": cur_stop.stop_lat,
-                "to_lon": cur_stop.stop_lon,
-            })
-
-            cur = info["prev_stop"]
-
-        segments.reverse()
-        return segments
\ No newline at end of file
+        for leg in legs:
+            if leg[0] == TRIP:
+                _, trip, board_pos, alight_pos = leg
+                segments.append(self._trip_segment(tt, trip, board_pos, alight_pos))
+            else:
+                _, from_s, to_s, start, end, dist = leg
+                segments.append(self._walk_segment(tt, from_s, to_s, start, end, dist))
+        return segments
+
+    def _walk_segment(self, tt, from_s, to_s, start, end, dist):
+
+        return {
+            "mode": "walk",
+            "on_stop": tt.stop_name[from_s],
+            "off_stop": tt.stop_name[to_s],
+            "start_time": seconds_to_time(start),
+            "end_time": seconds_to_time(end),
+            "start_seconds": start,
+            "end_seconds": end,
+            "distance_meters": dist,
+            "shape": [
+                [float(tt.stop_lat[from_s]), float(tt.stop_lon[from_s])],
+                [float(tt.stop_lat[to_s]), float(tt.stop_lon[to_s])],
+            ],
+            "from_lat": float(tt.stop_lat[from_s]),
+            "from_lon": float(tt.stop_lon[from_s]),
+            "to_lat": float(tt.stop_lat[to_s]),
+            "to_lon": float(tt.stop_lon[to_s]),
+        }
+
+    def _trip_segment(self, tt, trip, board_pos, alight_pos):
+
+        p = tt.trip_pattern[trip]
+        seq = tt.pattern_stop_list(p)[board_pos:alight_pos + 1].tolist()
+        arrs, deps = tt.trip_times(trip)
+
+        on_stop, off_stop = seq[0], seq[-1]
+        route = tt.trip_route[trip]
+        long_name = tt.route_names[route]
+
+        color_key = long_name.split("_", 1)[0] if "_" in long_name else "GRAY"
+        route_color = METRO_COLORS.get(color_key.upper(), "#777777")
+
+        # track geometry from the import-time stop projections
+        segment_shape = tt.trip_path(trip, board_pos, alight_pos) or [
+            [float(tt.stop_lat[s]), float(tt.stop_lon[s])] for s in seq
+        ]
+
+        return {
+            "mode": "bus" if tt.route_type[route] == Route.BUS else "metro",
+            "route_color": route_color,
+            "route_name": long_name.split("_", 1)[-1] if "_" in long_name else long_name,
+            "on_stop": tt.stop_name[on_stop],
+            "off_stop": tt.stop_name[off_stop],
+            "start_time": seconds_to_time(deps[board_pos]),
+            "end_time": seconds_to_time(arrs[alight_pos]),
+            "start_seconds": int(deps[board_pos]),
+            "end_seconds": int(arrs[alight_pos]),
+            "shape": segment_shape,
+            "from_lat": float(tt.stop_lat[on_stop]),
+            "from_lon": float(tt.stop_lon[on_stop]),
+            "to_lat": float(tt.stop_lat[off_stop]),
+            "to_lon": float(tt.stop_lon[off_stop]),
+        }
+
+
+# -----------------------------
+# Batch Trip Planner API
+# -----------------------------
+
+# Worker processes shared by every batch request, started once on first use.
+# Forking a threaded server is unsafe, so they come from a forkserver (or
+# spawn) and load the timetable themselves through ``get_timetable``.
+BATCH_WORKERS = os.cpu_count() or 1
+
+_batch_pool = None
+_batch_pool_lock = threading.Lock()
+
+
+def _get_batch_pool():
+    global _batch_pool
+    with _batch_pool_lock:
+        if _batch_pool is None:
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _batch_pool = multiprocessing.get_context(method).Pool(BATCH_WORKERS, initializer=django.setup)
+    return _batch_pool
+
+
+def _plan_batch_group(group, tt=None):
+    """
+    Answer every query sharing one origin station and departure from a
+    single one-to-all search. Stops come as ``Stops`` ids and are resolved
+    against ``tt`` (in a worker, its own current timetable), so a request
+    never mixes indexes of two timetable versions.
+    """
+    origin_id, service_day, ref_seconds, queries = group
+    if tt is None:
+        tt = get_timetable()
+    planner = PlanTripView()
+
+    origin = tt.stop_index.get(origin_id)
+    if origin is None:
+        return [{"index": index, "error": "Stop not found"} for index, _ in queries]
+
+    active, active_patterns = tt.service_day(service_day)
+    search = RaptorSearch(
+        tt, PlanTripView.MAX_TRANSFERS + 1, active=active, active_patterns=active_patterns
+    )
+    search.run({s: ref_seconds for s in tt.station_members(origin)})
+
+    results = []
+    for index, target_id in queries:
+        target = tt.stop_index.get(target_id)
+        if target is None:
+            results.append({"index": index, "error": "Stop not found"})
+            continue
+        found = search.arrival(tt.station_members(target))
+        if found is None:
+            results.append({"index": index, "trips": []})
+            continue
+        _, k, stop = found
+        segments = planner.legs_to_segments(tt, search.journey(stop, k))
+        results.append({
+            "index": index,
+            "trips": [planner._build_trip(segments)] if segments else [],
+        })
+    return results
+
+
+class BatchPlanTripView(APIView):
+    """
+    POST {"queries": [{"from_location", "to_location", "depart_at"}, ...]}
+
+    Queries are grouped by (origin station, service day, departure time) so each group
+    costs one one-to-all search; large batches fan out over the shared
+    worker pool and results stream back as NDJSON lines ``{"index", "trips"}`` in
+    completion order.
+    """
+
+    permission_classes = [AllowAny]
+
+    MAX_QUERIES = 10000
+    POOL_MIN_GROUPS = 8
+
+    def post(self, request):
+
+        queries = request.data.get("queries")
+        if not isinstance(queries, list) or not queries:
+            return Response({"error": "queries must be a non-empty list"}, status=400)
+        if len(queries) > self.MAX_QUERIES:
+            return Response({"error": f"at most {self.MAX_QUERIES} queries per batch"}, status=400)
+
+        tt = get_timetable()
+        planner = PlanTripView()
+        resolved = {}
+
+        def resolve(name):
+            if name not in resolved:
+                stop = planner._find_stop(name) if name else None
+                resolved[name] = tt.stop_index.get(stop.id) if stop else None
+            return resolved[name]
+
+        groups = {}
+        errors = []
+        for index, q in enumerate(queries):
+            if not isinstance(q, dict):
+                errors.append({"index": index, "error": "query must be an object"})
+                continue
+
+            origin = resolve(str(q.get("from_location", "")).strip())
+            target = resolve(str(q.get("to_location", "")).strip())
+            if origin is None or target is None:
+                errors.append({"index": index, "error": "Stop not found"})
+                continue
+
+            try:
+                service_day, ref_seconds = parse_ref_time(q.get("depart_at"))
+            except ValueError:
+                errors.append({"index": index, "error": "invalid depart_at"})
+                continue
+
+            key = (int(tt.stop_station[origin]), service_day, ref_seconds)
+            groups.setdefault(key, (tt.stop_ids[origin], service_day, ref_seconds, []))[3].append(
+                (index, tt.stop_ids[target])
+            )
+
+        rows = self._stream(tt, errors, list(groups.values()))
+        if isinstance(request._request, ASGIRequest):
+            # a sync iterator would be buffered whole under ASGI
+            rows = self._astream(rows)
+        return StreamingHttpResponse(rows, content_type="application/x-ndjson")
+
+    def _stream(self, tt, errors, groups):
+
+        for row in errors:
+            yield json.dumps(row) + "\n"
+
+        if BATCH_WORKERS < 2 or len(groups) < self.POOL_MIN_GROUPS:
+            for group in groups:
+                for row in _plan_batch_group(group, tt):
+                    yield json.dumps(row) + "\n"
+            return
+
+        for rows in _get_batch_pool().imap_unordered(_plan_batch_group, groups, chunksize=1):
+            for row in rows:
+                yield json.dumps(row) + "\n"
+
+    @staticmethod
+    async def _astream(rows):
+        next_row = sync_to_async(next, thread_sensitive=False)
+        while (row := await next_row(rows, None)) is not None:
+            yield row
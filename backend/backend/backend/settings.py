@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 from pathlib import Path
 from datetime import timedelta
 import os
+import tempfile
 from dotenv import load_dotenv
 load_dotenv()
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -46,6 +47,7 @@ INSTALLED_APPS = [
     "rest_framework",
     "django_filters",
     "corsheaders",
+    "channels",
 ]
 
 MIDDLEWARE = [
@@ -139,6 +141,50 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Files written at runtime (cache entries, timetable snapshots) live outside
+# the code tree, which may be read-only in deployment.
+DATA_DIR = Path(os.getenv("DATA_DIR", Path(tempfile.gettempdir()) / "dynamic-transit-flow"))
+
+# The cache must be shared by every worker process: import commands publish
+# new timetable versions through it. Redis when REDIS_URL is set, else files
+# under DATA_DIR (enough for workers on a single host).
+REDIS_URL = os.getenv("REDIS_URL", "")
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": str(DATA_DIR / "cache"),
+            "OPTIONS": {"MAX_ENTRIES": 5000},
+        }
+    }
+
+# WebSockets (/ws/vehicles/) are served by Channels through backend.asgi.
+# Each process runs its own live-position ticker; the in-memory layer only
+# reaches sockets of the same process, so messages published elsewhere
+# (vehicle.update) need the Redis layer, used when REDIS_URL is set.
+if REDIS_URL:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {"hosts": [REDIS_URL]},
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {"BACKEND": "channels.layers.InMemoryChannelLayer"},
+    }
+
+# Versioned timetable snapshots memory-mapped by every worker process
+# (written by import_gtfs); set empty to build the timetable per process.
+TIMETABLE_SNAPSHOT_DIR = os.getenv("TIMETABLE_SNAPSHOT_DIR", str(DATA_DIR / "timetable_snapshots"))
+
 
 
 
@@ -30,7 +30,15 @@ export default function useVehicles() {
         ws.onmessage = (event) => {
             try {
                 const data = JSON.parse(event.data);
-                if (data.type === "vehicle.update") {
+                if (data.type === "vehicles.frame") {
+                    // delta frame: moved / new vehicles plus ids that left
+                    setVehicles((old) => {
+                        const next = data.keyframe ? {} : { ...old };
+                        for (const v of data.updated) next[v.vehicle_id] = v;
+                        for (const id of data.removed) delete next[id];
+                        return next;
+                    });
+                } else if (data.type === "vehicle.update") {
                     const v = data.payload;
                     setVehicles((old) => ({ ...old, [v.vehicle_id]: v }));
                 }